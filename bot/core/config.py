@@ -3,11 +3,75 @@ import os
 class Config:
     # Основные настройки бота
     TOKEN = "7562511884:AAGdhqnv3Gn3cgxD4IxsNGrROS1j1DKFNY0"
+    BOT_API_SERVER = os.getenv('BOT_API_SERVER')  # свой сервер Bot API (или тестовый стенд); None - api.telegram.org
+    BOT_MODE = 'polling'  # polling или webhook
+    
+    # Режим вебхука
+    WEBHOOK_URL = "https://example.com/webhook"  # внешний адрес, который получает Telegram
+    WEBHOOK_SECRET = ""  # секрет в заголовке X-Telegram-Bot-Api-Secret-Token ("" - не проверять)
+    WEBHOOK_HOST = '0.0.0.0'
+    WEBHOOK_PORT = 8080
+    WEBHOOK_WORKERS = 0  # процессов-обработчиков апдейтов (0 - по числу ядер)
+    WEBHOOK_WORKER_PORT = 8100  # порты процессов: 8100, 8101, ... на 127.0.0.1
+    WEBHOOK_RETRY_SECONDS = 0.5  # пауза перед повторной передачей апдейта процессу
+    WEBHOOK_MAX_RETRIES = 40  # повторов передачи апдейта (около 6 минут), затем апдейт отбрасывается
     
     # Настройки документов
     DOCS_FOLDER = 'docs'
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024  # размер куска при скачивании файла
+    DOWNLOAD_TIMEOUT = 120  # общий таймаут скачивания (секунд)
+    BLOBS_FOLDER = os.path.join(DOCS_FOLDER, 'blobs')  # содержимое файлов по SHA-256
     ALLOWED_EXTENSIONS = ['.txt', '.pdf', '.docx', '.xlsx']
+    ENCODING_SAMPLE_SIZE = 64 * 1024  # образец для определения кодировки TXT
+    TXT_MMAP_MIN_SIZE = 5 * 1024 * 1024  # TXT больше этого читаются через mmap, минуя кэш текста
+    TXT_WINDOW_SIZE = 1024 * 1024  # окно декодирования при поиске регулярных выражений в mmap
+    
+    # Кэш извлеченного текста
+    CACHE_FOLDER = 'cache'
+    TEXT_CACHE_MAX_CHARS = 50_000_000  # лимит текста в памяти (символов); процессы пула поиска делят его между собой
+    
+    # Поисковый индекс
+    INDEX_FOLDER = os.path.join(CACHE_FOLDER, 'index')
+    SEARCH_BACKEND = 'index'  # index - свой индекс, fts5 - SQLite FTS5 в bot.db
+    FTS_CHUNK_SIZE = 2000  # размер фрагмента документа в FTS5 (символов)
+    TRIGRAM_BLOCK_SIZE = 4096  # блок текста в триграммном индексе (символов)
+    TRIGRAM_BLOCK_OVERLAP = 256  # перекрытие блоков = макс. длина запроса для поиска по блокам
+    FUZZY_MAX_DISTANCE = 2  # допустимое число опечаток в слове
+    FUZZY_PREFIX_LENGTH = 7  # длина префикса в словаре удалений (меньше - экономнее память)
+    SEARCH_TOP_DOCS = 5  # сколько самых релевантных документов показывать
+    BM25_K1 = 1.2  # насыщение частоты слова в BM25
+    BM25_B = 0.75  # влияние длины документа в BM25
+    SEARCH_WORKERS = 0  # процессов для разбора и поиска (0 - по числу ядер)
+    REGEX_TIMEOUT = 10  # предел поиска по регулярному выражению (секунд), затем процессы пула перезапускаются
+    INGEST_CONCURRENCY = 2  # сколько файлов индексируется одновременно
+    INDEX_SAVE_SECONDS = 30  # индексы пишутся на диск, когда очередь загрузок опустела, но не реже этого
+    NAMESPACE_IDLE_SECONDS = 600  # шард индексов группы выгружается после простоя (секунд)
+    MAX_LOADED_NAMESPACES = 64  # сколько шардов групп держать в памяти одновременно
     
     # Настройки базы данных
-    DATABASE_URL = "sqlite:///./bot.db"
\ No newline at end of file
+    DATABASE_URL = "sqlite:///./bot.db"
+    ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./bot.db"  # та же база для асинхронного движка
+    DB_POOL_SIZE = 5  # соединений в пуле асинхронного движка
+    DB_BUSY_TIMEOUT_MS = 5000  # ожидание блокировки записи SQLite (мс)
+    ACTIVITY_FLUSH_MS = 1000  # как часто счетчики активности пишутся в БД (мс)
+    ACTIVITY_FLUSH_EVENTS = 500  # запись раньше срока, если накопилось столько событий
+    USER_CACHE_SIZE = 300_000  # профилей пользователей в памяти
+    USER_CACHE_TTL = 300  # через сколько секунд профиль перечитывается из БД
+    SETTINGS_FLUSH_MS = 500  # личные настройки поиска пишутся в БД пакетом раз в столько мс
+    SETTINGS_CACHE_SIZE = 100_000  # пользователей с настройками в памяти
+    SETTINGS_CACHE_TTL = 300  # через сколько секунд настройки перечитываются из БД
+    
+    # Хранилище состояний диалогов (FSM)
+    FSM_STORAGE = 'sqlite'  # sqlite - таблица в bot.db, redis - Redis, memory - в памяти процесса
+    REDIS_URL = "redis://localhost:6379/0"  # для FSM_STORAGE = 'redis'
+    FSM_FLUSH_MS = 100  # изменения состояний пишутся в SQLite пакетом раз в столько мс
+    FSM_CACHE_SIZE = 100_000  # состояний в кэше чтения
+    FSM_CACHE_TTL = 60  # через сколько секунд состояние перечитывается из БД
+    
+    # Внешние API (новости, погода, факты)
+    API_TIMEOUT = 10  # общий таймаут запроса (секунд)
+    API_CONNECT_TIMEOUT = 3  # таймаут подключения (секунд)
+    API_LIMIT_PER_HOST = 10  # одновременных соединений с одним сервером
+    API_CACHE_TTL = 300  # сколько секунд ответ API берется из кэша
+    API_CACHE_SIZE = 1000  # ответов в кэше
\ No newline at end of file
@@ -0,0 +1,72 @@
+import asyncio
+from bot.core.loader import dp
+from bot.core.config import Config
+from bot.utils.logger import logger
+from bot.utils.database import create_tables, close_db
+from bot.middlewares.errors import setup_error_handling
+from bot.utils.api_client import api_client
+from bot.utils.blob_store import blob_store, SHARED_NAMESPACE
+from bot.utils.search_executor import search_executor
+from bot.utils.ingest_queue import ingest_queue
+from bot.utils.activity_buffer import activity_buffer
+from bot.utils.search_settings import search_settings
+
+# Импортируем ВСЕ обработчики
+from bot.handlers import private, common, groups, group_admin, channel
+
+async def startup(owns_shared=True, create_db=True):
+    """Подготовка процесса бота к приему апдейтов.
+
+    owns_shared - процесс обслуживает личные чаты и общие документы: только
+    он переносит файлы в хранилище и загружает общий индекс (в режиме
+    webhook с несколькими процессами это один из них).
+    create_db - создать таблицы (в режиме webhook их создает маршрутизатор).
+    """
+    # Создаем таблицы БД
+    if create_db:
+        await create_tables()
+        logger.info("База данных инициализирована")
+
+    # Пул процессов для разбора и поиска запускаем до приема апдейтов
+    search_executor.start()
+    logger.info(f"Пул поиска запущен: {search_executor.workers} процессов")
+
+    if owns_shared:
+        # Файлы, загруженные до каталога, переносим в хранилище по содержимому
+        imported = await asyncio.to_thread(blob_store.import_folder, SHARED_NAMESPACE, Config.DOCS_FOLDER)
+        if imported:
+            logger.info(f"В хранилище перенесено файлов: {imported}")
+
+        # Догоняем индекс по каталогу документов
+        await search_executor.sync(await asyncio.to_thread(blob_store.paths))
+        logger.info("Поисковый индекс загружен")
+
+    # Воркеры фоновой индексации загруженных файлов
+    ingest_queue.start()
+    dp.shutdown.register(stop_ingest)
+
+    # Отложенная запись счетчиков активности пользователей
+    activity_buffer.start()
+
+    # Настройка обработки ошибок
+    setup_error_handling(dp)
+
+async def stop_ingest():
+    """Остановка очереди индексации при завершении приема апдейтов.
+
+    Вызывается из dp.shutdown, пока сессия бота еще открыта: callback
+    брошенных заданий сообщают пользователям, что файл не проиндексирован.
+    """
+    await ingest_queue.stop()
+
+async def shutdown():
+    """Освобождение ресурсов процесса бота"""
+    # Закрываем соединения с API
+    await api_client.close()
+    # Обычно очередь уже остановлена в stop_ingest; повторная остановка ничего не делает
+    await ingest_queue.stop()
+    search_executor.shutdown()
+    # Несохраненные счетчики активности и настройки пишем до закрытия БД
+    await activity_buffer.close()
+    await search_settings.close()
+    await close_db()
@@ -1,10 +1,13 @@
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from bot.core.config import Config
+from bot.utils.fsm_storage import create_storage
 
 # Инициализация бота и диспетчера
-bot = Bot(token=Config.TOKEN)
-storage = MemoryStorage()
+session = AiohttpSession(api=TelegramAPIServer.from_base(Config.BOT_API_SERVER)) if Config.BOT_API_SERVER else None
+bot = Bot(token=Config.TOKEN, session=session)
+storage = create_storage()  # Config.FSM_STORAGE: sqlite, redis или memory
 dp = Dispatcher(storage=storage)
 
 __all__ = ['bot', 'dp', 'storage']
\ No newline at end of file
@@ -0,0 +1,360 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+from urllib.parse import urlparse
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from bot.core.config import Config
+from bot.utils.database import create_tables, close_db
+from bot.utils.logger import logger
+
+# Личные чаты работают с общими документами и общим индексом, поэтому
+# их обслуживает один процесс - тот, которому кольцо отдает этот ключ
+SHARED_ROUTE = 'shared'
+
+# Поля апдейта, в которых событие содержит чат
+CHAT_EVENTS = (
+    'message', 'edited_message', 'channel_post', 'edited_channel_post',
+    'business_message', 'edited_business_message', 'my_chat_member', 'chat_member',
+    'chat_join_request', 'message_reaction', 'message_reaction_count',
+    'chat_boost', 'removed_chat_boost',
+)
+
+class HashRing:
+    """Согласованное хэширование: ключ -> узел.
+
+    У каждого узла replicas точек на кольце, поэтому при изменении числа
+    процессов к другому процессу переезжает лишь малая часть чатов (и их
+    шарды индексов).
+    """
+
+    def __init__(self, nodes, replicas=100):
+        points = sorted((self._hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def node(self, key):
+        """Узел, который обслуживает ключ"""
+        i = bisect.bisect(self._hashes, self._hash(str(key)))
+        return self._nodes[i % len(self._nodes)]
+
+def update_chat(data):
+    """Чат апдейта (словарь Bot API) или None"""
+    for field in CHAT_EVENTS:
+        event = data.get(field)
+        if event and 'chat' in event:
+            return event['chat']
+    callback = data.get('callback_query')
+    if callback and callback.get('message'):
+        return callback['message']['chat']
+    # Остальные апдейты (inline-запросы, платежи...) относятся к пользователю
+    for event in data.values():
+        if isinstance(event, dict) and 'from' in event:
+            return {'id': event['from']['id'], 'type': 'private'}
+    return None
+
+def create_bot():
+    """Bot для процесса приема вебхука (учитывает Config.BOT_API_SERVER)"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(Config.BOT_API_SERVER)) if Config.BOT_API_SERVER else None
+    return Bot(token=Config.TOKEN, session=session)
+
+class UpdateRouter:
+    """Прием вебхука и распределение апдейтов по процессам-обработчикам.
+
+    Чат всегда попадает в один и тот же процесс (согласованное хэширование
+    по id чата), а апдейты одного чата передаются строго по очереди: следующий
+    уходит после того, как процесс обработал предыдущий. Если процесс
+    недоступен (упал или перезапускается), апдейт передается повторно - до
+    Config.WEBHOOK_MAX_RETRIES раз, после чего отбрасывается.
+
+    Telegram получает ответ сразу после постановки апдейта в очередь в памяти,
+    а не после его обработки: иначе медленный чат задерживал бы подтверждение
+    и Telegram присылал бы апдейты повторно. Очередь не сохраняется на диск -
+    апдейты, принятые, но не переданные до аварийного завершения маршрутизатора
+    (или до истечения timeout в stop), теряются, Telegram их не повторит.
+    """
+
+    def __init__(self, workers=None):
+        self.count = workers or Config.WEBHOOK_WORKERS or os.cpu_count() or 1
+        self.ring = HashRing(range(self.count))
+        self.shared_worker = self.ring.node(SHARED_ROUTE)
+        # Пул поиска делим между процессами, чтобы не создавать count * ядер процессов
+        self.search_workers = max(1, (Config.SEARCH_WORKERS or os.cpu_count() or 1) // self.count)
+        self.path = urlparse(Config.WEBHOOK_URL).path or '/webhook'
+        self._processes = [None] * self.count
+        self._restarting = set()
+        self._tails = {}       # id чата -> задача передачи последнего апдейта
+        self._pending = set()  # все незавершенные передачи
+        self._session = None
+        self._runner = None
+        self._monitor = None
+        self.received = 0
+        self.delivered = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def worker_url(self, index, path='/update'):
+        return f"http://127.0.0.1:{Config.WEBHOOK_WORKER_PORT + index}{path}"
+
+    def route(self, data):
+        """(id чата для порядка апдейтов, номер процесса)"""
+        chat = update_chat(data)
+        if chat is None:
+            return None, self.shared_worker
+        if chat.get('type') == 'private':
+            return chat['id'], self.shared_worker
+        return chat['id'], self.ring.node(chat['id'])
+
+    def _spawn(self, index):
+        # spawn, а не fork: процессу нужен свой цикл событий и свои соединения
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(
+            target=run_worker,
+            args=(index, Config.WEBHOOK_WORKER_PORT + index, index == self.shared_worker, self.search_workers),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def _wait_ready(self, index, timeout=300):
+        """Ожидание, пока процесс начнет принимать апдейты"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            if not self._processes[index].is_alive():
+                raise RuntimeError(f"процесс {index} завершился при запуске")
+            try:
+                async with self._session.get(self.worker_url(index, '/health')) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f"процесс {index} не запустился за {timeout} с")
+
+    async def start(self):
+        """Запуск процессов-обработчиков, регистрация вебхука и прием апдейтов"""
+        # Таблицы создаются один раз здесь: процессы, запущенные одновременно,
+        # мешали бы друг другу
+        await create_tables()
+        await close_db()
+
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=5))
+        for index in range(self.count):
+            self._spawn(index)
+        try:
+            await asyncio.gather(*(self._wait_ready(index) for index in range(self.count)))
+        except Exception:
+            await self.stop()
+            raise
+        logger.info(f"Запущено процессов-обработчиков: {self.count} (личные чаты - процесс {self.shared_worker})")
+
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT).start()
+
+        bot = create_bot()
+        try:
+            # Апдейты, накопившиеся за время остановки, не сбрасываем
+            await bot.set_webhook(Config.WEBHOOK_URL, secret_token=Config.WEBHOOK_SECRET or None)
+        finally:
+            await bot.session.close()
+        self._monitor = asyncio.create_task(self._watch())
+        logger.info(f"Вебхук {Config.WEBHOOK_URL} принимается на порту {Config.WEBHOOK_PORT}")
+
+    async def _handle(self, request):
+        if Config.WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != Config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+        body = await request.read()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        self.received += 1
+        self.submit(data, body)
+        return web.Response(text='ok')
+
+    def submit(self, data, body):
+        """Постановка апдейта в очередь его чата"""
+        chat_id, index = self.route(data)
+        previous = self._tails.get(chat_id) if chat_id is not None else None
+        task = asyncio.create_task(self._deliver(index, body, previous))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        if chat_id is not None:
+            self._tails[chat_id] = task
+            task.add_done_callback(lambda done, chat_id=chat_id: self._forget(chat_id, done))
+
+    def _forget(self, chat_id, task):
+        if self._tails.get(chat_id) is task:
+            del self._tails[chat_id]
+
+    async def _deliver(self, index, body, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        delay = Config.WEBHOOK_RETRY_SECONDS
+        for attempt in range(Config.WEBHOOK_MAX_RETRIES + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+            try:
+                async with self._session.post(
+                    self.worker_url(index), data=body, headers={'Content-Type': 'application/json'}
+                ) as response:
+                    if response.status == 200:
+                        self.delivered += 1
+                        return
+                    logger.warning(f"Процесс {index} вернул {response.status}, повтор через {delay} с")
+            except aiohttp.ClientError as e:
+                if index not in self._restarting:
+                    logger.warning(f"Процесс {index} недоступен ({e}), повтор через {delay} с")
+        self.dropped += 1
+        logger.error(f"Апдейт не передан процессу {index} за {Config.WEBHOOK_MAX_RETRIES} повторов и отброшен: {body[:200]!r}")
+
+    async def _watch(self):
+        """Перезапуск упавших процессов"""
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self._processes):
+                if index in self._restarting or process.is_alive():
+                    continue
+                logger.error(f"Процесс {index} завершился (код {process.exitcode}), перезапуск")
+                self._restarting.add(index)
+                try:
+                    self._spawn(index)
+                    await self._wait_ready(index)
+                except Exception as e:
+                    logger.error(f"Не удалось перезапустить процесс {index}: {e}")
+                finally:
+                    self._restarting.discard(index)
+
+    async def _stop_worker(self, index):
+        process = self._processes[index]
+        if process is not None and process.is_alive():
+            # SIGTERM: процесс дообрабатывает принятые апдейты и сохраняет состояние
+            process.terminate()
+            await asyncio.to_thread(process.join)
+
+    async def restart(self):
+        """Поочередный перезапуск процессов; апдейты их чатов ждут в очереди"""
+        for index in range(self.count):
+            self._restarting.add(index)
+            try:
+                await self._stop_worker(index)
+                self._spawn(index)
+                await self._wait_ready(index)
+                logger.info(f"Процесс {index} перезапущен")
+            finally:
+                self._restarting.discard(index)
+
+    async def stop(self, timeout=60):
+        """Остановка приема, передача принятых апдейтов и остановка процессов"""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._pending:
+            await asyncio.wait(set(self._pending), timeout=timeout)
+        self._restarting.update(range(self.count))
+        await asyncio.gather(*(self._stop_worker(index) for index in range(self.count)))
+        if self._pending:
+            logger.error(f"При остановке не переданы апдейты: {len(self._pending)}")
+            self.dropped += len(self._pending)
+        for task in list(self._pending):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    def status(self):
+        """Счетчики приема и передачи апдейтов"""
+        return {
+            'workers': self.count,
+            'received': self.received,
+            'delivered': self.delivered,
+            'pending': len(self._pending),
+            'retries': self.retries,
+            'dropped': self.dropped,
+        }
+
+async def run_webhook(workers=None):
+    """Режим вебхука: работает до SIGTERM/SIGINT, SIGHUP - перезапуск процессов"""
+    router = UpdateRouter(workers)
+    await router.start()
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(router.restart()))
+    try:
+        await stop.wait()
+    finally:
+        await router.stop()
+
+async def _serve_worker(index, port, owns_shared, search_workers):
+    # Бот и обработчики импортируются только в процессе-обработчике
+    from aiogram.types import Update
+    from bot.core.loader import bot, dp
+    from bot.core.lifecycle import startup, shutdown
+    from bot.utils.search_executor import search_executor
+
+    if search_workers:
+        search_executor.workers = search_workers
+    await startup(owns_shared, create_db=False)
+    await dp.emit_startup(bot=bot, **dp.workflow_data)
+
+    async def handle_update(request):
+        data = None
+        try:
+            data = await request.json()
+            update = Update.model_validate(data, context={'bot': bot})
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            # Ни нераспознанный апдейт, ни ошибка обработчика не исправятся
+            # повторной передачей - подтверждаем, чтобы очередь чата не встала
+            update_id = data.get('update_id') if isinstance(data, dict) else None
+            logger.error(f"Worker {index}: update {update_id} failed: {e}")
+        return web.Response(text='ok')
+
+    async def health(request):
+        return web.Response(text='ok')
+
+    app = web.Application()
+    app.router.add_post('/update', handle_update)
+    app.router.add_get('/health', health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    # Ctrl+C получает вся группа процессов - останавливает процессы только маршрутизатор
+    loop.add_signal_handler(signal.SIGINT, lambda: None)
+    try:
+        await stop.wait()
+    finally:
+        # Новые апдейты не принимаются, начатые обрабатываются до конца
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data)
+        await bot.session.close()
+        await shutdown()
+
+def run_worker(index, port, owns_shared=True, search_workers=None):
+    """Точка входа процесса-обработчика апдейтов"""
+    asyncio.run(_serve_worker(index, port, owns_shared, search_workers))
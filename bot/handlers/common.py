@@ -2,6 +2,7 @@ from aiogram import F, types
 from aiogram.filters import Command
 from bot.core.loader import dp
 from bot.utils.database import get_user
+from bot.utils.activity_buffer import activity_buffer
 from bot.utils.logger import logger
 
 @dp.message(Command("stats"))
@@ -10,13 +11,18 @@ async def show_stats(message: types.Message):
     try:
         user = await get_user(message.from_user.id)
         
+        # Счетчики пишутся в БД с задержкой - добавляем еще не записанные
+        documents, searches, last_activity = activity_buffer.current(
+            message.from_user.id, user.documents_uploaded, user.searches_performed, user.last_activity
+        )
+        
         stats_text = (
             f"📊 Ваша статистика:\n"
             f"👤 Пользователь: {user.full_name}\n"
             f"📅 Зарегистрирован: {user.created_at.strftime('%d.%m.%Y')}\n"
-            f"📄 Загружено документов: {user.documents_uploaded}\n"
-            f"🔍 Выполнено поисков: {user.searches_performed}\n"
-            f"🕒 Последняя активность: {user.last_activity.strftime('%H:%M %d.%m.%Y')}"
+            f"📄 Загружено документов: {documents}\n"
+            f"🔍 Выполнено поисков: {searches}\n"
+            f"🕒 Последняя активность: {last_activity.strftime('%H:%M %d.%m.%Y')}"
         )
         
         await message.answer(stats_text)
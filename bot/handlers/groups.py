@@ -1,7 +1,14 @@
+import re
 from aiogram import F, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from bot.core.loader import dp
+from bot.core.config import Config
+from bot.handlers.private import run_search, chat_docs
 from bot.utils.logger import logger
+from bot.utils.namespaces import namespaces, GROUP_CHAT_TYPES
+from bot.utils.query_parser import QuerySyntaxError
+from bot.utils.search_executor import SearchTimeout
+from bot.utils.search_settings import search_settings
 
 @dp.message(Command("help_group"))
 @dp.message(F.text == "ℹ️ Помощь для групп")
@@ -23,19 +30,31 @@ async def group_help(message: types.Message):
     await message.answer(help_text)
 
 @dp.message(Command("search_group"))
-async def search_in_group(message: types.Message):
+async def search_in_group(message: types.Message, command: CommandObject):
     """Поиск в документах группы"""
     try:
-        # Извлекаем запрос из команды
-        query = message.text.replace('/search_group', '').strip()
+        if message.chat.type not in GROUP_CHAT_TYPES:
+            await message.answer("❌ Команда работает только в группах. В личном чате используйте 🔍 Поиск")
+            return
+        
+        query = (command.args or "").strip()
         
         if not query:
             await message.answer("❌ Укажите поисковый запрос: `/search_group ваш запрос`")
             return
         
-        # Здесь будет логика поиска по документам группы
-        await message.answer(f"🔍 Поиск в документах группы по запросу: '{query}'\n\nФункция в разработке...")
+        # run_search ищет только в шарде этой группы
+        await run_search(message, query, await search_settings.get_setting('search_type', message.from_user.id))
         
+    except QuerySyntaxError as e:
+        await message.answer(f"❌ Ошибка в запросе: {e}")
+    except re.error as e:
+        await message.answer(f"❌ Некорректное регулярное выражение: {e}")
+    except SearchTimeout:
+        await message.answer(
+            f"⏱ Поиск прерван: выражение выполнялось дольше {Config.REGEX_TIMEOUT} с. "
+            "Упростите его - например, уберите вложенные повторы вроде `(a+)+`"
+        )
     except Exception as e:
         logger.error(f"Group search error: {e}")
         await message.answer("❌ Ошибка при поиске в группе")
@@ -44,8 +63,21 @@ async def search_in_group(message: types.Message):
 async def list_group_documents(message: types.Message):
     """Список документов группы"""
     try:
-        # Здесь будет логика получения документов группы
-        await message.answer("📂 Список документов группы:\n\nФункция в разработке...")
+        namespace = await namespaces.for_chat(message.chat)
+        if namespace is None:
+            await message.answer("❌ Команда работает только в группах. В личном чате используйте 📁 Документы")
+            return
+        
+        docs = await chat_docs(namespace)
+        if not docs:
+            await message.answer("📂 В этой группе пока нет документов. Отправьте файл в чат, чтобы добавить его")
+            return
+        
+        docs_list = "\n".join(f"• {doc}" for doc in docs[:20])
+        text = f"📂 Документы группы ({len(docs)}):\n\n{docs_list}"
+        if len(docs) > 20:
+            text += f"\n\n... и еще {len(docs) - 20} документов"
+        await message.answer(text)
         
     except Exception as e:
         logger.error(f"Group list error: {e}")
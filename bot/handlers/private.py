@@ -1,16 +1,24 @@
 import os
+import re
 import asyncio
 from aiogram import F, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from bot.core.loader import dp, bot
 from bot.core.config import Config
-from bot.utils.database import get_user, update_user_activity, increment_documents_count, increment_searches_count
+from bot.utils.database import get_user
+from bot.utils.user_cache import user_cache
+from bot.utils.activity_buffer import activity_buffer
 from bot.utils.logger import logger
 from bot.utils.document_parser import DocumentParser
 from bot.utils.file_storage import FileStorage
+from bot.utils.search_executor import search_executor, SearchTimeout
+from bot.utils.ingest_queue import ingest_queue
+from bot.utils.namespaces import namespaces
+from bot.utils.blob_store import SHARED_NAMESPACE
+from bot.utils.query_parser import QuerySyntaxError
 from bot.utils.search_settings import search_settings
 from bot.utils.api_client import api_client
 
@@ -50,7 +58,7 @@ async def send_welcome(message: types.Message):
     try:
         # Регистрируем пользователя в БД
         user = await get_user(message.from_user.id, message.from_user.username, message.from_user.full_name)
-        await update_user_activity(message.from_user.id)
+        activity_buffer.touch(message.from_user.id)
         
         welcome_text = (
             "📚 Бот для поиска в документах\n\n"
@@ -68,11 +76,20 @@ async def send_welcome(message: types.Message):
         logger.error(f"Error in send_welcome: {e}")
         await message.answer("❌ Произошла ошибка при запуске")
 
+async def chat_docs(namespace):
+    """Документы чата (namespace=None - общие).
+
+    Каталог сверяется с БД (его мог изменить другой процесс), поэтому
+    список читается в потоке, не останавливая цикл событий.
+    """
+    return await asyncio.to_thread(namespace.docs if namespace else FileStorage.get_all_docs)
+
 # ОБРАБОТЧИКИ КНОПОК ПЕРВОЙ СТРОКИ
 @dp.message(F.text == "🔍 Поиск")
 async def handle_search(message: types.Message, state: FSMContext):
     """Начало поиска в документах"""
-    docs = FileStorage.get_all_docs()
+    namespace = await namespaces.for_chat(message.chat)
+    docs = await chat_docs(namespace)
     if not docs:
         await message.answer("📂 Сначала загрузите документы для поиска!")
         return
@@ -84,7 +101,8 @@ async def handle_search(message: types.Message, state: FSMContext):
 async def list_documents(message: types.Message):
     """Показать список документов"""
     try:
-        docs = FileStorage.get_all_docs()
+        namespace = await namespaces.for_chat(message.chat)
+        docs = await chat_docs(namespace)
         
         if docs:
             docs_list = "\n".join([f"• {doc}" for doc in docs[:10]])
@@ -105,13 +123,18 @@ async def stats_button(message: types.Message):
     try:
         user = await get_user(message.from_user.id)
         
+        # Счетчики пишутся в БД с задержкой - добавляем еще не записанные
+        documents, searches, last_activity = activity_buffer.current(
+            message.from_user.id, user.documents_uploaded, user.searches_performed, user.last_activity
+        )
+        
         stats_text = (
             f"📊 Ваша статистика:\n"
             f"👤 Пользователь: {user.full_name}\n"
             f"📅 Зарегистрирован: {user.created_at.strftime('%d.%m.%Y')}\n"
-            f"📄 Загружено документов: {user.documents_uploaded}\n"
-            f"🔍 Выполнено поисков: {user.searches_performed}\n"
-            f"🕒 Последняя активность: {user.last_activity.strftime('%H:%M %d.%m.%Y')}"
+            f"📄 Загружено документов: {documents}\n"
+            f"🔍 Выполнено поисков: {searches}\n"
+            f"🕒 Последняя активность: {last_activity.strftime('%H:%M %d.%m.%Y')}"
         )
         
         await message.answer(stats_text)
@@ -123,7 +146,7 @@ async def stats_button(message: types.Message):
 @dp.message(F.text == "⚙️ Настройки")
 async def settings_menu(message: types.Message):
     """Меню настроек поиска"""
-    settings = search_settings.get_all_settings()
+    settings = await search_settings.get_all_settings(message.from_user.id)
     
     settings_text = (
         "⚙️ **Настройки поиска**\n\n"
@@ -150,7 +173,13 @@ async def smart_search_menu(message: types.Message):
         "**Булев поиск** (с операторами):\n"
         "`/boolean запрос and другой`\n"
         "`/boolean запрос or другой`\n"
-        "`/boolean запрос not исключение`"
+        "`/boolean запрос not исключение`\n"
+        "`/boolean (отчет or план) and \"годовой бюджет\" ext:pdf`\n\n"
+        "**Фразы и близость слов** (работают и в обычном поиске):\n"
+        "`\"годовой бюджет\"` - слова подряд\n"
+        "`договор NEAR/5 поставка` - не дальше 5 слов друг от друга (NEAR пишется заглавными)\n\n"
+        "**Регулярные выражения:**\n"
+        "`/regex компонент\\w*`"
     )
     await message.answer(menu_text)
 
@@ -174,12 +203,16 @@ async def translate_menu(message: types.Message):
 async def clear_documents(message: types.Message):
     """Удаление всех документов"""
     try:
-        docs = FileStorage.get_all_docs()
+        namespace = await namespaces.for_chat(message.chat)
+        docs = await chat_docs(namespace)
         if not docs:
             await message.answer("📂 Нет документов для удаления.")
             return
             
-        if FileStorage.clear_all_docs():
+        # Транзакция каталога и перезапись индексов на диск - в потоке
+        cleared = (await asyncio.to_thread(FileStorage.clear_all_docs, namespace.key, namespace.engine)
+                   if namespace else await asyncio.to_thread(FileStorage.clear_all_docs))
+        if cleared:
             await message.answer("🗑️ Все документы удалены!")
             logger.info(f"User {message.from_user.id} cleared all documents")
         else:
@@ -197,10 +230,12 @@ async def help_command(message: types.Message):
         "`/search` - поиск в документах\n"
         "`/list` - список документов\n"
         "`/stats` - статистика\n"
-        "`/settings` - настройки\n\n"
+        "`/settings` - настройки\n"
+        "`/ingest_status` - очередь индексации, кэши и шарды\n\n"
         "**Умный поиск:**\n"
         "`/fuzzy запрос` - нечеткий поиск\n"
-        "`/boolean запрос` - булев поиск\n\n"
+        "`/boolean запрос` - булев поиск\n"
+        "`/regex выражение` - поиск по регулярному выражению\n\n"
         "**Переводчик:**\n"
         "`/translate en текст` - перевод\n"
         "`/synonyms слово` - синонимы\n\n"
@@ -427,7 +462,17 @@ async def news_text_command(message: types.Message):
 async def weather_text_command(message: types.Message):
     await weather_command(message)
 
-# СУЩЕСТВУЮЩИЕ ОБРАБОТЧИКИ (без изменений)
+# ЗАГРУЗКА ДОКУМЕНТОВ И ПОИСК
+def telegram_file_chunks(file_path):
+    """Асинхронный поток кусков файла с серверов Telegram"""
+    url = bot.session.api.file_url(bot.token, file_path)
+    return bot.session.stream_content(
+        url=url,
+        timeout=Config.DOWNLOAD_TIMEOUT,
+        chunk_size=Config.DOWNLOAD_CHUNK_SIZE,
+        raise_for_status=True,
+    )
+
 @dp.message(F.document)
 async def handle_document(message: types.Message):
     """Обработчик загрузки документов"""
@@ -443,15 +488,45 @@ async def handle_document(message: types.Message):
             await message.answer(f"❌ Неподдерживаемый формат. Разрешены: {', '.join(Config.ALLOWED_EXTENSIONS)}")
             return
         
-        file_info = await bot.get_file(document.file_id)
-        downloaded_file = await bot.download_file(file_info.file_path)
-        file_data = downloaded_file.read()
-        
-        saved_path = FileStorage.save_file(document.file_id, document.file_name, file_data)
+        # В группе документ попадает в каталог ее пространства имен
+        namespace = await namespaces.for_chat(message.chat)
+        namespace_key = namespace.key if namespace else SHARED_NAMESPACE
         
-        if saved_path:
-            await message.answer(f"✅ Документ '{document.file_name}' успешно загружен!")
-            await increment_documents_count(message.from_user.id)
+        # Этот файл уже загружали (возможно, другой пользователь) - не скачиваем
+        saved = await asyncio.to_thread(FileStorage.save_known, document.file_name, document.file_unique_id, namespace_key)
+        if saved is None:
+            file_info = await bot.get_file(document.file_id)
+            
+            # Файл идет кусками прямо на диск, в памяти не держим его целиком
+            saved = await FileStorage.save_stream(
+                document.file_name, telegram_file_chunks(file_info.file_path),
+                namespace=namespace_key, unique_id=document.file_unique_id,
+            )
+        
+        if saved:
+            saved_path, file_hash, changed = saved
+            logger.info(f"Saved {document.file_name} ({file_hash})")
+            
+            if not changed:
+                # То же содержимое под тем же именем - индекс уже актуален
+                await message.answer(f"✅ Документ '{document.file_name}' уже загружен и готов к поиску!")
+                return
+            
+            # Разбор и индексация идут в фоне, пользователь узнает о готовности
+            waiting = ingest_queue.status()['queued']
+            status_message = await message.answer(
+                f"📥 Документ '{document.file_name}' загружен и поставлен на индексацию"
+                + (f" (перед ним в очереди: {waiting})" if waiting else "")
+            )
+            
+            async def notify_ready(ok, file_name=document.file_name):
+                if ok:
+                    await status_message.edit_text(f"✅ Документ '{file_name}' готов к поиску!")
+                else:
+                    await status_message.edit_text(f"⚠️ Документ '{file_name}' сохранен, но проиндексировать его не удалось")
+            
+            ingest_queue.submit(document.file_name, saved_path, notify_ready, namespace)
+            activity_buffer.record(message.from_user.id, documents=1)
             logger.info(f"User {message.from_user.id} uploaded {document.file_name}")
         else:
             await message.answer("❌ Ошибка при сохранении файла")
@@ -460,92 +535,196 @@ async def handle_document(message: types.Message):
         logger.error(f"Error handling document: {e}")
         await message.answer("❌ Ошибка при обработке документа")
 
+def inline_code(text):
+    """Текст в `...` для Markdown: экранировать ` внутри кода нельзя, поэтому он заменяется на '"""
+    return "`" + text.replace("`", "'") + "`"
+
+def code_block(text):
+    """Фрагмент в ```...``` для Markdown (``` внутри закрыл бы блок раньше времени)"""
+    return "```\n" + text.replace("```", "'''") + "\n```\n"
+
+def format_search_response(query, found_results, total_docs, context_size, max_matches):
+    """Формирование ответа с результатами поиска (документы уже отсортированы по релевантности).
+
+    total_docs - число документов с совпадениями; сколько всего совпадений в
+    них, поиск не считает, поэтому в заголовке - только показанные.
+    """
+    if not found_results:
+        return f"❌ По запросу {inline_code(query)} ничего не найдено"
+    
+    found = f"🔍 Найдено документов: {total_docs}"
+    header = found
+    if total_docs > len(found_results):
+        header += f", показаны {len(found_results)} самых релевантных"
+    header += f" (совпадений показано: {sum(result['match_count'] for result in found_results)})"
+    response = header + ":\n\n"
+    
+    for result in found_results:
+        response += f"📄 **{result['filename']}** ({result['match_count']} совпадений)\n"
+        
+        for i, match in enumerate(result['matches'], 1):
+            response += f"**Совпадение {i}:**\n"
+            response += code_block(match)
+        
+        response += "\n"
+    
+    response += f"💡 Запрос: {inline_code(query)}\n"
+    response += f"⚙️ Настройки: контекст {context_size} симв., макс. {max_matches} совпад./файл"
+    
+    if len(response) > 4000:
+        # Сокращенный ответ: число показанных совпадений в заголовке уже неверно
+        response = found + ":\n\n"
+        
+        for result in found_results[:2]:
+            response += f"📄 **{result['filename']}** ({result['match_count']} совпадений)\n"
+            
+            for i, match in enumerate(result['matches'][:3], 1):
+                response += f"**Совпадение {i}:**\n"
+                response += code_block(f"{match[:150]}...")
+            
+            response += "\n"
+        
+        if total_docs > 2:
+            response += f"💡 Показаны 2 самых релевантных из {total_docs} файлов\n"
+        
+        response += f"💡 Запрос: {inline_code(query)}\n"
+        response += f"⚙️ Настройки: контекст {context_size} симв., макс. {max_matches} совпад./файл"
+    
+    return response
+
+async def run_search(message: types.Message, query: str, search_type: str):
+    """Выполнение поиска и отправка результатов (в группе - только по ее документам)"""
+    namespace = await namespaces.for_chat(message.chat)
+    docs = await chat_docs(namespace)
+    
+    if not docs:
+        await message.answer("📂 Документы не найдены. Сначала загрузите документы!")
+        return
+    
+    context_size = await search_settings.get_setting('context_size', message.from_user.id)
+    max_matches = await search_settings.get_setting('max_matches_per_file', message.from_user.id)
+    
+    found_results, total_docs = await search_executor.search(
+        query, docs, search_type, max_matches=max_matches, context_size=context_size,
+        engine=namespace.engine if namespace else None,
+    )
+    
+    response = format_search_response(query, found_results, total_docs, context_size, max_matches)
+    await message.answer(response, parse_mode="Markdown")
+    activity_buffer.record(message.from_user.id, searches=1)
+    logger.info(f"User {message.from_user.id} searched ({search_type}) for '{query}', found {total_docs} files, showed {len(found_results)}")
+
 @dp.message(SearchStates.waiting_for_search_query)
 async def process_search_query(message: types.Message, state: FSMContext):
     """Обработка поискового запроса"""
     try:
-        query = message.text.lower().strip()
+        query = message.text.strip()
         
         if not query:
             await message.answer("❌ Введите непустой запрос для поиска")
             await state.clear()
             return
         
-        docs = FileStorage.get_all_docs()
+        await run_search(message, query, await search_settings.get_setting('search_type', message.from_user.id))
         
-        if not docs:
-            await message.answer("📂 Документы не найдены. Сначала загрузите документы!")
-            await state.clear()
+    except QuerySyntaxError as e:
+        await message.answer(f"❌ Ошибка в запросе: {e}")
+    except re.error as e:
+        await message.answer(f"❌ Некорректное регулярное выражение: {e}")
+    except SearchTimeout:
+        await message.answer(
+            f"⏱ Поиск прерван: выражение выполнялось дольше {Config.REGEX_TIMEOUT} с. "
+            "Упростите его - например, уберите вложенные повторы вроде `(a+)+`"
+        )
+    except Exception as e:
+        logger.error(f"Search error: {e}")
+        await message.answer("❌ Ошибка при выполнении поиска")
+    
+    await state.clear()
+
+@dp.message(Command("fuzzy"))
+async def fuzzy_search_command(message: types.Message, command: CommandObject):
+    """Нечеткий поиск с учетом опечаток"""
+    try:
+        query = (command.args or "").strip()
+        if not query:
+            await message.answer("❌ Использование: `/fuzzy ваш запрос`")
             return
         
-        context_size = search_settings.get_setting('context_size')
-        max_matches = search_settings.get_setting('max_matches_per_file')
+        await run_search(message, query, 'fuzzy')
+        
+    except Exception as e:
+        logger.error(f"Fuzzy search error: {e}")
+        await message.answer("❌ Ошибка при выполнении поиска")
+
+@dp.message(Command("boolean"))
+async def boolean_search_command(message: types.Message, command: CommandObject):
+    """Булев поиск: AND/OR/NOT, NEAR/k, скобки, фразы и фильтры"""
+    try:
+        query = (command.args or "").strip()
+        if not query:
+            await message.answer("❌ Использование: `/boolean (отчет or план) and not черновик`")
+            return
         
-        found_results = []
-        total_matches = 0
+        await run_search(message, query, 'boolean')
         
-        for doc_name in docs:
-            doc_path = os.path.join(Config.DOCS_FOLDER, doc_name)
-            text = DocumentParser.parse_file(doc_path)
-            
-            if text and query in text.lower():
-                matches = DocumentParser.find_all_matches(text, query, max_matches=max_matches, context_size=context_size)
-                
-                if matches:
-                    found_results.append({
-                        'filename': doc_name,
-                        'matches': matches,
-                        'match_count': len(matches)
-                    })
-                    total_matches += len(matches)
-        
-        if found_results:
-            response = f"🔍 Найдено {total_matches} совпадений в {len(found_results)} документах:\n\n"
-            
-            for result in found_results:
-                response += f"📄 **{result['filename']}** ({result['match_count']} совпадений)\n"
-                
-                for i, match in enumerate(result['matches'], 1):
-                    response += f"**Совпадение {i}:**\n"
-                    response += f"```\n{match}\n```\n"
-                
-                response += "\n"
-            
-            response += f"💡 Запрос: '{query}'\n"
-            response += f"⚙️ Настройки: контекст {context_size} симв., макс. {max_matches} совпад./файл"
-            
-            if len(response) > 4000:
-                response = f"🔍 Найдено {total_matches} совпадений в {len(found_results)} документах:\n\n"
-                
-                for result in found_results[:2]:
-                    response += f"📄 **{result['filename']}** ({result['match_count']} совпадений)\n"
-                    
-                    for i, match in enumerate(result['matches'][:3], 1):
-                        response += f"**Совпадение {i}:**\n"
-                        response += f"```\n{match[:150]}...\n```\n"
-                    
-                    response += "\n"
-                
-                if len(found_results) > 2:
-                    response += f"💡 Показаны первые 2 из {len(found_results)} файлов\n"
-                
-                response += f"💡 Запрос: '{query}'\n"
-                response += f"⚙️ Настройки: контекст {context_size} симв., макс. {max_matches} совпад./файл"
-                
-        else:
-            response = f"❌ По запросу '{query}' ничего не найдено"
+    except QuerySyntaxError as e:
+        await message.answer(f"❌ Ошибка в запросе: {e}")
+    except Exception as e:
+        logger.error(f"Boolean search error: {e}")
+        await message.answer("❌ Ошибка при выполнении поиска")
+
+@dp.message(Command("regex"))
+async def regex_search_command(message: types.Message, command: CommandObject):
+    """Поиск по регулярному выражению"""
+    try:
+        pattern = (command.args or "").strip()
+        if not pattern:
+            await message.answer("❌ Использование: `/regex выражение`")
+            return
         
-        await message.answer(response, parse_mode="Markdown")
-        await increment_searches_count(message.from_user.id)
-        logger.info(f"User {message.from_user.id} searched for '{query}', found {total_matches} matches in {len(found_results)} files")
+        await run_search(message, pattern, 'regex')
         
+    except re.error as e:
+        await message.answer(f"❌ Некорректное регулярное выражение: {e}")
+    except SearchTimeout:
+        await message.answer(
+            f"⏱ Поиск прерван: выражение выполнялось дольше {Config.REGEX_TIMEOUT} с. "
+            "Упростите его - например, уберите вложенные повторы вроде `(a+)+`"
+        )
     except Exception as e:
-        logger.error(f"Search error: {e}")
+        logger.error(f"Regex search error: {e}")
         await message.answer("❌ Ошибка при выполнении поиска")
-    
-    await state.clear()
 
 # КОМАНДЫ НАСТРОЕК
+@dp.message(Command("ingest_status"))
+async def ingest_status_command(message: types.Message):
+    """Состояние очереди индексации, внешних API, кэшей и шардов"""
+    status = ingest_queue.status()
+    api = api_client.status()
+    users = user_cache.status()
+    activity = activity_buffer.status()
+    shards = namespaces.status()
+    await message.answer(
+        "📥 **Очередь индексации**\n\n"
+        f"В очереди: {status['queued']}\n"
+        f"Индексируется: {status['running']} (воркеров: {status['workers']})\n"
+        f"Готово: {status['processed']}, ошибок: {status['failed']}\n"
+        f"Скорость: {status['per_minute']} файлов/мин\n"
+        f"Среднее время файла: {status['avg_seconds']:.1f} с\n"
+        f"Дольше всех ждет: {status['oldest_wait']:.0f} с\n\n"
+        "🌐 **Внешние API**\n\n"
+        f"Запросов к серверам: {api['requests']}\n"
+        f"Из кэша: {api['cache_hits']}, объединено: {api['coalesced']}\n"
+        f"Ответов в кэше: {api['cached']}\n\n"
+        "🗂 **Кэши и шарды**\n\n"
+        f"Профили: {users['size']}/{users['max_size']}, попаданий {users['hit_rate']:.0%}\n"
+        f"Активность: ждут записи {activity['pending']} польз. ({activity['pending_events']} событий), "
+        f"записей в БД: {activity['flushes']}\n"
+        f"Шарды групп в памяти: {shards['loaded']}/{shards['max_loaded']}",
+        parse_mode="Markdown"
+    )
+
 @dp.message(Command("context"))
 async def set_context_size(message: types.Message):
     """Установка размера контекста"""
@@ -560,7 +739,7 @@ async def set_context_size(message: types.Message):
             await message.answer("❌ Размер контекста должен быть от 50 до 500 символов")
             return
         
-        if search_settings.set_setting('context_size', size):
+        if await search_settings.set_setting('context_size', size, message.from_user.id):
             await message.answer(f"✅ Размер контекста изменен на {size} символов")
         else:
             await message.answer("❌ Ошибка сохранения настроек")
@@ -585,7 +764,7 @@ async def set_max_matches(message: types.Message):
             await message.answer("❌ Количество совпадений должно быть от 1 до 50")
             return
         
-        if search_settings.set_setting('max_matches_per_file', matches):
+        if await search_settings.set_setting('max_matches_per_file', matches, message.from_user.id):
             await message.answer(f"✅ Макс. совпадений изменено на {matches}")
         else:
             await message.answer("❌ Ошибка сохранения настроек")
@@ -602,15 +781,15 @@ async def set_search_type(message: types.Message):
     try:
         parts = message.text.split()
         if len(parts) != 2:
-            await message.answer("❌ Использование: `/search_type exact|fuzzy|boolean`")
+            await message.answer("❌ Использование: `/search_type exact|fuzzy|boolean|regex`")
             return
         
         search_type = parts[1].lower()
-        if search_type not in ['exact', 'fuzzy', 'boolean']:
-            await message.answer("❌ Доступные типы: exact, fuzzy, boolean")
+        if search_type not in ['exact', 'fuzzy', 'boolean', 'regex']:
+            await message.answer("❌ Доступные типы: exact, fuzzy, boolean, regex")
             return
         
-        if search_settings.set_setting('search_type', search_type):
+        if await search_settings.set_setting('search_type', search_type, message.from_user.id):
             await message.answer(f"✅ Тип поиска изменен на '{search_type}'")
         else:
             await message.answer("❌ Ошибка сохранения настроек")
@@ -619,8 +798,9 @@ async def set_search_type(message: types.Message):
         logger.error(f"Search type setting error: {e}")
         await message.answer("❌ Ошибка при изменении настроек")
 
-# Обработчик для любых текстовых сообщений
-@dp.message(F.text)
+# Обработчик для любых текстовых сообщений; команды пропускаем - их
+# обрабатывают модули, подключенные после этого (/search_group и др.)
+@dp.message(F.text, ~F.text.startswith("/"))
 async def handle_text_messages(message: types.Message):
     """Обработчик любых текстовых сообщений"""
     if message.text not in ["🔍 Поиск", "📁 Документы", "📊 Статистика", "⚙️ Настройки",
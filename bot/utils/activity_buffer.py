@@ -0,0 +1,82 @@
+import datetime
+from bot.core.config import Config
+from bot.utils.database import apply_user_deltas
+from bot.utils.write_behind import WriteBehind
+
+class UserDelta:
+    """Накопленные изменения одного пользователя"""
+
+    __slots__ = ('documents', 'searches', 'last_activity')
+
+    def __init__(self):
+        self.documents = 0
+        self.searches = 0
+        self.last_activity = None  # None - время активности не менялось
+
+class ActivityBuffer(WriteBehind):
+    """Отложенная запись активности пользователей.
+
+    Обработчики только увеличивают счетчики в памяти, а в БД они попадают
+    одной транзакцией раз в flush_ms миллисекунд или сразу, как накопится
+    max_events событий. При всплеске нагрузки это несколько коммитов в секунду
+    вместо коммита на каждое сообщение. При остановке бота буфер сбрасывается.
+    """
+
+    NAME = 'Activity'
+
+    def __init__(self, flush_ms=None, max_events=None):
+        super().__init__(flush_ms or Config.ACTIVITY_FLUSH_MS, max_events or Config.ACTIVITY_FLUSH_EVENTS)
+
+    def record(self, user_id, documents=0, searches=0, active=False):
+        """Учет события пользователя (без обращения к БД)"""
+        delta = self._dirty.get(user_id)
+        if delta is None:
+            delta = self._dirty[user_id] = UserDelta()
+        delta.documents += documents
+        delta.searches += searches
+        if active:
+            delta.last_activity = datetime.datetime.utcnow()
+        self._changed()
+
+    def touch(self, user_id):
+        """Обновить время последней активности"""
+        self.record(user_id, active=True)
+
+    def current(self, user_id, documents, searches, last_activity):
+        """Значения счетчиков из БД с учетом еще не записанных изменений.
+
+        Возвращает (документов, поисков, последняя активность).
+        """
+        for deltas in (self._flushing, self._dirty):
+            delta = deltas.get(user_id)
+            if delta is not None:
+                documents += delta.documents
+                searches += delta.searches
+                last_activity = delta.last_activity or last_activity
+        return documents, searches, last_activity
+
+    async def _write(self, deltas):
+        await apply_user_deltas([
+            {'user_id': user_id, 'documents': delta.documents,
+             'searches': delta.searches, 'last_activity': delta.last_activity}
+            for user_id, delta in deltas.items()
+        ])
+
+    def _restore(self, deltas):
+        # Приращения складываются с накопленными во время записи
+        for user_id, old in deltas.items():
+            delta = self._dirty.get(user_id)
+            if delta is None:
+                self._dirty[user_id] = old
+                continue
+            delta.documents += old.documents
+            delta.searches += old.searches
+            if delta.last_activity is None:
+                delta.last_activity = old.last_activity
+
+    def status(self):
+        """Состояние буфера"""
+        return {**super().status(), 'pending_events': self._events}
+
+# Глобальный буфер активности пользователей
+activity_buffer = ActivityBuffer()
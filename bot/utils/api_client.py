@@ -1,44 +1,122 @@
+import asyncio
+import time
 import aiohttp
 import logging
 import json
+from collections import OrderedDict
 from bot.core.config import Config
 
 logger = logging.getLogger(__name__)
 
 class APIClient:
-    def __init__(self):
+    """Клиент внешних API.
+
+    Все запросы идут через одну сессию с пулом соединений (не больше
+    limit_per_host соединений с сервером) и таймаутами. Ответы кэшируются
+    по (адрес, параметры) на cache_ttl секунд, а одновременные одинаковые
+    запросы объединяются: сто нажатий кнопки погоды - один запрос к серверу.
+    """
+    
+    NEWS_URL = "https://newsapi.org/v2/top-headlines"
+    WEATHER_URL = "http://api.openweathermap.org/data/2.5/weather"
+    FACTS_URL = "https://uselessfacts.jsph.pl/api/v2/facts/random"
+    
+    def __init__(self, limit_per_host=None, timeout=None, cache_ttl=None, cache_size=None):
         self.session = None
+        self.limit_per_host = limit_per_host or Config.API_LIMIT_PER_HOST
+        self.timeout = timeout or Config.API_TIMEOUT
+        self.cache_ttl = Config.API_CACHE_TTL if cache_ttl is None else cache_ttl
+        self.cache_size = cache_size or Config.API_CACHE_SIZE
+        self._cache = OrderedDict()  # (адрес, параметры) -> (время устаревания, ответ)
+        self._inflight = {}          # (адрес, параметры) -> задача запроса к серверу
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
     
     async def get_session(self):
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, ttl_dns_cache=300)
+            timeout = aiohttp.ClientTimeout(total=self.timeout, connect=Config.API_CONNECT_TIMEOUT)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
         return self.session
     
     async def close(self):
         if self.session:
             await self.session.close()
+            self.session = None
+    
+    async def fetch_json(self, url, params=None, ttl=None):
+        """GET-запрос с JSON-ответом через кэш и объединение одинаковых запросов.
+
+        ttl - время жизни ответа в кэше (0 - не кэшировать, только объединять).
+        Ошибки (в т.ч. статус не 200) получают все ожидающие этот запрос.
+        """
+        ttl = self.cache_ttl if ttl is None else ttl
+        key = (url, tuple(sorted((params or {}).items())))
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] >= time.monotonic():
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._request(url, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        data = await asyncio.shield(task)
+        
+        if ttl > 0:
+            self._cache[key] = (time.monotonic() + ttl, data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return data
+    
+    def _finished(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # ошибку уже получили ожидающие; не пишем ее в лог asyncio повторно
+    
+    async def _request(self, url, params):
+        self.requests += 1
+        session = await self.get_session()
+        async with session.get(url, params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+    
+    def status(self):
+        """Счетчики запросов к серверам и попаданий в кэш"""
+        return {
+            'requests': self.requests,
+            'cache_hits': self.hits,
+            'coalesced': self.coalesced,
+            'cached': len(self._cache),
+        }
     
     # Новости через NewsAPI
     async def get_news(self, category="technology"):
         """Получение новостей через NewsAPI"""
         try:
             api_key = "your_newsapi_key"  # Зарегистрируйся на newsapi.org
-            url = f"https://newsapi.org/v2/top-headlines?category={category}&language=ru&apiKey={api_key}"
+            params = {'category': category, 'language': 'ru', 'apiKey': api_key}
+            
+            data = await self.fetch_json(self.NEWS_URL, params)
+            articles = data.get('articles', [])[:3]  # Берем 3 статьи
+            
+            news_text = "📰 **Последние новости:**\n\n"
+            for article in articles:
+                title = article.get('title', '')
+                url = article.get('url', '')
+                news_text += f"• {title}\n{url}\n\n"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        articles = data.get('articles', [])[:3]  # Берем 3 статьи
-                        
-                        news_text = "📰 **Последние новости:**\n\n"
-                        for article in articles:
-                            title = article.get('title', '')
-                            url = article.get('url', '')
-                            news_text += f"• {title}\n{url}\n\n"
-                        
-                        return news_text
-                    return "❌ Не удалось получить новости"
+            return news_text
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"News API status {e.status}")
+            return "❌ Не удалось получить новости"
         except Exception as e:
             logger.error(f"News API error: {e}")
             return "❌ Ошибка получения новостей"
@@ -48,16 +126,15 @@ class APIClient:
         """Получение погоды"""
         try:
             api_key = "your_openweather_key"  # Зарегистрируйся на openweathermap.org
-            url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric&lang=ru"
+            params = {'q': city, 'appid': api_key, 'units': 'metric', 'lang': 'ru'}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        temp = data['main']['temp']
-                        description = data['weather'][0]['description']
-                        return f"🌤️ Погода в {city}: {temp}°C, {description}"
-                    return "❌ Не удалось получить погоду"
+            data = await self.fetch_json(self.WEATHER_URL, params)
+            temp = data['main']['temp']
+            description = data['weather'][0]['description']
+            return f"🌤️ Погода в {city}: {temp}°C, {description}"
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"Weather API status {e.status}")
+            return "❌ Не удалось получить погоду"
         except Exception as e:
             logger.error(f"Weather API error: {e}")
             return "❌ Ошибка получения погоды"
@@ -66,12 +143,12 @@ class APIClient:
     async def get_random_fact(self):
         """Получение случайного факта"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get("https://uselessfacts.jsph.pl/api/v2/facts/random?language=ru") as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return f"🤔 Случайный факт: {data.get('text', 'Факт не найден')}"
-                    return "❌ Не удалось получить факт"
+            # Случайный факт не кэшируем - одновременные запросы только объединяются
+            data = await self.fetch_json(self.FACTS_URL, {'language': 'ru'}, ttl=0)
+            return f"🤔 Случайный факт: {data.get('text', 'Факт не найден')}"
+        except aiohttp.ClientResponseError as e:
+            logger.error(f"Random fact API status {e.status}")
+            return "❌ Не удалось получить факт"
         except Exception as e:
             logger.error(f"Random fact API error: {e}")
             return "❌ Ошибка получения факта"
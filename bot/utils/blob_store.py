@@ -0,0 +1,257 @@
+import hashlib
+import os
+import threading
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from bot.core.config import Config
+from bot.utils.database import SessionLocal
+from bot.utils.document_cache import document_cache
+from models.document import Blob, CatalogEntry, CatalogVersion
+
+# Пространство имен общих документов (личные чаты)
+SHARED_NAMESPACE = ''
+
+BLOBS = Blob.__table__
+CATALOG = CatalogEntry.__table__
+VERSIONS = CatalogVersion.__table__
+
+class BlobStore:
+    """Хранилище документов по содержимому.
+
+    Файл лежит один раз под своим SHA-256 (blobs/ab/abcd....pdf), а каталог
+    пространства имен связывает имена документов с хэшами. Одинаковые файлы
+    от разных пользователей и чатов хранятся и разбираются один раз;
+    файл удаляется, когда на него не остается ссылок в каталогах.
+
+    Каталог может менять и другой процесс бота (режим webhook), поэтому
+    кэш каталога сверяется с номером версии в catalog_versions, а изменения
+    пишутся атомарными запросами (upsert, счетчик ссылок через refcount + 1).
+    """
+
+    def __init__(self, blobs_folder=None):
+        self.blobs_folder = blobs_folder or Config.BLOBS_FOLDER
+        self._catalogs = {}  # пространство имен -> (версия, {имя: путь к файлу})
+        self._lock = threading.RLock()
+
+    def blob_path(self, sha256, extension):
+        """Путь к файлу содержимого (расширение нужно для выбора парсера)"""
+        return os.path.join(self.blobs_folder, sha256[:2], sha256 + extension.lower())
+
+    @staticmethod
+    def _version(session, namespace):
+        return session.scalar(select(VERSIONS.c.version).where(VERSIONS.c.namespace == namespace)) or 0
+
+    def _catalog(self, namespace, check=True):
+        """Каталог пространства имен.
+
+        check - сверить версию с БД и перечитать каталог, если его изменил
+        другой процесс; без проверки берется кэш (если он есть).
+        """
+        cached = self._catalogs.get(namespace)
+        if cached is not None and not check:
+            return cached[1]
+        with SessionLocal() as session:
+            # Версию читаем до строк: изменение между запросами только
+            # заставит перечитать каталог в следующий раз
+            version = self._version(session, namespace)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            rows = session.execute(
+                select(CATALOG.c.name, BLOBS.c.sha256, BLOBS.c.extension)
+                .join(BLOBS, BLOBS.c.sha256 == CATALOG.c.sha256)
+                .where(CATALOG.c.namespace == namespace)
+            ).all()
+        catalog = {name: self.blob_path(sha256, extension) for name, sha256, extension in rows}
+        self._catalogs[namespace] = (version, catalog)
+        return catalog
+
+    def _bump(self, session, namespace):
+        """Увеличение версии каталога в транзакции изменения, возвращает новую"""
+        statement = insert(VERSIONS).values(namespace=namespace, version=1)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=['namespace'], set_={'version': VERSIONS.c.version + 1},
+        ))
+        return self._version(session, namespace)
+
+    def _updated(self, namespace, version, change):
+        """Применение своего изменения к кэшу каталога"""
+        cached = self._catalogs.get(namespace)
+        if cached is not None and cached[0] == version - 1:
+            change(cached[1])
+            self._catalogs[namespace] = (version, cached[1])
+        else:
+            # Каталог менял и другой процесс - перечитаем при следующем обращении
+            self._catalogs.pop(namespace, None)
+
+    def names(self, namespace=SHARED_NAMESPACE):
+        """Имена документов пространства имен"""
+        with self._lock:
+            return sorted(self._catalog(namespace))
+
+    def paths(self, namespace=SHARED_NAMESPACE):
+        """{имя документа: путь к файлу содержимого}"""
+        with self._lock:
+            return dict(self._catalog(namespace))
+
+    def path(self, namespace, name):
+        """Путь к содержимому документа или None.
+
+        Вызывается для каждого документа при поиске, поэтому версия каталога
+        здесь не сверяется: список документов поиска получен через names(),
+        который ее проверил.
+        """
+        with self._lock:
+            return self._catalog(namespace, check=False).get(name)
+
+    def find_unique_id(self, unique_id):
+        """Хэш уже загруженного файла Telegram (по file_unique_id) или None"""
+        if not unique_id:
+            return None
+        with SessionLocal() as session:
+            blob = session.query(Blob).filter(Blob.unique_id == unique_id).first()
+            if blob and os.path.exists(self.blob_path(blob.sha256, blob.extension)):
+                return blob.sha256
+        return None
+
+    def put_file(self, tmp_path, sha256, extension):
+        """Перенос скачанного файла в хранилище; если такое содержимое уже есть - файл удаляется"""
+        path = self.blob_path(sha256, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return path
+
+    def add(self, namespace, name, sha256, extension=None, size=0, unique_id=None):
+        """Запись имени в каталог.
+
+        Возвращает (путь, изменился ли документ): повторная загрузка того же
+        содержимого под тем же именем ничего не меняет.
+        """
+        extension = (extension or os.path.splitext(name)[1]).lower()
+        with self._lock, SessionLocal() as session:
+            current = session.scalar(select(CATALOG.c.sha256).where(
+                CATALOG.c.namespace == namespace, CATALOG.c.name == name
+            ))
+            if current == sha256:
+                return self._stored_path(session, sha256), False
+
+            # Одно и то же содержимое может одновременно добавлять другой процесс
+            session.execute(insert(BLOBS).values(
+                sha256=sha256, extension=extension, size=size, refcount=0
+            ).on_conflict_do_nothing(index_elements=['sha256']))
+            values = {'refcount': BLOBS.c.refcount + 1}
+            if unique_id:
+                values['unique_id'] = unique_id
+            session.execute(update(BLOBS).where(BLOBS.c.sha256 == sha256).values(**values))
+
+            # С первой записи транзакция держит блокировку БД - запись каталога
+            # с этим именем, если она появилась, перечитываем уже под ней
+            released = None
+            inserted = session.execute(insert(CATALOG).values(
+                namespace=namespace, name=name, sha256=sha256
+            ).on_conflict_do_nothing(index_elements=['namespace', 'name'])).rowcount
+            if not inserted:
+                previous = session.scalar(select(CATALOG.c.sha256).where(
+                    CATALOG.c.namespace == namespace, CATALOG.c.name == name
+                ))
+                if previous == sha256:
+                    # Тот же файл под этим именем успел записать другой процесс
+                    session.rollback()
+                    return self._stored_path(session, sha256), False
+                # Имя теперь указывает на другое содержимое
+                session.execute(update(CATALOG).where(
+                    CATALOG.c.namespace == namespace, CATALOG.c.name == name
+                ).values(sha256=sha256))
+                released = self._release(session, previous)
+
+            version = self._bump(session, namespace)
+            path = self._stored_path(session, sha256)
+            session.commit()
+            self._updated(namespace, version, lambda catalog: catalog.__setitem__(name, path))
+        self._delete_blob(released)
+        return path, True
+
+    def _stored_path(self, session, sha256):
+        """Путь к содержимому с расширением, под которым оно записано"""
+        extension = session.scalar(select(BLOBS.c.extension).where(BLOBS.c.sha256 == sha256))
+        return self.blob_path(sha256, extension or '')
+
+    def _release(self, session, sha256):
+        """Уменьшение счетчика ссылок; возвращает путь файла, если ссылок не осталось"""
+        session.execute(update(BLOBS).where(BLOBS.c.sha256 == sha256).values(refcount=BLOBS.c.refcount - 1))
+        blob = session.execute(
+            select(BLOBS.c.refcount, BLOBS.c.extension).where(BLOBS.c.sha256 == sha256)
+        ).first()
+        if blob is None or blob.refcount > 0:
+            return None
+        session.execute(delete(BLOBS).where(BLOBS.c.sha256 == sha256))
+        return self.blob_path(sha256, blob.extension)
+
+    def _delete_blob(self, path):
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        document_cache.invalidate(path)
+
+    def remove(self, namespace, name):
+        """Удаление имени из каталога (содержимое - если на него больше нет ссылок)"""
+        with self._lock, SessionLocal() as session:
+            previous = session.execute(delete(CATALOG).where(
+                CATALOG.c.namespace == namespace, CATALOG.c.name == name
+            ).returning(CATALOG.c.sha256)).scalar()
+            if previous is None:
+                return False
+            released = self._release(session, previous)
+            version = self._bump(session, namespace)
+            session.commit()
+            self._updated(namespace, version, lambda catalog: catalog.pop(name, None))
+        self._delete_blob(released)
+        return True
+
+    def clear(self, namespace=SHARED_NAMESPACE):
+        """Удаление всех документов пространства имен"""
+        with self._lock, SessionLocal() as session:
+            hashes = session.execute(
+                delete(CATALOG).where(CATALOG.c.namespace == namespace).returning(CATALOG.c.sha256)
+            ).scalars().all()
+            released = [self._release(session, sha256) for sha256 in hashes]
+            version = self._bump(session, namespace)
+            session.commit()
+            self._updated(namespace, version, lambda catalog: catalog.clear())
+        for path in released:
+            self._delete_blob(path)
+
+    def import_folder(self, namespace, folder):
+        """Перенос в хранилище обычных файлов, лежащих в папке (загруженных до каталога).
+
+        Файлы перемещаются, а не копируются: в папке их больше нет, документ
+        живет только в каталоге. Иначе при каждом запуске они импортировались
+        бы заново, а документы, удаленные через бота, возвращались бы.
+        """
+        if not os.path.isdir(folder):
+            return 0
+        imported = 0
+        for name in os.listdir(folder):
+            file_path = os.path.join(folder, name)
+            extension = os.path.splitext(name)[1].lower()
+            if not os.path.isfile(file_path) or extension not in Config.ALLOWED_EXTENSIONS:
+                continue
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(Config.DOWNLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            size = os.path.getsize(file_path)
+            sha256 = digest.hexdigest()
+            self.put_file(file_path, sha256, extension)
+            self.add(namespace, name, sha256, extension, size)
+            document_cache.invalidate(file_path)
+            imported += 1
+        return imported
+
+# Глобальное хранилище документов
+blob_store = BlobStore()
@@ -0,0 +1,191 @@
+import mmap
+import os
+import re
+from array import array
+import numpy as np
+from bot.core.config import Config
+from bot.utils.search_index import BaseIndex
+from bot.utils.trigram_index import normalize
+
+# Нормализованный текст хранится в UTF-16-LE: символ = 2 байта, поэтому
+# смещение в байтах переводится в позицию делением, без декодирования
+ENCODING = 'utf-16-le'
+CHAR_SIZE = 2
+
+# Символы вне BMP заняли бы в UTF-16 два места - заменяем их одним
+ASTRAL = re.compile('[\U00010000-\U0010FFFF]')
+
+def corpus_text(text):
+    """Текст для корпуса: общая нормализация поиска, позиции символов не меняются"""
+    return ASTRAL.sub('\ufffd', normalize(text))
+
+def normalize_query(query):
+    """Запрос в виде байтов нормализованного корпуса"""
+    return corpus_text(query).encode(ENCODING)
+
+# Отображения файла корпуса в процессе: путь -> ((inode, размер), mmap)
+_mapped = {}
+
+def open_blob(blob_path):
+    """Файл корпуса, отображенный в память (переоткрывается, если файл изменился)"""
+    stat = os.stat(blob_path)
+    key = (stat.st_ino, stat.st_size)
+    cached = _mapped.get(blob_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    with open(blob_path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _mapped[blob_path] = (key, data)
+    return data
+
+def scan(data, query, start, end, max_matches=None):
+    """Вхождения нормализованного запроса в data[start:end]: [(начало, конец), ...].
+
+    data - отображенный в память корпус; поиск идет прямо по его байтам,
+    без копирования и приведения к нижнему регистру. Позиции возвращаются
+    в символах документа (нормализация их не сдвигает).
+    """
+    spans = []
+    if not query:
+        return spans
+    pos = data.find(query, start, end)
+    while pos != -1 and (max_matches is None or len(spans) < max_matches):
+        if (pos - start) % CHAR_SIZE == 0:
+            first = (pos - start) // CHAR_SIZE
+            spans.append((first, first + len(query) // CHAR_SIZE))
+        pos = data.find(query, pos + 1, end)
+    return spans
+
+class CorpusStore(BaseIndex):
+    """Нормализованный текст всех документов в одном файле.
+
+    Файл только дописывается; таблица offsets (начало и конец в файле на
+    id документа) читается как массив NumPy. Удаленные документы остаются
+    в файле, пока их доля не превысит половину - тогда файл переписывается.
+    """
+
+    # v2: нормализация как у триграммного индекса, без схлопывания пробелов
+    INDEX_FILE = 'corpus_v2.pkl'
+    BLOB_FILE = 'corpus_v2.bin'
+    LEGACY_FILES = ('corpus.pkl', 'corpus.bin')
+    STATE_FIELDS = BaseIndex.STATE_FIELDS + ('offsets', 'blob_size', 'dead_bytes')
+    ROW = 2
+
+    def __init__(self, index_folder=None):
+        self.blob_path = os.path.join(index_folder or Config.INDEX_FOLDER, self.BLOB_FILE)
+        super().__init__(index_folder)
+
+    def _reset(self):
+        super()._reset()
+        self.offsets = array('q')  # id документа -> начало и конец в файле
+        self.blob_size = 0         # байт в файле (хвост после сбоя отбрасывается)
+        self.dead_bytes = 0        # байт удаленных документов
+
+    def load(self):
+        super().load()
+        # Корпус прежнего формата собирается заново под новыми именами файлов
+        for name in self.LEGACY_FILES:
+            try:
+                os.remove(os.path.join(os.path.dirname(self.blob_path), name))
+            except OSError:
+                pass
+        try:
+            blob_size = os.path.getsize(self.blob_path)
+        except OSError:
+            blob_size = 0
+        if blob_size < self.blob_size:
+            print("Файл корпуса короче индекса, корпус будет собран заново")
+            with self._lock:
+                self._reset()
+
+    def add_document(self, doc_name, text, signature=None, path=None):
+        """Добавление (или замена) документа: дописывается в конец файла"""
+        data = corpus_text(text).encode(ENCODING)
+
+        with self._lock:
+            doc_id = self._register(doc_name, signature, len(text), path)
+            os.makedirs(os.path.dirname(self.blob_path), exist_ok=True)
+            with open(self.blob_path, 'r+b' if os.path.exists(self.blob_path) else 'wb') as f:
+                f.seek(self.blob_size)
+                f.write(data)
+                f.truncate()
+
+            self._set_row(doc_id, [self.blob_size, self.blob_size + len(data)])
+            self.blob_size += len(data)
+
+    def _set_row(self, doc_id, row):
+        missing = (doc_id + 1) * self.ROW - len(self.offsets)
+        if missing > 0:
+            self.offsets.extend([0] * missing)
+        self.offsets[doc_id * self.ROW:(doc_id + 1) * self.ROW] = array('q', row)
+
+    def _copy(self, doc_name, source_id):
+        # Новый документ ссылается на те же байты файла
+        source = self.docs[source_id]
+        row = self.offsets[source_id * self.ROW:(source_id + 1) * self.ROW]
+        doc_id = self._register(doc_name, source['signature'], source['length'], source['path'])
+        self._set_row(doc_id, row)
+
+    def _remove(self, doc_name):
+        """Удаление документа (его байты остаются в файле до сжатия)"""
+        doc = self.docs.get(self.doc_ids.get(doc_name))
+        doc_id = self._unregister(doc_name)
+        if doc_id is None:
+            return False
+        if not (doc.get('path') and self._sources().get(doc['path'])):
+            # Байты общие с документами того же содержимого, пока те живы
+            start, end = self.offsets[doc_id * self.ROW:doc_id * self.ROW + 2]
+            self.dead_bytes += end - start
+        return True
+
+    def offsets_table(self):
+        """Таблица смещений как массив NumPy (без копирования)"""
+        return np.frombuffer(self.offsets, dtype=np.int64).reshape(-1, self.ROW)
+
+    def locate(self, doc_name):
+        """Аргументы для scan по документу: (путь к файлу, начало, конец).
+
+        None - если документа нет в корпусе.
+        """
+        with self._lock:
+            doc_id = self.doc_ids.get(doc_name)
+            if doc_id is None:
+                return None
+            start, end = self.offsets[doc_id * self.ROW:(doc_id + 1) * self.ROW]
+            return self.blob_path, start, end
+
+    def save(self):
+        with self._lock:
+            if self.dead_bytes and self.dead_bytes * 2 > self.blob_size:
+                self._compact()
+        return super().save()
+
+    def _compact(self):
+        """Перезапись файла только с живыми документами"""
+        try:
+            table = self.offsets_table().copy()
+            tmp_path = self.blob_path + '.tmp'
+            position = 0
+            moved = {}  # старая строка -> новая (документы с одним содержимым)
+            with open(self.blob_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                for doc_id in sorted(self.docs):
+                    row = tuple(int(value) for value in table[doc_id])
+                    if row in moved:
+                        table[doc_id] = moved[row]
+                        continue
+                    start, end = row
+                    src.seek(start)
+                    dst.write(src.read(end - start))
+                    table[doc_id] = moved[row] = (position, position + end - start)
+                    position += end - start
+            os.replace(tmp_path, self.blob_path)
+            self.offsets = array('q', table.ravel().tolist())
+            self.blob_size = position
+            self.dead_bytes = 0
+        except Exception as e:
+            print(f"Ошибка сжатия корпуса: {e}")
+
+# Глобальный экземпляр корпуса
+corpus_store = CorpusStore()
@@ -1,16 +1,56 @@
-from sqlalchemy import create_engine
+from sqlalchemy import DateTime, bindparam, create_engine, event, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from models.user import User, Base
+from models.document import Blob, CatalogEntry, CatalogVersion
+from models.fsm import FSMRecord
 from bot.core.config import Config
-import datetime
+from bot.utils.user_cache import UserRecord, user_cache
 
-# Создаем движок БД
+# Настройки соединения SQLite: WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не теряет целостность при сбое
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={Config.DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size=-20000",  # 20 МБ страничного кэша на соединение
+    "PRAGMA temp_store=MEMORY",
+)
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+# Синхронный движок - для кода, который работает в потоках (FTS5, каталог файлов)
 engine = create_engine(Config.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def create_tables():
+# Асинхронный движок (aiosqlite) - для обработчиков, не блокирует цикл событий.
+# По умолчанию aiosqlite открывает соединение на каждую сессию - держим пул
+async_engine = create_async_engine(
+    Config.ASYNC_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_POOL_SIZE,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+event.listen(engine, "connect", _apply_pragmas)
+event.listen(async_engine.sync_engine, "connect", _apply_pragmas)
+
+async def create_tables():
     """Создание таблиц в базе данных"""
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def close_db():
+    """Закрытие соединений с базой данных"""
+    await async_engine.dispose()
+    engine.dispose()
 
 def get_db():
     """Получение сессии базы данных"""
@@ -21,53 +61,85 @@ def get_db():
         db.close()
 
 async def get_user(user_id: int, username: str = None, full_name: str = None):
-    """Получить или создать пользователя"""
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.user_id == str(user_id)).first()
-        if not user:
-            user = User(
-                user_id=str(user_id),
-                username=username,
-                full_name=full_name
-            )
-            session.add(user)
-            session.commit()
-            session.refresh(user)
-        return user
+    """Получить или создать пользователя (UserRecord; частые пользователи - из кэша)"""
+    record = user_cache.get(user_id)
+    if record is not None:
+        return record
 
-async def update_user_activity(user_id: int):
-    """Обновить время последней активности"""
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.user_id == str(user_id)).first()
+    generation = user_cache.generation
+    async with AsyncSessionLocal() as session:
+        user = await session.scalar(select(User).where(User.user_id == str(user_id)))
         if user:
-            user.last_activity = datetime.datetime.utcnow()
-            session.commit()
+            return _cache_user(user, generation)
 
-async def increment_documents_count(user_id: int):
-    """Увеличить счетчик загруженных документов"""
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.user_id == str(user_id)).first()
-        if user:
-            user.documents_uploaded += 1
-            session.commit()
+        user = User(
+            user_id=str(user_id),
+            username=username,
+            full_name=full_name
+        )
+        session.add(user)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Пользователя параллельно создал другой апдейт
+            await session.rollback()
+            user = await session.scalar(select(User).where(User.user_id == str(user_id)))
+            return _cache_user(user, generation)
+        await session.refresh(user)
+        return _cache_user(user, generation)
 
-async def increment_searches_count(user_id: int):
-    """Увеличить счетчик поисков"""
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.user_id == str(user_id)).first()
-        if user:
-            user.searches_performed += 1
-            session.commit()
+def _cache_user(user, generation=None):
+    record = UserRecord.from_model(user)
+    user_cache.put(record, generation)
+    return record
+
+async def apply_user_deltas(rows):
+    """Запись накопленных счетчиков активности одной транзакцией.
+
+    rows - словари user_id, documents, searches, last_activity (None - не менять).
+    Все строки уходят одним executemany.
+    """
+    if not rows:
+        return
+    users = User.__table__
+    statement = (
+        users.update()
+        .where(users.c.user_id == bindparam('uid'))
+        .values(
+            documents_uploaded=users.c.documents_uploaded + bindparam('documents'),
+            searches_performed=users.c.searches_performed + bindparam('searches'),
+            last_activity=func.coalesce(bindparam('active_at', type_=DateTime), users.c.last_activity),
+        )
+    )
+    params = [
+        {'uid': str(row['user_id']), 'documents': row['documents'],
+         'searches': row['searches'], 'active_at': row['last_activity']}
+        for row in rows
+    ]
+    user_cache.begin_update()
+    try:
+        async with async_engine.begin() as conn:
+            await conn.execute(statement, params)
+        # Кэш обновляется вместе с БД
+        for row in rows:
+            user_cache.add_counters(row['user_id'], row['documents'], row['searches'], row['last_activity'])
+    finally:
+        user_cache.end_update()
 
 async def get_user_stats(user_id: int):
     """Получить статистику пользователя"""
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.user_id == str(user_id)).first()
-        if user:
-            return {
-                'documents_uploaded': user.documents_uploaded,
-                'searches_performed': user.searches_performed,
-                'created_at': user.created_at,
-                'last_activity': user.last_activity
-            }
-        return None
\ No newline at end of file
+    user = user_cache.get(user_id)
+    if user is None:
+        generation = user_cache.generation
+        async with AsyncSessionLocal() as session:
+            user = await session.scalar(select(User).where(User.user_id == str(user_id)))
+            if user:
+                user = _cache_user(user, generation)
+    if user:
+        return {
+            'documents_uploaded': user.documents_uploaded,
+            'searches_performed': user.searches_performed,
+            'created_at': user.created_at,
+            'last_activity': user.last_activity
+        }
+    return None
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from pathlib import Path
+from bot.core.config import Config
+from bot.utils.document_parser import DocumentParser
+
+# Части документа (страницы и т.п.) склеиваются в один текст через этот символ
+SEGMENT_SEPARATOR = '\n'
+
+class DocumentText:
+    """Текст документа, который читается из дискового кэша по частям.
+
+    Поддерживает len() и срезы text[a:b] как обычная строка, но с диска
+    читаются и декодируются только затронутые части (например, страницы PDF).
+    """
+
+    def __init__(self, text_path, segments, length, text=None, max_cached=16):
+        self.text_path = text_path
+        self.segments = segments  # [(смещение в символах, смещение в байтах, метка), ...]
+        self.length = length
+        self._text = text         # весь текст, если дисковый кэш недоступен
+        self._starts = [segment[0] for segment in segments]
+        self._cache = OrderedDict()
+        self._max_cached = max_cached
+
+    def __len__(self):
+        return self.length
+
+    def _segment_end(self, i):
+        """Смещение в байтах после i-й части (None - до конца файла)"""
+        return self.segments[i + 1][1] if i + 1 < len(self.segments) else None
+
+    def _read_bytes(self, start, end):
+        with open(self.text_path, 'rb') as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start)
+
+    def _read_segment(self, i):
+        """Текст i-й части (вместе с разделителем после нее)"""
+        text = self._cache.get(i)
+        if text is not None:
+            self._cache.move_to_end(i)
+            return text
+
+        text = self._read_bytes(self.segments[i][1], self._segment_end(i)).decode('utf-8')
+
+        self._cache[i] = text
+        if len(self._cache) > self._max_cached:
+            self._cache.popitem(last=False)
+        return text
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            index = key + self.length if key < 0 else key
+            if not 0 <= index < self.length:
+                raise IndexError("индекс за пределами текста")
+            return self[index:index + 1]
+
+        start, stop, step = key.indices(self.length)
+        if step != 1:
+            raise ValueError("поддерживаются только срезы с шагом 1")
+        if start >= stop:
+            return ""
+        if self._text is not None:
+            return self._text[start:stop]
+
+        first = bisect_right(self._starts, start) - 1
+        last = bisect_right(self._starts, stop - 1) - 1
+        if first == last:
+            text = self._read_segment(first)
+        else:
+            # Много мелких частей (ячейки, абзацы) читаем одним куском
+            text = self._read_bytes(self.segments[first][1], self._segment_end(last)).decode('utf-8')
+        base = self._starts[first]
+        return text[start - base:stop - base]
+
+    def locate(self, position):
+        """Метка части документа, в которой находится позиция (или None)"""
+        i = bisect_right(self._starts, position) - 1
+        if i < 0:
+            return None
+        return self.segments[i][2]
+
+class DocumentCache:
+    """Кэш извлеченного текста документов: LRU в памяти + файлы на диске"""
+
+    def __init__(self, cache_folder=None, max_chars=None):
+        self.cache_folder = Path(cache_folder or Config.CACHE_FOLDER) / 'text'
+        self.max_chars = max_chars or Config.TEXT_CACHE_MAX_CHARS
+        self._memory = OrderedDict()  # путь -> (сигнатура, текст)
+        self._memory_chars = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(file_path):
+        """Сигнатура файла: время изменения и размер"""
+        stat = os.stat(file_path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _cache_paths(self, file_path):
+        """Пути к файлам кэша для документа"""
+        key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+        return self.cache_folder / f"{key}.json", self.cache_folder / f"{key}.txt"
+
+    def get_text(self, file_path):
+        """Получение текста документа (парсинг только при изменении файла)"""
+        if not os.path.exists(file_path):
+            return ""
+
+        path = os.path.abspath(file_path)
+        signature = self.signature(path)
+
+        with self._lock:
+            cached = self._memory.get(path)
+            if cached and cached[0] == signature:
+                self._memory.move_to_end(path)
+                return cached[1]
+
+        meta = self._ensure_on_disk(path, signature)
+        text = None
+        if meta is not None:
+            text = self._read_text(path)
+        if text is None:
+            # Дисковый кэш недоступен - разбираем документ в памяти
+            text = SEGMENT_SEPARATOR.join(part for _, part in DocumentParser.iter_segments(path))
+
+        self._remember(path, signature, text)
+        return text
+
+    def open_text(self, file_path):
+        """Текст документа с чтением по частям и метками мест (DocumentText).
+
+        В отличие от get_text не держит в памяти весь документ: нужен для
+        фрагментов результатов и проверки кандидатов поиска.
+        """
+        if not os.path.exists(file_path):
+            return DocumentText(None, [], 0, text="")
+
+        path = os.path.abspath(file_path)
+        signature = self.signature(path)
+        meta = self._ensure_on_disk(path, signature)
+        if meta is None:
+            text = self.get_text(path)
+            return DocumentText(None, [(0, 0, None)], len(text), text=text)
+
+        _, text_path = self._cache_paths(path)
+        return DocumentText(text_path, [tuple(segment) for segment in meta['segments']], meta['length'])
+
+    def _remember(self, path, signature, text):
+        """Добавление текста в память с вытеснением давно не используемых"""
+        with self._lock:
+            old = self._memory.pop(path, None)
+            if old:
+                self._memory_chars -= len(old[1])
+
+            # Слишком большие документы держим только на диске
+            if len(text) > self.max_chars:
+                return
+
+            self._memory[path] = (signature, text)
+            self._memory_chars += len(text)
+
+            while self._memory_chars > self.max_chars:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_chars -= len(evicted)
+
+    def _load_meta(self, path, signature):
+        """Описание текста в дисковом кэше, если он актуален"""
+        meta_path, _ = self._cache_paths(path)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('signature') != signature or 'segments' not in meta:
+                return None
+            return meta
+        except (OSError, ValueError):
+            return None
+
+    def _ensure_on_disk(self, path, signature):
+        """Описание текста в дисковом кэше; документ разбирается, если кэш устарел"""
+        meta = self._load_meta(path, signature)
+        if meta is None:
+            meta = self._save_to_disk(path, signature)
+        return meta
+
+    def _read_text(self, path):
+        """Чтение всего текста из дискового кэша"""
+        _, text_path = self._cache_paths(path)
+        try:
+            with open(text_path, 'r', encoding='utf-8', newline='') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _save_to_disk(self, path, signature):
+        """Разбор документа с записью текста в дисковый кэш по частям.
+
+        Части пишутся по мере извлечения, поэтому весь текст в памяти
+        не собирается. Возвращает описание текста или None при ошибке.
+        """
+        meta_path, text_path = self._cache_paths(path)
+        try:
+            self.cache_folder.mkdir(parents=True, exist_ok=True)
+
+            # Пишем во временные файлы и атомарно подменяем
+            segments = []
+            chars = 0
+            tmp_text = text_path.with_suffix('.txt.tmp')
+            with open(tmp_text, 'wb') as f:
+                for label, part in DocumentParser.iter_segments(path):
+                    if segments:
+                        f.write(SEGMENT_SEPARATOR.encode('utf-8'))
+                        chars += len(SEGMENT_SEPARATOR)
+                    segments.append([chars, f.tell(), label])
+                    f.write(part.encode('utf-8'))
+                    chars += len(part)
+            if not segments:
+                segments.append([0, 0, None])
+            os.replace(tmp_text, text_path)
+
+            meta = {'path': path, 'signature': signature, 'length': chars, 'segments': segments}
+            tmp_meta = meta_path.with_suffix('.json.tmp')
+            with open(tmp_meta, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_meta, meta_path)
+            return meta
+        except Exception as e:
+            print(f"Ошибка записи кэша текста: {e}")
+            return None
+
+    def invalidate(self, file_path):
+        """Сброс кэша документа (например, при перезаписи файла)"""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            old = self._memory.pop(path, None)
+            if old:
+                self._memory_chars -= len(old[1])
+
+        for cache_path in self._cache_paths(path):
+            try:
+                os.remove(cache_path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Ошибка удаления кэша: {e}")
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_chars = 0
+
+        try:
+            if self.cache_folder.exists():
+                for cache_file in self.cache_folder.iterdir():
+                    if cache_file.is_file():
+                        cache_file.unlink()
+        except Exception as e:
+            print(f"Ошибка очистки кэша: {e}")
+
+# Глобальный экземпляр кэша
+document_cache = DocumentCache()
@@ -1,8 +1,22 @@
 from PyPDF2 import PdfReader
-from docx import Document
+from openpyxl import load_workbook
+import xml.etree.ElementTree as ET
 import pandas as pd
+import zipfile
 import os
 import re
+from bot.utils.mapped_text import detect_encoding
+
+# Пространство имен WordprocessingML в тегах document.xml
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Части DOCX кроме основного текста: (шаблон имени, метка места)
+DOCX_EXTRA_PARTS = [
+    (re.compile(r'word/header\d*\.xml'), "верхний колонтитул"),
+    (re.compile(r'word/footer\d*\.xml'), "нижний колонтитул"),
+    (re.compile(r'word/footnotes\.xml'), "сноска"),
+    (re.compile(r'word/endnotes\.xml'), "концевая сноска"),
+]
 
 class DocumentParser:
     """Класс для извлечения текста из разных форматов документов"""
@@ -11,63 +25,159 @@ class DocumentParser:
     def parse_text(file_path):
         """Чтение обычных текстовых файлов (.txt)"""
         try:
-            # Пробуем разные кодировки
-            encodings = ['utf-8', 'cp1251', 'windows-1251', 'latin-1']
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        return f.read()
-                except UnicodeDecodeError:
-                    continue
-            # Если ни одна кодировка не подошла, читаем как бинарный
-            with open(file_path, 'rb') as f:
-                return f.read().decode('utf-8', errors='ignore')
+            # Кодировка определяется один раз по началу файла
+            with open(file_path, 'r', encoding=detect_encoding(file_path), errors='replace') as f:
+                return f.read()
         except Exception as e:
             print(f"Ошибка чтения TXT: {e}")
             return ""
 
     @staticmethod
-    def parse_pdf(file_path):
-        """Извлечение текста из PDF"""
-        text = ""
+    def iter_pdf_pages(file_path):
+        """Страницы PDF по одной: (номер страницы, текст).
+
+        Страницы читаются лениво, поэтому весь документ в памяти не собирается.
+        """
         try:
             reader = PdfReader(file_path)
-            # Ограничим количество страниц для больших файлов
-            max_pages = min(50, len(reader.pages))
-            for i in range(max_pages):
-                page = reader.pages[i]
-                text += page.extract_text() or ""
+            for number, page in enumerate(reader.pages, 1):
+                yield number, page.extract_text() or ""
         except Exception as e:
             print(f"Ошибка чтения PDF: {e}")
-        return text
+
+    @classmethod
+    def parse_pdf(cls, file_path):
+        """Извлечение текста из PDF (все страницы)"""
+        return '\n'.join(text for _, text in cls.iter_pdf_pages(file_path))
 
     @staticmethod
-    def parse_docx(file_path):
-        """Чтение документов Word"""
+    def _iter_docx_part(stream, kind=None):
+        """Абзацы одной XML-части DOCX: (место, текст).
+
+        XML разбирается потоково (iterparse), обработанные абзацы сразу
+        очищаются. kind - метка колонтитулов и сносок, для основного
+        текста места считаются по абзацам и ячейкам таблиц.
+        """
+        paragraph_no = 0
+        table_no = 0
+        tables = []       # [строка, ячейка] для каждой открытой таблицы
+        paragraphs = []   # куски текста открытых абзацев (абзацы бывают вложенными)
+        note_id = None
+
+        for event, elem in ET.iterparse(stream, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                if tag == W + 'p':
+                    paragraphs.append([])
+                elif tag == W + 'tbl':
+                    if not tables:
+                        table_no += 1
+                    tables.append([0, 0])
+                elif tag == W + 'tr' and tables:
+                    tables[-1] = [tables[-1][0] + 1, 0]
+                elif tag == W + 'tc' and tables:
+                    tables[-1][1] += 1
+                elif tag in (W + 'footnote', W + 'endnote'):
+                    note_id = elem.get(W + 'id')
+                continue
+
+            if tag == W + 't' and paragraphs:
+                paragraphs[-1].append(elem.text or "")
+            elif tag == W + 'tab' and paragraphs:
+                paragraphs[-1].append('\t')
+            elif tag in (W + 'br', W + 'cr') and paragraphs:
+                paragraphs[-1].append('\n')
+            elif tag == W + 'tbl':
+                tables.pop()
+            elif tag == W + 'p':
+                text = ''.join(paragraphs.pop())
+                elem.clear()
+                if not text.strip():
+                    continue
+
+                if kind is not None:
+                    location = f"{kind} {note_id}" if note_id is not None else kind
+                elif tables:
+                    row, cell = tables[-1]
+                    location = f"табл. {table_no}, стр. {row}, кол. {cell}"
+                else:
+                    paragraph_no += 1
+                    location = f"абз. {paragraph_no}"
+                yield location, text
+
+    @classmethod
+    def iter_docx_paragraphs(cls, file_path):
+        """Абзацы DOCX по одной: (место, текст).
+
+        Читается XML прямо из архива: основной текст с таблицами,
+        колонтитулы и сноски, без построения модели python-docx.
+        """
         try:
-            doc = Document(file_path)
-            full_text = []
-            for para in doc.paragraphs:
-                full_text.append(para.text)
-            return '\n'.join(full_text)
+            with zipfile.ZipFile(file_path) as archive:
+                names = sorted(archive.namelist())
+                parts = [('word/document.xml', None)]
+                for pattern, kind in DOCX_EXTRA_PARTS:
+                    parts.extend((name, kind) for name in names if pattern.fullmatch(name))
+
+                for name, kind in parts:
+                    if name in names:
+                        with archive.open(name) as stream:
+                            yield from cls._iter_docx_part(stream, kind)
         except Exception as e:
             print(f"Ошибка чтения DOCX: {e}")
-            return ""
+
+    @classmethod
+    def parse_docx(cls, file_path):
+        """Чтение документов Word (текст, таблицы, колонтитулы, сноски)"""
+        return '\n'.join(text for _, text in cls.iter_docx_paragraphs(file_path))
 
     @staticmethod
-    def parse_excel(file_path):
+    def _cell_text(value):
+        """Значение ячейки в текст (целые числа без .0)"""
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value).strip()
+
+    @classmethod
+    def iter_xlsx_cells(cls, file_path):
+        """Непустые ячейки XLSX по одной: (адрес "Лист1!C42", текст).
+
+        Книга открывается в режиме read_only: строки читаются потоком
+        за один проход по файлу, без загрузки всех листов в память.
+        """
+        try:
+            workbook = load_workbook(file_path, read_only=True, data_only=True)
+        except Exception as e:
+            print(f"Ошибка чтения Excel: {e}")
+            return
+
+        try:
+            for sheet in workbook.worksheets:
+                for row in sheet.iter_rows():
+                    for cell in row:
+                        if cell.value is None:
+                            continue
+                        text = cls._cell_text(cell.value)
+                        if text:
+                            yield f"{sheet.title}!{cell.coordinate}", text
+        except Exception as e:
+            print(f"Ошибка чтения Excel: {e}")
+        finally:
+            workbook.close()
+
+    @classmethod
+    def parse_excel(cls, file_path):
         """Обработка Excel файлов"""
+        if os.path.splitext(file_path)[1].lower() == '.xlsx':
+            return '\n'.join(text for _, text in cls.iter_xlsx_cells(file_path))
+
         try:
-            # Читаем все листы
-            excel_file = pd.ExcelFile(file_path)
-            all_sheets_text = []
-            
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                sheet_text = f"--- Лист: {sheet_name} ---\n{df.to_string()}\n"
-                all_sheets_text.append(sheet_text)
-                
-            return '\n'.join(all_sheets_text)
+            # Старый формат .xls читает только pandas: все листы за одно чтение файла
+            sheets = pd.read_excel(file_path, sheet_name=None)
+            return '\n'.join(
+                f"--- Лист: {sheet_name} ---\n{df.to_string()}\n"
+                for sheet_name, df in sheets.items()
+            )
         except Exception as e:
             print(f"Ошибка чтения Excel: {e}")
             return ""
@@ -93,6 +203,24 @@ class DocumentParser:
             print(f"Неподдерживаемый формат: {ext}")
             return ""
 
+    @classmethod
+    def iter_segments(cls, file_path):
+        """Части документа по порядку: (метка места или None, текст).
+
+        Метка (например "стр. 12") показывается рядом с найденным фрагментом.
+        Части склеиваются через перевод строки.
+        """
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext == '.pdf':
+            for number, text in cls.iter_pdf_pages(file_path):
+                yield f"стр. {number}", text
+        elif ext == '.docx':
+            yield from cls.iter_docx_paragraphs(file_path)
+        elif ext == '.xlsx':
+            yield from cls.iter_xlsx_cells(file_path)
+        else:
+            yield None, cls.parse_file(file_path)
+
     @staticmethod
     def find_with_context(text, query, context_size=100):
         """Найти запрос в тексте и вернуть контекст"""
@@ -149,7 +277,38 @@ class DocumentParser:
             return "Ошибка при извлечении контекста"
     
     @staticmethod
-    def find_all_matches(text, query, max_matches=3, context_size=80):
+    def format_match(text, start, end, context_size=80):
+        """Оформить найденный фрагмент text[start:end] с контекстом"""
+        # Вычисляем границы контекста
+        start_context = max(0, start - context_size)
+        end_context = min(len(text), end + context_size)
+        
+        # Форматируем вывод
+        before_match = text[start_context:start]
+        match_text = text[start:end]
+        after_match = text[end:end_context]
+        
+        # Добавляем многоточия если обрезано
+        if start_context > 0:
+            before_match = "..." + before_match
+        if end_context < len(text):
+            after_match = after_match + "..."
+        
+        formatted_match = f"{before_match}>>> {match_text.upper()} <<<{after_match}"
+        return formatted_match.strip()
+    
+    @classmethod
+    def format_matches(cls, text, spans, max_matches=3, context_size=80):
+        """Оформить готовые позиции совпадений (start, end) с контекстом"""
+        try:
+            return [cls.format_match(text, start, end, context_size)
+                    for start, end in spans[:max_matches]]
+        except Exception as e:
+            print(f"Ошибка оформления совпадений: {e}")
+            return ["Ошибка при поиске совпадений"]
+    
+    @classmethod
+    def find_all_matches(cls, text, query, max_matches=3, context_size=80):
         """Найти все вхождения запроса с контекстом"""
         try:
             text_lower = text.lower()
@@ -164,30 +323,7 @@ class DocumentParser:
                 if pos == -1:
                     break
                 
-                # Вычисляем границы контекста
-                start_context = max(0, pos - context_size)
-                end_context = min(len(text), pos + len(query) + context_size)
-                
-                # Извлекаем контекст
-                context = text[start_context:end_context]
-                
-                # Добавляем указатель на найденный текст
-                query_start_in_context = pos - start_context
-                query_end_in_context = query_start_in_context + len(query)
-                
-                # Форматируем вывод
-                before_match = context[:query_start_in_context]
-                match_text = context[query_start_in_context:query_end_in_context]
-                after_match = context[query_end_in_context:]
-                
-                # Добавляем многоточия если обрезано
-                if start_context > 0:
-                    before_match = "..." + before_match
-                if end_context < len(text):
-                    after_match = after_match + "..."
-                
-                formatted_match = f"{before_match}>>> {match_text.upper()} <<<{after_match}"
-                matches.append(formatted_match.strip())
+                matches.append(cls.format_match(text, pos, pos + len(query), context_size))
                 
                 match_count += 1
                 start = pos + 1
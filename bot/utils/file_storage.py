@@ -1,55 +1,87 @@
+import asyncio
+import hashlib
 import os
+import uuid
+import aiofiles
+import aiofiles.os
 from bot.core.config import Config
+from bot.utils.blob_store import blob_store, SHARED_NAMESPACE
+from bot.utils.search_engine import search_engine
 
 class FileStorage:
-    """Класс для работы с файлами на диске"""
-    
+    """Класс для работы с файлами документов.
+
+    Содержимое хранится в blob_store под своим SHA-256, а имена документов -
+    в каталоге пространства имен (общем или чата).
+    """
+
     @staticmethod
-    def save_file(file_id, file_name, file_data):
-        """Сохранение загруженного файла"""
+    def save_known(file_name, unique_id, namespace=SHARED_NAMESPACE):
+        """Добавление файла, который уже есть в хранилище (по file_unique_id Telegram).
+
+        Ничего не скачивается и не пишется. Возвращает (путь, sha256, изменился
+        ли документ) или None, если такого файла еще не загружали.
+        """
+        sha256 = blob_store.find_unique_id(unique_id)
+        if sha256 is None:
+            return None
+        path, changed = blob_store.add(namespace, file_name, sha256, unique_id=unique_id)
+        return path, sha256, changed
+
+    @staticmethod
+    async def save_stream(file_name, chunks, max_size=None, namespace=SHARED_NAMESPACE, unique_id=None):
+        """Потоковое сохранение файла: куски пишутся во временный файл и хэшируются
+        на лету, затем файл переносится в хранилище под своим хэшем (если такого
+        содержимого там еще нет) и его имя записывается в каталог.
+
+        chunks - асинхронный итератор байтов. Возвращает (путь, sha256, изменился
+        ли документ) или None.
+        """
+        max_size = max_size or Config.MAX_FILE_SIZE
+        extension = os.path.splitext(file_name)[1].lower()
+        tmp_path = os.path.join(blob_store.blobs_folder, f"{uuid.uuid4().hex}.part")
         try:
-            # Создаем папку, если ее нет
-            if not os.path.exists(Config.DOCS_FOLDER):
-                os.makedirs(Config.DOCS_FOLDER)
-            
-            # Полный путь к файлу
-            file_path = os.path.join(Config.DOCS_FOLDER, file_name)
-            
-            # Сохраняем файл
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
-            
-            return file_path
+            await aiofiles.os.makedirs(blob_store.blobs_folder, exist_ok=True)
+
+            digest = hashlib.sha256()
+            size = 0
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f"файл больше {max_size} байт")
+                    digest.update(chunk)
+                    await f.write(chunk)
+
+            sha256 = digest.hexdigest()
+            # Каталог в БД обновляется синхронно - в потоке, чтобы не блокировать цикл событий
+            await asyncio.to_thread(blob_store.put_file, tmp_path, sha256, extension)
+            path, changed = await asyncio.to_thread(blob_store.add, namespace, file_name, sha256, extension, size, unique_id)
+            return path, sha256, changed
         except Exception as e:
             print(f"Ошибка сохранения файла: {e}")
+            try:
+                await aiofiles.os.remove(tmp_path)
+            except OSError:
+                pass
             return None
 
     @staticmethod
-    def get_all_docs():
-        """Получение списка всех документов"""
+    def get_all_docs(namespace=SHARED_NAMESPACE):
+        """Получение списка всех документов пространства имен"""
         try:
-            if not os.path.exists(Config.DOCS_FOLDER):
-                return []
-                
-            return [f for f in os.listdir(Config.DOCS_FOLDER) 
-                   if os.path.isfile(os.path.join(Config.DOCS_FOLDER, f)) and
-                   os.path.splitext(f)[1].lower() in Config.ALLOWED_EXTENSIONS]
+            return blob_store.names(namespace)
         except Exception as e:
             print(f"Ошибка чтения списка файлов: {e}")
             return []
 
     @staticmethod
-    def clear_all_docs():
-        """Удаление всех документов"""
+    def clear_all_docs(namespace=SHARED_NAMESPACE, engine=None):
+        """Удаление всех документов пространства имен (содержимое - если на него нет других ссылок)"""
         try:
-            if not os.path.exists(Config.DOCS_FOLDER):
-                return True
-                
-            for filename in os.listdir(Config.DOCS_FOLDER):
-                file_path = os.path.join(Config.DOCS_FOLDER, filename)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+            blob_store.clear(namespace)
+            (engine or search_engine).clear()
             return True
         except Exception as e:
             print(f"Ошибка удаления файлов: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,141 @@
+import datetime
+import json
+import time
+from collections import OrderedDict
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from bot.core.config import Config
+from bot.utils.database import async_engine
+from bot.utils.write_behind import WriteBehind
+from models.fsm import FSMRecord
+
+class StateEntry:
+    """Состояние и данные одного ключа FSM в памяти процесса"""
+
+    __slots__ = ('state', 'data', 'expires')
+
+    def __init__(self, state=None, data=None, expires=0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.expires = expires
+
+class SQLiteStorage(WriteBehind, BaseStorage):
+    """Хранилище состояний FSM в таблице fsm_states (bot.db в режиме WAL).
+
+    Состояния переживают перезапуск и видны всем процессам бота. Чтения
+    обслуживаются из LRU-кэша (запись перечитывается через cache_ttl секунд),
+    изменения копятся в памяти и пишутся одной транзакцией раз в flush_ms.
+    Кэш рассчитан на то, что чат обслуживает один процесс (так распределяет
+    апдейты webhook-режим).
+    """
+
+    NAME = 'FSM'
+
+    def __init__(self, flush_ms=None, cache_size=None, cache_ttl=None, key_builder=None):
+        super().__init__(flush_ms or Config.FSM_FLUSH_MS)
+        self.cache_size = cache_size or Config.FSM_CACHE_SIZE
+        self.cache_ttl = cache_ttl or Config.FSM_CACHE_TTL
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache = OrderedDict()  # ключ -> StateEntry
+
+    def _key(self, key):
+        return self.key_builder.build(key)
+
+    async def _entry(self, key):
+        """Запись ключа: из буфера изменений, из кэша или из БД"""
+        storage_key = self._key(key)
+        entry = self._pending(storage_key)
+        if entry is not None:
+            return storage_key, entry
+
+        entry = self._cache.get(storage_key)
+        if entry is not None and entry.expires >= time.monotonic():
+            self._cache.move_to_end(storage_key)
+            return storage_key, entry
+
+        async with async_engine.connect() as conn:
+            row = (await conn.execute(
+                select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == storage_key)
+            )).first()
+        # Пока шло чтение, ключ могли изменить
+        entry = self._pending(storage_key)
+        if entry is None:
+            entry = StateEntry(row.state, json.loads(row.data or '{}')) if row else StateEntry()
+            self._remember(storage_key, entry)
+        return storage_key, entry
+
+    def _remember(self, storage_key, entry):
+        entry.expires = time.monotonic() + self.cache_ttl
+        self._cache[storage_key] = entry
+        self._cache.move_to_end(storage_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, storage_key, entry):
+        self._dirty[storage_key] = entry
+        self._remember(storage_key, entry)
+        self._changed()
+
+    async def set_state(self, key, state=None):
+        storage_key, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._store(storage_key, entry)
+
+    async def get_state(self, key):
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key, data):
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        json.dumps(data)  # несериализуемые данные - ошибка в обработчике, а не при записи
+        storage_key, entry = await self._entry(key)
+        entry.data = data.copy()
+        self._store(storage_key, entry)
+
+    async def get_data(self, key):
+        _, entry = await self._entry(key)
+        return entry.data.copy()
+
+    async def _write(self, dirty):
+        now = datetime.datetime.utcnow()
+        rows, empty = [], []
+        for storage_key, entry in dirty.items():
+            if entry.state is None and not entry.data:
+                empty.append(storage_key)  # пустые состояния не храним
+            else:
+                rows.append({'key': storage_key, 'state': entry.state,
+                             'data': json.dumps(entry.data, ensure_ascii=False), 'updated_at': now})
+        async with async_engine.begin() as conn:
+            if rows:
+                statement = insert(FSMRecord.__table__)
+                statement = statement.on_conflict_do_update(
+                    index_elements=['key'],
+                    set_={column: statement.excluded[column] for column in ('state', 'data', 'updated_at')},
+                )
+                await conn.execute(statement, rows)
+            if empty:
+                await conn.execute(delete(FSMRecord.__table__).where(FSMRecord.key.in_(empty)))
+
+    def status(self):
+        """Размер кэша и очереди записи"""
+        return {**super().status(), 'cached': len(self._cache)}
+
+def create_storage(backend=None):
+    """Хранилище FSM по настройке Config.FSM_STORAGE"""
+    backend = backend or Config.FSM_STORAGE
+    if backend == 'sqlite':
+        return SQLiteStorage()
+    if backend == 'redis':
+        # Пакет redis нужен только для этого варианта
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(
+            Config.REDIS_URL, key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        )
+    if backend == 'memory':
+        return MemoryStorage()
+    raise ValueError(f"Неизвестное хранилище FSM: {backend}")
@@ -0,0 +1,338 @@
+import json
+import re
+from sqlalchemy import text, bindparam
+from bot.core.config import Config
+from bot.utils.database import engine
+from bot.utils.document_cache import document_cache, DocumentCache
+from bot.utils.fuzzy_index import SymSpellIndex, allowed_distance
+from bot.utils.mapped_text import MappedText, use_mmap
+from bot.utils.ranking import top_k
+from bot.utils.query_parser import parse_query, QuerySyntaxError, Term, Phrase, Near, Field, And, Or, Not
+from bot.utils.search_index import tokenize
+
+# Маркеры подсветки совпадений внутри snippet()
+MATCH_OPEN = '\x02'
+MATCH_CLOSE = '\x03'
+HIGHLIGHT_PATTERN = re.compile(f'{MATCH_OPEN}(.*?){MATCH_CLOSE}', re.DOTALL)
+WORD_PATTERN = re.compile(r'\w+\*?')
+
+class FTSStore:
+    """Хранилище документов в SQLite FTS5 (по умолчанию таблицы в той же bot.db)"""
+
+    dirty = False  # изменения пишутся в БД сразу, отдельного сохранения не нужно
+
+    def __init__(self, chunk_size=None, db_engine=None):
+        self.chunk_size = chunk_size or Config.FTS_CHUNK_SIZE
+        self.engine = db_engine or engine  # отдельная база для пространства имен чата
+        self._fuzzy = None  # словарь опечаток, строится из fts5vocab по требованию
+
+    def create_tables(self):
+        """Создание FTS5-таблицы фрагментов и таблицы версий документов"""
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS doc_chunks USING fts5("
+                "doc_name UNINDEXED, chunk_no UNINDEXED, content, "
+                "tokenize = 'unicode61')"
+            ))
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS fts_documents ("
+                "doc_name TEXT PRIMARY KEY, signature TEXT, path TEXT)"
+            ))
+            columns = {row[1] for row in conn.execute(text("PRAGMA table_info(fts_documents)"))}
+            if 'path' not in columns:
+                # Таблица из версии, где путь к содержимому не хранился
+                conn.execute(text("ALTER TABLE fts_documents ADD COLUMN path TEXT"))
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS doc_vocab USING fts5vocab(doc_chunks, 'row')"
+            ))
+
+    def _split_chunks(self, doc_text):
+        """Нарезка текста на фрагменты по границам пробелов"""
+        start = 0
+        length = len(doc_text)
+        while start < length:
+            end = min(length, start + self.chunk_size)
+            if end < length:
+                # Не режем слово пополам
+                space = doc_text.rfind(' ', start, end)
+                if space > start:
+                    end = space
+            yield doc_text[start:end]
+            start = end
+
+    def add_document(self, doc_name, doc_text, signature=None, path=None):
+        """Добавление (или замена) документа"""
+        self.add_chunks(doc_name, self._split_chunks(doc_text), signature, path)
+
+    def add_chunks(self, doc_name, chunks, signature=None, path=None, source=None):
+        """Добавление документа по готовым фрагментам текста.
+
+        source - документ с тем же содержимым: фрагменты копируются из него.
+        """
+        insert = text(
+            "INSERT INTO doc_chunks (doc_name, chunk_no, content) "
+            "VALUES (:doc_name, :chunk_no, :content)"
+        )
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM doc_chunks WHERE doc_name = :doc_name"), {'doc_name': doc_name})
+            rows = []
+            for chunk_no, chunk in enumerate(chunks):
+                rows.append({'doc_name': doc_name, 'chunk_no': chunk_no, 'content': chunk})
+                if len(rows) >= 1000:
+                    # Фрагменты большого файла не копим в памяти целиком
+                    conn.execute(insert, rows)
+                    rows = []
+            if rows:
+                conn.execute(insert, rows)
+            if source is not None:
+                conn.execute(text(
+                    "INSERT INTO doc_chunks (doc_name, chunk_no, content) "
+                    "SELECT :doc_name, chunk_no, content FROM doc_chunks WHERE doc_name = :source"
+                ), {'doc_name': doc_name, 'source': source})
+            conn.execute(text(
+                "INSERT OR REPLACE INTO fts_documents (doc_name, signature, path) VALUES (:doc_name, :signature, :path)"
+            ), {'doc_name': doc_name, 'signature': json.dumps(signature), 'path': path})
+        self._fuzzy = None
+
+    def remove_document(self, doc_name):
+        """Удаление документа"""
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM doc_chunks WHERE doc_name = :doc_name"), {'doc_name': doc_name})
+            conn.execute(text("DELETE FROM fts_documents WHERE doc_name = :doc_name"), {'doc_name': doc_name})
+        self._fuzzy = None
+
+    def clear(self):
+        """Удаление всех документов"""
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM doc_chunks"))
+            conn.execute(text("DELETE FROM fts_documents"))
+        self._fuzzy = None
+
+    def _signatures(self):
+        """Версии проиндексированных документов: {имя: (сигнатура, путь)}"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("SELECT doc_name, signature, path FROM fts_documents"))
+            return {doc_name: (json.loads(signature), path) for doc_name, signature, path in rows}
+
+    def _signature(self, doc_name):
+        """Версия одного проиндексированного документа: (сигнатура, путь)"""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT signature, path FROM fts_documents WHERE doc_name = :doc_name"
+            ), {'doc_name': doc_name}).first()
+            return (json.loads(row[0]), row[1]) if row else None
+
+    def _same_content(self, doc_name, doc_path, signature):
+        """Другой документ с тем же файлом содержимого (путь в хранилище содержит хэш)"""
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT doc_name FROM fts_documents "
+                "WHERE path = :path AND signature = :signature AND doc_name != :doc_name LIMIT 1"
+            ), {'path': doc_path, 'signature': json.dumps(signature), 'doc_name': doc_name}).first()
+            return row[0] if row else None
+
+    def _load(self, doc_name, doc_path, signature):
+        """Запись файла в FTS5. Одинаковое содержимое копируется из уже записанного
+        документа, большие TXT (use_mmap) читаются кусками из mmap, минуя кэш текста"""
+        source = self._same_content(doc_name, doc_path, signature)
+        if source is not None:
+            self.add_chunks(doc_name, (), signature, doc_path, source)
+        elif not use_mmap(doc_path):
+            self.add_document(doc_name, document_cache.get_text(doc_path), signature, doc_path)
+        else:
+            with MappedText(doc_path) as mapped:
+                self.add_chunks(doc_name, (chunk for _, chunk in mapped.windows(self.chunk_size)), signature, doc_path)
+
+    def index_file(self, doc_name, doc_path):
+        """Индексация файла с диска, если он изменился"""
+        try:
+            signature = DocumentCache.signature(doc_path)
+            if self._signature(doc_name) == (signature, doc_path):
+                return True
+            self._load(doc_name, doc_path, signature)
+            return True
+        except Exception as e:
+            print(f"Ошибка FTS-индексации {doc_name}: {e}")
+            return False
+
+    def sync(self, doc_paths):
+        """Приведение FTS-индекса в соответствие с файлами: doc_paths - {имя файла: путь}"""
+        self.create_tables()
+        signatures = self._signatures()
+        for doc_name in signatures:
+            if doc_name not in doc_paths:
+                self.remove_document(doc_name)
+
+        for doc_name, doc_path in doc_paths.items():
+            signature = DocumentCache.signature(doc_path)
+            if signatures.get(doc_name) != (signature, doc_path):
+                self._load(doc_name, doc_path, signature)
+
+    @classmethod
+    def _compile(cls, node):
+        """Дерево булева запроса -> выражение FTS5"""
+        if isinstance(node, Term):
+            return f'"{node.word}"'
+        if isinstance(node, Phrase):
+            return '"' + ' '.join(node.words) + '"'
+        if isinstance(node, Near):
+            if isinstance(node.left, Near) or isinstance(node.right, Near):
+                raise QuerySyntaxError("FTS5 не поддерживает вложенные NEAR")
+            return f'NEAR({cls._compile(node.left)} {cls._compile(node.right)}, {node.distance})'
+        if isinstance(node, Or):
+            return '(' + ' OR '.join(cls._compile(child) for child in node.children) + ')'
+        if isinstance(node, And):
+            positives = [child for child in node.children if not isinstance(child, Not)]
+            negatives = [child.child for child in node.children if isinstance(child, Not)]
+            if not positives:
+                raise QuerySyntaxError("FTS5 не поддерживает запрос только из NOT")
+            expression = '(' + ' AND '.join(cls._compile(child) for child in positives) + ')'
+            for child in negatives:
+                expression += ' NOT ' + cls._compile(child)
+            return expression
+        if isinstance(node, Not):
+            raise QuerySyntaxError("FTS5 не поддерживает запрос только из NOT")
+        raise QuerySyntaxError("фильтры ext:/name: в FTS5 работают только на верхнем уровне запроса")
+
+    @staticmethod
+    def _is_filter(node):
+        """Фильтр по имени документа: ext:/name: или NOT ext:/name:"""
+        return isinstance(node, Field) or isinstance(node, Not) and isinstance(node.child, Field)
+
+    @staticmethod
+    def _passes(doc_name, filters):
+        """Подходит ли документ под все фильтры"""
+        return all(
+            not node.child.matches(doc_name) if isinstance(node, Not) else node.matches(doc_name)
+            for node in filters
+        )
+
+    @classmethod
+    def build_match(cls, query):
+        """Построение выражения MATCH из булева запроса.
+
+        Возвращает (выражение, фильтры по имени документа); выражение None,
+        если запрос состоит из одних фильтров.
+        """
+        tree = parse_query(query, tokenize)
+
+        # Фильтры верхнего уровня применяем к имени документа после MATCH
+        children = tree.children if isinstance(tree, And) else [tree]
+        filters = [child for child in children if cls._is_filter(child)]
+        rest = [child for child in children if not cls._is_filter(child)]
+        if not rest:
+            return None, filters
+
+        return cls._compile(rest[0] if len(rest) == 1 else And(rest)), filters
+
+    def search(self, query, doc_names=None, max_matches=10, context_size=100, limit=None):
+        """Булев поиск через MATCH с ранжированием BM25 из FTS5.
+
+        Подстроки (обычный поиск) FTS5 не ищет: слова в нем целые, поэтому
+        их обслуживает триграммный индекс (SearchEngine.text_jobs).
+        Возвращает ([(имя файла, оценка, [фрагменты с подсветкой]), ...], число
+        найденных документов); фрагменты строятся только для limit лучших.
+        """
+        expression, filters = self.build_match(query)
+        if not expression:
+            if filters:
+                return self._search_filters(filters, doc_names, context_size, limit)
+            return [], 0
+        return self._search_expression(expression, doc_names, max_matches, context_size, limit, filters)
+
+    def _search_filters(self, filters, doc_names, context_size, limit=None):
+        """Запрос из одних фильтров (ext:pdf, NOT ext:docx): отбор по таблице
+        документов без MATCH, фрагмент - начало документа, как в индексе"""
+        with self.engine.connect() as conn:
+            indexed = [row[0] for row in conn.execute(text("SELECT doc_name FROM fts_documents ORDER BY doc_name"))]
+        if doc_names is not None:
+            indexed = set(indexed)
+            indexed = [doc_name for doc_name in doc_names if doc_name in indexed]
+        matched = [doc_name for doc_name in indexed if self._passes(doc_name, filters)]
+        best = matched[:limit or Config.SEARCH_TOP_DOCS]
+        if not best:
+            return [], len(matched)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT doc_name, content FROM doc_chunks WHERE chunk_no = 0 AND doc_name IN :doc_names"
+            ).bindparams(bindparam('doc_names', expanding=True)), {'doc_names': best})
+            starts = {doc_name: content for doc_name, content in rows}
+        return [
+            (doc_name, 0.0, [starts[doc_name][:2 * context_size].strip() + "..."])
+            for doc_name in best if starts.get(doc_name)
+        ], len(matched)
+
+    def expand_term(self, term, max_distance=None):
+        """Слова словаря FTS5, похожие на term (с учетом опечаток)"""
+        if max_distance is None:
+            max_distance = Config.FUZZY_MAX_DISTANCE
+
+        fuzzy = self._fuzzy
+        if fuzzy is None:
+            # Словарь меняется только при загрузке документов, пересобираем лениво
+            with self.engine.connect() as conn:
+                terms = [row[0] for row in conn.execute(text("SELECT term FROM doc_vocab"))]
+            fuzzy = SymSpellIndex()
+            fuzzy.add_terms(terms)
+            self._fuzzy = fuzzy
+        return [word for word, _ in fuzzy.lookup(term, allowed_distance(term, max_distance))]
+
+    def search_fuzzy(self, query, doc_names=None, max_matches=10, context_size=100, limit=None, max_distance=None):
+        """Нечеткий поиск: слова запроса расширяются похожими словами и ищутся через MATCH"""
+        terms = set()
+        for word in WORD_PATTERN.findall(query.lower()):
+            terms.update(self.expand_term(word.rstrip('*'), max_distance))
+        if not terms:
+            return [], 0
+
+        expression = ' OR '.join(f'"{term}"' for term in sorted(terms))
+        return self._search_expression(expression, doc_names, max_matches, context_size, limit)
+
+    def _rank(self, expression, doc_names, filters=()):
+        """Оценки документов: сумма BM25 их фрагментов (rank в FTS5 отрицательный)"""
+        scores = {}
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT doc_name, rank FROM doc_chunks WHERE doc_chunks MATCH :expression"
+            ), {'expression': expression})
+            for doc_name, rank in rows:
+                scores[doc_name] = scores.get(doc_name, 0.0) - rank
+
+        return {
+            doc_name: score for doc_name, score in scores.items()
+            if (doc_names is None or doc_name in doc_names)
+            and self._passes(doc_name, filters)
+        }
+
+    def _search_expression(self, expression, doc_names, max_matches, context_size, limit=None, filters=()):
+        """Выполнение готового выражения MATCH: ранжирование, затем фрагменты лучших"""
+        scores = self._rank(expression, doc_names, filters)
+        best = top_k(scores, limit or Config.SEARCH_TOP_DOCS)
+        if not best:
+            return [], len(scores)
+
+        # snippet() считает контекст в словах, а не в символах (максимум 64)
+        tokens = max(4, min(64, context_size // 6))
+        matches_by_doc = {doc_name: [] for doc_name, _ in best}
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT doc_name, snippet(doc_chunks, 2, :open, :close, '...', :tokens) "
+                "FROM doc_chunks WHERE doc_chunks MATCH :expression AND doc_name IN :doc_names "
+                "ORDER BY doc_name, chunk_no"
+            ).bindparams(bindparam('doc_names', expanding=True)), {
+                'open': MATCH_OPEN, 'close': MATCH_CLOSE, 'tokens': tokens,
+                'expression': expression, 'doc_names': list(matches_by_doc),
+            })
+
+            for doc_name, snippet in rows:
+                matches = matches_by_doc[doc_name]
+                if len(matches) < max_matches:
+                    matches.append(HIGHLIGHT_PATTERN.sub(
+                        lambda m: f">>> {m.group(1).upper()} <<<", snippet
+                    ).strip())
+
+        return [(doc_name, score, matches_by_doc[doc_name]) for doc_name, score in best], len(scores)
+
+# Глобальный экземпляр FTS-хранилища
+fts_store = FTSStore()
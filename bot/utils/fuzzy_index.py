@@ -0,0 +1,128 @@
+import threading
+from bot.core.config import Config
+
+def edit_distance(a, b, max_distance):
+    """Расстояние Дамерау-Левенштейна (с перестановками соседних букв).
+
+    Если расстояние больше max_distance, возвращает max_distance + 1.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if a == b:
+        return 0
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+
+    return min(previous[-1], max_distance + 1)
+
+def allowed_distance(term, max_distance):
+    """Допуск опечаток по длине слова: короткие слова ищем точнее"""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 6:
+        return min(1, max_distance)
+    return max_distance
+
+class SymSpellIndex:
+    """Словарь удалений в стиле SymSpell для поиска слов с опечатками.
+
+    Для каждого слова храним все варианты его префикса с удаленными
+    1..max_distance буквами. Запрос порождает такие же варианты, и совпавшие
+    ключи дают кандидатов, которые проверяются точным расстоянием.
+    """
+
+    def __init__(self, max_distance=None, prefix_length=None):
+        self.max_distance = max_distance or Config.FUZZY_MAX_DISTANCE
+        self.prefix_length = prefix_length or Config.FUZZY_PREFIX_LENGTH
+        self.words = set()
+        self.deletes = {}  # вариант -> слово или список слов
+        self._lock = threading.RLock()
+
+    def _edits(self, word, max_distance):
+        """Все варианты префикса слова с удаленными буквами (вместе с самим префиксом)"""
+        prefix = word[:self.prefix_length]
+        edits = {prefix}
+        frontier = {prefix}
+        for _ in range(max_distance):
+            next_frontier = set()
+            for candidate in frontier:
+                if len(candidate) <= 1:
+                    continue
+                for i in range(len(candidate)):
+                    next_frontier.add(candidate[:i] + candidate[i + 1:])
+            next_frontier -= edits
+            edits |= next_frontier
+            frontier = next_frontier
+        return edits
+
+    def add_terms(self, terms):
+        """Добавление слов в словарь"""
+        with self._lock:
+            for word in terms:
+                if word in self.words:
+                    continue
+                self.words.add(word)
+                for key in self._edits(word, self.max_distance):
+                    bucket = self.deletes.get(key)
+                    if bucket is None:
+                        self.deletes[key] = word
+                    elif isinstance(bucket, list):
+                        bucket.append(word)
+                    else:
+                        self.deletes[key] = [bucket, word]
+
+    def remove_terms(self, terms):
+        """Удаление слов из словаря"""
+        with self._lock:
+            for word in terms:
+                if word not in self.words:
+                    continue
+                self.words.discard(word)
+                for key in self._edits(word, self.max_distance):
+                    bucket = self.deletes.get(key)
+                    if bucket == word:
+                        del self.deletes[key]
+                    elif isinstance(bucket, list) and word in bucket:
+                        bucket.remove(word)
+                        if len(bucket) == 1:
+                            self.deletes[key] = bucket[0]
+
+    def lookup(self, term, max_distance=None):
+        """Слова словаря на расстоянии не больше max_distance: [(слово, расстояние), ...]"""
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+
+        suggestions = {}
+        with self._lock:
+            if term in self.words:
+                suggestions[term] = 0
+            if max_distance == 0:
+                return list(suggestions.items())
+
+            for key in self._edits(term, max_distance):
+                bucket = self.deletes.get(key)
+                if bucket is None:
+                    continue
+                for word in (bucket if isinstance(bucket, list) else (bucket,)):
+                    if word in suggestions:
+                        continue
+                    distance = edit_distance(term, word, max_distance)
+                    if distance <= max_distance:
+                        suggestions[word] = distance
+
+        return sorted(suggestions.items(), key=lambda item: (item[1], item[0]))
\ No newline at end of file
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections import deque
+from bot.core.config import Config
+from bot.utils.logger import logger
+from bot.utils.search_engine import search_engine
+from bot.utils.search_executor import search_executor
+
+class IngestJob:
+    """Задание на разбор и индексацию одного файла"""
+
+    __slots__ = ('doc_name', 'doc_path', 'namespace', 'callbacks', 'queued_at', 'repeat')
+
+    def __init__(self, doc_name, doc_path, namespace=None):
+        self.doc_name = doc_name
+        self.doc_path = doc_path
+        self.namespace = namespace  # пространство имен чата (None - общие индексы)
+        self.callbacks = []       # async callback(ok) - уведомления о готовности
+        self.queued_at = time.monotonic()
+        self.repeat = False       # файл перезаписали во время индексации
+
+class IngestQueue:
+    """Фоновая очередь индексации загруженных документов.
+
+    Файлы разбираются и индексируются несколькими воркерами (не больше
+    concurrency одновременно), повторная загрузка того же файла, пока он ждет
+    в очереди, не создает нового задания. Индексы пишутся на диск не после
+    каждого файла, а когда очередь опустела (и не реже INDEX_SAVE_SECONDS).
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or Config.INGEST_CONCURRENCY
+        self._queue = None
+        self._workers = []
+        self._pending = {}    # (пространство имен, имя файла) -> задание в очереди
+        self._running = {}    # (пространство имен, имя файла) -> задание в работе
+        self._finished = deque(maxlen=1000)  # время завершения последних заданий
+        self._unsaved = {}    # id движка -> движок с несохраненными индексами
+        self._saved_at = time.monotonic()
+        self.processed = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+
+    def start(self):
+        """Запуск воркеров (внутри работающего цикла событий)"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """Остановка воркеров.
+
+        Задания из очереди и прерванные на середине не выполняются: их
+        callback получают ok=False, а число брошенных заданий пишется в лог.
+        """
+        dropped = list(self._running.values()) + list(self._pending.values())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._pending = {}
+        self._running = {}
+        await self.save_indexes()
+
+        if dropped:
+            names = ', '.join(job.doc_name for job in dropped[:10])
+            logger.warning(f"Ingest queue stopped with {len(dropped)} unfinished jobs: {names}")
+        for job in dropped:
+            await self._finish(job, False)
+
+    def submit(self, doc_name, doc_path, callback=None, namespace=None):
+        """Постановка файла в очередь. Возвращает позицию в очереди.
+
+        callback - корутина-функция callback(ok), вызывается после индексации.
+        namespace - пространство имен чата: пока в нем есть задания, его шард
+        не выгружается из памяти.
+        """
+        self.start()
+
+        key = self._key(doc_name, namespace)
+        job = self._pending.get(key)
+        if job is None:
+            running = self._running.get(key)
+            if running is not None:
+                # Файл уже индексируется - проиндексируем еще раз после завершения
+                # (новое содержимое может лежать по другому пути в хранилище)
+                running.doc_path = doc_path
+                running.repeat = True
+                if callback:
+                    running.callbacks.append(callback)
+                return 0
+
+            job = IngestJob(doc_name, doc_path, namespace)
+            if namespace is not None:
+                namespace.pending += 1
+            self._pending[key] = job
+            self._queue.put_nowait(job)
+        else:
+            # Задание еще ждет - индексируем последнюю версию файла
+            job.doc_path = doc_path
+
+        if callback:
+            job.callbacks.append(callback)
+        return list(self._pending).index(key) + 1
+
+    @staticmethod
+    def _key(doc_name, namespace):
+        # Одно содержимое может лежать под разными именами, поэтому ключ - имя
+        return (namespace.key if namespace is not None else None, doc_name)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job):
+        key = self._key(job.doc_name, job.namespace)
+        self._pending.pop(key, None)
+        self._running[key] = job
+        started = time.monotonic()
+        engine = job.namespace.engine if job.namespace is not None else search_engine
+        self._unsaved[id(engine)] = engine
+        try:
+            ok = await search_executor.index_file(job.doc_name, job.doc_path, engine)
+        except Exception as e:
+            logger.error(f"Ingest error for {job.doc_name}: {e}")
+            ok = False
+        finally:
+            self._running.pop(key, None)
+
+        finished = time.monotonic()
+        self.total_seconds += finished - started
+        self._finished.append(finished)
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+
+        drained = not (self._pending or self._running or job.repeat)
+        if drained or finished - self._saved_at >= Config.INDEX_SAVE_SECONDS:
+            await self.save_indexes()
+
+        if job.repeat:
+            # Новая версия файла пришла во время индексации - переиндексируем
+            job.repeat = False
+            self._pending[key] = job
+            self._queue.put_nowait(job)
+            return
+
+        await self._finish(job, ok)
+
+    async def save_indexes(self):
+        """Запись на диск индексов, измененных заданиями с прошлой записи"""
+        engines, self._unsaved = list(self._unsaved.values()), {}
+        self._saved_at = time.monotonic()
+        for engine in engines:
+            await asyncio.to_thread(engine.save)
+
+    async def _finish(self, job, ok):
+        """Освобождение шарда и уведомление о результате задания"""
+        if job.namespace is not None:
+            job.namespace.pending -= 1
+
+        for callback in job.callbacks:
+            try:
+                await callback(ok)
+            except Exception as e:
+                logger.error(f"Ingest callback error for {job.doc_name}: {e}")
+
+    def status(self):
+        """Состояние очереди: глубина, работа, пропускная способность"""
+        now = time.monotonic()
+        done = self.processed + self.failed
+        oldest = min((job.queued_at for job in self._pending.values()), default=None)
+        return {
+            'queued': len(self._pending),
+            'running': len(self._running),
+            'workers': self.concurrency,
+            'processed': self.processed,
+            'failed': self.failed,
+            'per_minute': sum(1 for finished in self._finished if now - finished <= 60),
+            'avg_seconds': self.total_seconds / done if done else 0.0,
+            'oldest_wait': now - oldest if oldest is not None else 0.0,
+        }
+
+# Глобальная очередь индексации
+ingest_queue = IngestQueue()
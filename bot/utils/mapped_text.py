@@ -0,0 +1,216 @@
+import codecs
+import mmap
+import os
+import re
+from bot.core.config import Config
+
+# Кодировки, в которых ASCII-символы занимают один байт и совпадают с ASCII:
+# в них можно искать байтовым регулярным выражением прямо по файлу
+ASCII_COMPATIBLE = ('utf-8', 'utf-8-sig', 'cp1251', 'latin-1')
+
+# Варианты букв, которые поиск считает одинаковыми (как normalize в trigram_index)
+LETTER_VARIANTS = {'е': 'её', 'ё': 'её'}
+
+def detect_encoding(file_path, sample_size=None):
+    """Кодировка текстового файла по образцу из его начала (один проход)"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size or Config.ENCODING_SAMPLE_SIZE)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # Образец может оборваться посреди символа - final=False это допускает
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode('cp1251')
+        return 'cp1251'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+def use_mmap(file_path):
+    """Читать ли файл напрямую через mmap, минуя кэш текста"""
+    if os.path.splitext(file_path)[1].lower() != '.txt':
+        return False
+    try:
+        if os.path.getsize(file_path) < Config.TXT_MMAP_MIN_SIZE:
+            return False
+        return detect_encoding(file_path) in ASCII_COMPATIBLE
+    except OSError:
+        return False
+
+def _codec(encoding):
+    # utf-8-sig при кодировании добавляет BOM к каждой строке
+    return 'utf-8' if encoding == 'utf-8-sig' else encoding
+
+def compile_bytes_query(query, encoding):
+    """Байтовое выражение для подстроки без учета регистра.
+
+    Каждый символ заменяется альтернативой его вариантов в нужной кодировке
+    (а|А, е|ё|Е|Ё), поэтому файл не нужно ни декодировать, ни приводить
+    к нижнему регистру. None - если символ нельзя записать в этой кодировке.
+    """
+    codec = _codec(encoding)
+    parts = []
+    for char in query:
+        variants = set()
+        for base in LETTER_VARIANTS.get(char.lower(), char.lower()) + char:
+            variants.update((base, base.lower(), base.upper()))
+
+        encoded = set()
+        for variant in variants:
+            try:
+                encoded.add(variant.encode(codec))
+            except UnicodeEncodeError:
+                continue
+        if not encoded:
+            return None
+
+        if all(len(item) == 1 for item in encoded):
+            parts.append(b'[' + b''.join(re.escape(item) for item in sorted(encoded)) + b']')
+        else:
+            parts.append(b'(?:' + b'|'.join(re.escape(item) for item in sorted(encoded, key=len, reverse=True)) + b')')
+    return re.compile(b''.join(parts))
+
+class MappedText:
+    """Большой текстовый файл, отображенный в память.
+
+    Поиск идет по байтам файла (подстрока) или окнами ограниченного размера
+    (регулярные выражения), декодируются только окна и фрагменты вокруг
+    совпадений. Позиции совпадений - смещения в байтах.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.encoding = detect_encoding(file_path)
+        self.codec = _codec(self.encoding)
+
+    def __enter__(self):
+        self._file = open(self.file_path, 'rb')
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл нельзя отобразить
+            self.data = b''
+        return self
+
+    def __exit__(self, *exc):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def _decode(self, start, end):
+        return self.data[start:end].decode(self.codec, errors='ignore').lstrip('﻿')
+
+    def find(self, query, max_matches=None):
+        """Вхождения подстроки без учета регистра: [(начало, конец), ...] в байтах"""
+        pattern = compile_bytes_query(query, self.encoding)
+        if pattern is None or not query:
+            return []
+
+        spans = []
+        for match in pattern.finditer(self.data):
+            spans.append(match.span())
+            if max_matches is not None and len(spans) >= max_matches:
+                break
+        return spans
+
+    def find_regex(self, regex, max_matches=None, normalize=None, window=None, overlap=None):
+        """Совпадения регулярного выражения, текст декодируется окнами.
+
+        normalize - преобразование окна перед поиском, не меняющее его длину.
+        Совпадение длиннее перекрытия окон на их границе может быть пропущено.
+        """
+        window = window or Config.TXT_WINDOW_SIZE
+        overlap = overlap or Config.TRIGRAM_BLOCK_OVERLAP * 4
+        spans = []
+        seen_end = 0
+        start = 0
+        size = len(self.data)
+        while start < size:
+            if self.codec == 'utf-8':
+                # Окно не должно начинаться с середины символа, иначе сдвинутся смещения
+                while start < size and self.data[start] & 0xC0 == 0x80:
+                    start += 1
+            text = self.data[start:min(size, start + window + overlap)].decode(self.codec, errors='ignore')
+            for match in regex.finditer(normalize(text) if normalize else text):
+                if match.end() == match.start():
+                    continue
+                match_start = start + len(text[:match.start()].encode(self.codec))
+                if match_start < seen_end:
+                    # Уже найдено в предыдущем окне
+                    continue
+                match_end = match_start + len(text[match.start():match.end()].encode(self.codec))
+                spans.append((match_start, match_end))
+                seen_end = match_end
+                if max_matches is not None and len(spans) >= max_matches:
+                    return spans
+            start += window
+        return spans
+
+    def windows(self, size=None):
+        """Текст файла кусками примерно по size байт: [(смещение в байтах, текст), ...].
+
+        Куски режутся по пробелу или переводу строки (в ASCII-совместимых
+        кодировках эти байты не встречаются внутри других символов), поэтому
+        слово разрезается, только если в куске нет ни одного пробела.
+        """
+        size = size or Config.TXT_WINDOW_SIZE
+        start = 0
+        total = len(self.data)
+        while start < total:
+            end = min(total, start + size)
+            if end < total:
+                cut = max(self.data.rfind(b' ', start, end), self.data.rfind(b'\n', start, end))
+                if cut > start:
+                    end = cut + 1
+                elif self.codec == 'utf-8':
+                    # Не режем символ пополам
+                    while end > start + 1 and self.data[end] & 0xC0 == 0x80:
+                        end -= 1
+            yield start, self.data[start:end].decode(self.codec, errors='ignore')
+            start = end
+
+    def tokens(self, pattern, size=None):
+        """Слова файла: (слово в нижнем регистре, начало, конец) в байтах.
+
+        Файл декодируется кусками, так что целиком в памяти не бывает.
+        """
+        for start, text in self.windows(size):
+            position = start
+            consumed = 0
+            for match in pattern.finditer(text):
+                position += len(text[consumed:match.start()].encode(self.codec))
+                end = position + len(match.group().encode(self.codec))
+                yield match.group().lower(), position, end
+                position, consumed = end, match.end()
+
+    def snippets(self, spans, max_matches, context_size):
+        """Фрагменты вокруг совпадений с номером строки, декодируются только они"""
+        # В худшем случае символ занимает 4 байта
+        context_bytes = context_size * 4
+        results = []
+        line = 1
+        counted = 0
+        for start, end in sorted(spans)[:max_matches]:
+            # Строки считаем кусками от предыдущего совпадения
+            while counted < start:
+                step = min(start, counted + 1024 * 1024)
+                line += self.data[counted:step].count(b'\n')
+                counted = step
+
+            before = self._decode(max(0, start - context_bytes), start)
+            match = self._decode(start, end)
+            after = self._decode(end, min(len(self.data), end + context_bytes))
+
+            snippet = f"{before[-context_size:]}>>> {match.upper()} <<<{after[:context_size]}"
+            if len(before) > context_size or (start > context_bytes and before):
+                snippet = "..." + snippet
+            if len(after) > context_size or end + context_bytes < len(self.data):
+                snippet = snippet + "..."
+            results.append(f"[строка {line}] {snippet.strip()}")
+        return results
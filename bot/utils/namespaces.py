@@ -0,0 +1,100 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from bot.core.config import Config
+from bot.utils.blob_store import blob_store
+from bot.utils.file_storage import FileStorage
+from bot.utils.search_engine import SearchEngine
+from bot.utils.search_executor import search_executor
+
+# Чаты, документы которых живут в своем пространстве имен
+GROUP_CHAT_TYPES = ('group', 'supergroup')
+
+class Namespace:
+    """Документы одного чата: свой каталог в blob_store и свой шард индексов"""
+
+    __slots__ = ('chat_id', 'key', 'docs_folder', 'index_folder', 'engine', 'last_used', 'pending')
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.key = str(chat_id)  # пространство имен в каталоге
+        self.docs_folder = os.path.join(Config.DOCS_FOLDER, self.key)  # файлы до появления каталога
+        self.index_folder = os.path.join(Config.INDEX_FOLDER, self.key)
+        self.engine = SearchEngine(namespace=self.key, index_folder=self.index_folder)
+        self.last_used = time.monotonic()
+        self.pending = 0  # заданий индексации в очереди
+
+    def docs(self):
+        """Документы чата"""
+        return FileStorage.get_all_docs(self.key)
+
+    def close(self):
+        """Освобождение ресурсов шарда (индексы уже сохранены на диск)"""
+        fts_store = self.engine.fts_store
+        if fts_store is not None:
+            fts_store.engine.dispose()
+
+class NamespaceManager:
+    """Шарды чатов: загружаются при первом обращении и выгружаются после простоя.
+
+    В памяти держится не больше max_loaded шардов; шарды с заданиями
+    индексации в очереди или еще не сохраненными индексами не выгружаются.
+    """
+
+    def __init__(self, idle_seconds=None, max_loaded=None):
+        self.idle_seconds = idle_seconds or Config.NAMESPACE_IDLE_SECONDS
+        self.max_loaded = max_loaded or Config.MAX_LOADED_NAMESPACES
+        self._loaded = OrderedDict()  # id чата -> Namespace
+        self._loading = {}            # id чата -> задача загрузки
+
+    async def get(self, chat_id):
+        """Шард чата; при первом обращении индексы читаются с диска и догоняют файлы"""
+        namespace = self._loaded.get(chat_id)
+        if namespace is None:
+            task = self._loading.get(chat_id)
+            if task is None:
+                task = asyncio.ensure_future(self._load(chat_id))
+                self._loading[chat_id] = task
+            try:
+                namespace = await asyncio.shield(task)
+            finally:
+                self._loading.pop(chat_id, None)
+            self._loaded[chat_id] = namespace
+
+        namespace.last_used = time.monotonic()
+        self._loaded.move_to_end(chat_id)
+        self.evict_idle()
+        return namespace
+
+    async def for_chat(self, chat):
+        """Шард группы; None для личных чатов - они работают с общей папкой документов"""
+        if chat.type not in GROUP_CHAT_TYPES:
+            return None
+        return await self.get(chat.id)
+
+    @staticmethod
+    async def _load(chat_id):
+        # Чтение pickle-файлов индексов не должно блокировать цикл событий
+        namespace = await asyncio.to_thread(Namespace, chat_id)
+        await asyncio.to_thread(blob_store.import_folder, namespace.key, namespace.docs_folder)
+        await search_executor.sync(await asyncio.to_thread(blob_store.paths, namespace.key), namespace.engine)
+        return namespace
+
+    def evict_idle(self):
+        """Выгрузка давно не используемых шардов и лишних сверх max_loaded"""
+        now = time.monotonic()
+        for chat_id, namespace in list(self._loaded.items()):
+            if namespace.pending or namespace.engine.dirty:
+                # Шард с заданиями или несохраненными индексами не выгружаем
+                continue
+            if now - namespace.last_used > self.idle_seconds or len(self._loaded) > self.max_loaded:
+                del self._loaded[chat_id]
+                namespace.close()
+
+    def status(self):
+        """Число загруженных шардов"""
+        return {'loaded': len(self._loaded), 'max_loaded': self.max_loaded}
+
+# Глобальный менеджер пространств имен
+namespaces = NamespaceManager()
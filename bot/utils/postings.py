@@ -0,0 +1,163 @@
+import math
+from bisect import bisect_left
+
+class PostingList:
+    """Отсортированный список id документов с указателями пропуска.
+
+    Указатели неявные: из каждой позиции, кратной skip, можно перепрыгнуть
+    на skip элементов вперед, если там значение не больше искомого.
+    """
+
+    __slots__ = ('ids', 'skip')
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.skip = max(1, int(math.sqrt(len(ids))))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def advance(self, i, target):
+        """Сдвиг позиции i к первому элементу >= target с использованием пропусков"""
+        ids = self.ids
+        skip = self.skip
+        while i < len(ids) and ids[i] < target:
+            if i % skip == 0 and i + skip < len(ids) and ids[i + skip] <= target:
+                i += skip
+            else:
+                i += 1
+        return i
+
+def intersect(a, b):
+    """Пересечение двух списков: стоимость ближе к размеру меньшего из них"""
+    if len(a) > len(b):
+        a, b = b, a
+
+    result = []
+    i = j = 0
+    a_ids, b_ids = a.ids, b.ids
+    while i < len(a_ids) and j < len(b_ids):
+        if a_ids[i] == b_ids[j]:
+            result.append(a_ids[i])
+            i += 1
+            j += 1
+        elif a_ids[i] < b_ids[j]:
+            i = a.advance(i, b_ids[j])
+        else:
+            j = b.advance(j, a_ids[i])
+    return PostingList(result)
+
+def intersect_all(lists):
+    """Пересечение нескольких списков, начиная с самых коротких"""
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for posting_list in lists[1:]:
+        if not result:
+            break
+        result = intersect(result, posting_list)
+    return result
+
+def union(a, b):
+    """Объединение двух списков слиянием"""
+    result = []
+    i = j = 0
+    a_ids, b_ids = a.ids, b.ids
+    while i < len(a_ids) and j < len(b_ids):
+        if a_ids[i] == b_ids[j]:
+            result.append(a_ids[i])
+            i += 1
+            j += 1
+        elif a_ids[i] < b_ids[j]:
+            result.append(a_ids[i])
+            i += 1
+        else:
+            result.append(b_ids[j])
+            j += 1
+    result.extend(a_ids[i:])
+    result.extend(b_ids[j:])
+    return PostingList(result)
+
+def difference(a, b):
+    """Документы из a, которых нет в b"""
+    result = []
+    j = 0
+    b_ids = b.ids
+    for doc_id in a.ids:
+        j = b.advance(j, doc_id)
+        if j >= len(b_ids) or b_ids[j] != doc_id:
+            result.append(doc_id)
+    return PostingList(result)
+
+
+def gallop(seq, target, lo=0):
+    """Первый индекс i >= lo, где seq[i] >= target.
+
+    Шаг растет вдвое, пока не перепрыгнет target, затем бинарный поиск
+    внутри последнего шага: стоимость зависит от расстояния, а не от длины.
+    """
+    n = len(seq)
+    if lo >= n or seq[lo] >= target:
+        return lo
+    step = 1
+    hi = lo + 1
+    while hi < n and seq[hi] < target:
+        lo = hi
+        step *= 2
+        hi = lo + step
+    return bisect_left(seq, target, lo + 1, min(hi, n))
+
+def phrase_starts(position_lists):
+    """Начала фразы: позиции p, для которых p + i есть в i-м списке.
+
+    Ведущим берется самый короткий список, в остальных нужная позиция
+    ищется галопом от предыдущей найденной.
+    """
+    if not position_lists or not all(position_lists):
+        return []
+
+    lead = min(range(len(position_lists)), key=lambda i: len(position_lists[i]))
+    cursors = [0] * len(position_lists)
+    starts = []
+    for position in position_lists[lead]:
+        start = position - lead
+        if start < 0:
+            continue
+        for shift, positions in enumerate(position_lists):
+            if shift == lead:
+                continue
+            i = cursors[shift] = gallop(positions, start + shift, cursors[shift])
+            if i == len(positions):
+                # Список кончился - дальше фраз не будет
+                return starts
+            if positions[i] != start + shift:
+                break
+        else:
+            starts.append(start)
+    return starts
+
+def near(left, right, distance):
+    """Вхождения left и right, между которыми не больше distance слов (в любом порядке).
+
+    left, right - отсортированные списки (первое слово, последнее слово).
+    Возвращает объединенные вхождения (первое слово, последнее слово).
+    """
+    if not left or not right:
+        return []
+
+    firsts = [first for first, _ in right]
+    max_length = max(last - first for first, last in right) + 1
+    result = set()
+    cursor = 0
+    for first, last in left:
+        cursor = gallop(firsts, first - distance - max_length, cursor)
+        i = cursor
+        while i < len(right) and right[i][0] <= last + distance + 1:
+            right_first, right_last = right[i]
+            if right_first > last or (right_last < first and first - right_last - 1 <= distance):
+                result.add((min(first, right_first), max(last, right_last)))
+                break
+            i += 1
+    return sorted(result)
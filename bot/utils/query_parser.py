@@ -0,0 +1,251 @@
+import re
+
+# Поддерживаемые фильтры полей: ext:pdf, name:отчет
+FIELDS = ('ext', 'name')
+OPERATORS = ('and', 'or', 'not')
+# Только заглавными: слово near в обычном тексте остается словом
+NEAR_PATTERN = re.compile(r'NEAR(?:/(\d+))?')
+NEAR_DEFAULT_DISTANCE = 10  # как у NEAR в SQLite FTS5
+# Фраза в кавычках, в которой есть хотя бы одно слово
+PHRASE_PATTERN = re.compile(r'"[^"]*\w[^"]*"')
+
+QUERY_TOKEN_PATTERN = re.compile(r'''
+    \s*(?:
+        (?P<paren>[()])
+      | "(?P<phrase>[^"]*)"
+      | (?P<field>\w+):(?:"(?P<field_quoted>[^"]*)"|(?P<field_value>[^\s()"]+))
+      | (?P<word>[^\s()"]+)
+    )
+''', re.VERBOSE)
+
+class QuerySyntaxError(ValueError):
+    """Ошибка в записи поискового запроса"""
+
+class Term:
+    """Отдельное слово"""
+
+    def __init__(self, word):
+        self.word = word
+
+    def __repr__(self):
+        return f"Term({self.word!r})"
+
+class Phrase:
+    """Слова, идущие подряд"""
+
+    def __init__(self, words):
+        self.words = words
+
+    def __repr__(self):
+        return f"Phrase({self.words!r})"
+
+class Field:
+    """Фильтр по свойству документа (расширение, имя файла)"""
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def matches(self, doc_name):
+        """Подходит ли документ под фильтр"""
+        if self.name == 'ext':
+            return doc_name.lower().endswith('.' + self.value.lower().lstrip('.'))
+        return self.value.lower() in doc_name.lower()
+
+    def __repr__(self):
+        return f"Field({self.name!r}, {self.value!r})"
+
+class Near:
+    """Два условия на расстоянии не больше distance слов друг от друга"""
+
+    def __init__(self, left, right, distance):
+        self.left = left
+        self.right = right
+        self.distance = distance
+
+    def __repr__(self):
+        return f"Near({self.left!r}, {self.right!r}, {self.distance})"
+
+class And:
+    """Все условия одновременно"""
+
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"And({self.children!r})"
+
+class Or:
+    """Хотя бы одно из условий"""
+
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"Or({self.children!r})"
+
+class Not:
+    """Отрицание условия"""
+
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return f"Not({self.child!r})"
+
+def _text_node(text, tokenize):
+    """Слово или фраза из произвольного текста (одно слово -> Term)"""
+    words = [token for token, _, _ in tokenize(text)]
+    if not words:
+        return None
+    if len(words) == 1:
+        return Term(words[0])
+    return Phrase(words)
+
+def _lex(query, tokenize):
+    """Разбор строки запроса на лексемы: (вид, значение)"""
+    tokens = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        match = QUERY_TOKEN_PATTERN.match(query, pos)
+        if not match or match.end() == pos:
+            raise QuerySyntaxError(f"не удалось разобрать запрос около «{query[pos:pos + 10]}»")
+        pos = match.end()
+
+        if match.group('paren'):
+            tokens.append((match.group('paren'), None))
+        elif match.group('phrase') is not None:
+            node = _text_node(match.group('phrase'), tokenize)
+            if node is None:
+                raise QuerySyntaxError("пустая фраза в кавычках")
+            tokens.append(('node', node))
+        elif match.group('field') and match.group('field').lower() in FIELDS:
+            value = match.group('field_quoted')
+            if value is None:
+                value = match.group('field_value')
+            tokens.append(('node', Field(match.group('field').lower(), value)))
+        else:
+            text = match.group('word') or match.group(0)
+            if text.strip().lower() in OPERATORS:
+                tokens.append((text.strip().lower(), None))
+                continue
+            near = NEAR_PATTERN.fullmatch(text.strip())
+            if near:
+                distance = int(near.group(1)) if near.group(1) else NEAR_DEFAULT_DISTANCE
+                tokens.append(('near', distance))
+                continue
+            node = _text_node(text, tokenize)
+            if node is not None:
+                tokens.append(('node', node))
+    return tokens
+
+class _Parser:
+    """Рекурсивный спуск: or -> and -> not -> near -> primary"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("пустой запрос")
+        node = self.parse_or()
+        if self.pos < len(self.tokens):
+            raise QuerySyntaxError("лишняя закрывающая скобка")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == 'or':
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while self.peek() in ('and', 'not', 'node', '('):
+            # Слова подряд без оператора тоже означают AND
+            if self.peek() == 'and':
+                self.take()
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.peek() == 'not':
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_near()
+
+    def parse_near(self):
+        node = self.parse_primary()
+        while self.peek() == 'near':
+            distance = self.take()[1]
+            right = self.parse_primary()
+            if not isinstance(node, (Term, Phrase, Near)) or not isinstance(right, (Term, Phrase, Near)):
+                raise QuerySyntaxError("NEAR соединяет только слова и фразы")
+            node = Near(node, right, distance)
+        return node
+
+    def parse_primary(self):
+        kind = self.peek()
+        if kind is None:
+            raise QuerySyntaxError("запрос обрывается после оператора")
+        if kind == '(':
+            self.take()
+            node = self.parse_or()
+            if self.peek() != ')':
+                raise QuerySyntaxError("не хватает закрывающей скобки")
+            self.take()
+            return node
+        if kind == 'node':
+            return self.take()[1]
+        raise QuerySyntaxError(f"неожиданный оператор «{kind}»")
+
+def parse_query(query, tokenize):
+    """Разбор булева запроса в дерево (AST).
+
+    Поддерживаются AND/OR/NOT, NEAR/k, скобки, фразы в кавычках и фильтры ext:, name:.
+    tokenize - функция разбиения текста на слова из поискового индекса.
+    """
+    return _Parser(_lex(query, tokenize)).parse()
+
+def is_positional(query):
+    """Есть ли в запросе фразы в кавычках или NEAR между словами - их ищем по позициям слов"""
+    if PHRASE_PATTERN.search(query):
+        return True
+    # NEAR в начале или в конце - просто слово, а не оператор без операнда
+    return any(NEAR_PATTERN.fullmatch(word) for word in query.split()[1:-1])
+
+def positive_leaves(node):
+    """Слова, фразы и NEAR, которые должны встретиться в документе (вне NOT)"""
+    if isinstance(node, (Term, Phrase, Near)):
+        return [node]
+    if isinstance(node, (And, Or)):
+        leaves = []
+        for child in node.children:
+            leaves.extend(positive_leaves(child))
+        return leaves
+    return []
+
+def _words(node):
+    if isinstance(node, Term):
+        return [node.word]
+    if isinstance(node, Phrase):
+        return list(node.words)
+    return _words(node.left) + _words(node.right)
+
+def leaf_words(node):
+    """Все слова положительных условий запроса (для оценки релевантности)"""
+    words = []
+    for leaf in positive_leaves(node):
+        words.extend(_words(leaf))
+    return words
@@ -0,0 +1,27 @@
+import heapq
+import math
+from bot.core.config import Config
+
+def idf(doc_count, doc_freq):
+    """Обратная документная частота BM25 (всегда положительная)"""
+    return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+def length_norm(doc_length, avg_length, k1=None, b=None):
+    """Знаменатель BM25, зависящий от длины документа: k1 * (1 - b + b * dl / avgdl)"""
+    k1 = Config.BM25_K1 if k1 is None else k1
+    b = Config.BM25_B if b is None else b
+    if not avg_length:
+        return k1
+    return k1 * (1 - b + b * doc_length / avg_length)
+
+def bm25(tf, term_idf, norm, k1=None):
+    """Вклад одного слова в оценку документа"""
+    k1 = Config.BM25_K1 if k1 is None else k1
+    return term_idf * tf * (k1 + 1) / (tf + norm)
+
+def top_k(scores, k):
+    """k лучших (имя, оценка) по убыванию оценки без сортировки всех документов.
+
+    При равных оценках сохраняется исходный порядок scores.
+    """
+    return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,231 @@
+import os
+from bot.core.config import Config
+from sqlalchemy import create_engine
+from bot.utils.blob_store import blob_store, SHARED_NAMESPACE
+from bot.utils.corpus_store import corpus_store, CorpusStore
+from bot.utils.fts_store import fts_store, FTSStore
+from bot.utils.mapped_text import use_mmap
+from bot.utils.query_parser import parse_query, leaf_words, is_positional
+from bot.utils.ranking import top_k
+from bot.utils.search_index import search_index, tokenize, InvertedIndex
+from bot.utils.search_tasks import substring_spans, regex_spans, build_snippets
+from bot.utils.trigram_index import trigram_index, normalize, trigrams, TrigramIndex
+
+# Сколько вхождений подстроки считать для BM25: дальше вклад частоты почти не растет
+SCORE_TF_LIMIT = 100
+
+class SearchEngine:
+    """Индексация и поиск по документам с выбором бэкенда (index или fts5).
+
+    Документы берутся из каталога пространства имен namespace в blob_store.
+    Без index_folder работает с общими индексами; с ним - со своим набором
+    индексов (шард пространства имен чата).
+    """
+
+    def __init__(self, backend=None, namespace=SHARED_NAMESPACE, index_folder=None):
+        self.backend = backend or Config.SEARCH_BACKEND
+        self.namespace = namespace
+        if index_folder is None:
+            self.search_index, self.trigram_index = search_index, trigram_index
+            self.corpus_store, self.fts_store = corpus_store, fts_store
+        else:
+            self.search_index = InvertedIndex(index_folder)
+            self.trigram_index = TrigramIndex(index_folder)
+            self.corpus_store = CorpusStore(index_folder)
+            os.makedirs(index_folder, exist_ok=True)
+            self.fts_store = FTSStore(db_engine=create_engine(
+                f"sqlite:///{os.path.join(index_folder, 'fts.db')}"
+            )) if self.backend == 'fts5' else None
+
+    @property
+    def use_fts(self):
+        return self.backend == 'fts5'
+
+    @property
+    def indexes(self):
+        """Индексы, которые обновляются вместе с документами"""
+        if self.use_fts:
+            # Регулярные выражения и подстроки в FTS5 обслуживает триграммный индекс
+            return (self.fts_store, self.trigram_index)
+        return (self.search_index, self.trigram_index, self.corpus_store)
+
+    def index_file(self, doc_name, doc_path):
+        """Индексация загруженного файла (на диск индексы пишет save)"""
+        return all([index.index_file(doc_name, doc_path) for index in self.indexes])
+
+    @property
+    def dirty(self):
+        """Есть индексы с изменениями, не сохраненными на диск"""
+        return any(index.dirty for index in self.indexes)
+
+    def save(self):
+        """Сохранение на диск индексов, измененных после прошлого сохранения"""
+        return all([index.save() for index in self.indexes if index.dirty])
+
+    def sync(self, doc_paths):
+        """Синхронизация индекса с каталогом при запуске: doc_paths - {имя файла: путь}"""
+        for index in self.indexes:
+            index.sync(doc_paths)
+
+    def clear(self):
+        """Удаление всех документов из индекса"""
+        for index in self.indexes:
+            index.clear()
+
+    # Поиск разбит на этапы, чтобы SearchExecutor мог выполнять работу с текстом
+    # документов в пуле процессов, а обращения к индексам - в основном процессе:
+    # 1. text_jobs / index_spans - кандидаты и позиции совпадений;
+    # 2. rank - оценки BM25 и выбор лучших документов;
+    # 3. snippet_jobs - фрагменты текста только для лучших.
+
+    def search(self, query, doc_names, search_type='exact', max_matches=10, context_size=100, limit=None):
+        """Поиск по документам с ранжированием BM25 (все этапы в текущем процессе).
+
+        Возвращает (результаты, число найденных документов). Результаты - список
+        {'filename', 'matches', 'match_count', 'score'} для limit самых
+        релевантных документов по убыванию оценки: фрагменты текста строятся
+        только для них.
+        """
+        limit = limit or Config.SEARCH_TOP_DOCS
+        search_type = self.resolve_type(query, search_type)
+        if self.uses_fts(search_type):
+            return self.search_fts(query, doc_names, search_type, max_matches, context_size, limit)
+
+        jobs = self.text_jobs(query, doc_names, search_type, max_matches)
+        if jobs is None:
+            spans_by_doc, terms = self.index_spans(query, doc_names, search_type)
+        else:
+            func, args_by_doc = jobs
+            spans_by_doc = self.collect_spans(args_by_doc, [func(*args) for args in args_by_doc.values()])
+            terms = None
+
+        best = self.rank(spans_by_doc, terms, limit)
+        snippets = [build_snippets(*args) for args in self.snippet_jobs(best, spans_by_doc, max_matches, context_size)]
+        return self.results(best, snippets), len(spans_by_doc)
+
+    @staticmethod
+    def resolve_type(query, search_type):
+        """"Фразы" и NEAR/k в обычном поиске ищутся по позициям слов, а не подстрокой"""
+        if search_type == 'exact' and is_positional(query):
+            return 'boolean'
+        return search_type
+
+    def uses_fts(self, search_type):
+        """Обслуживается ли тип поиска целиком в FTS5.
+
+        Обычный поиск - подстрока ("клюев" находит "ключевых"), а MATCH ищет
+        только целые слова, поэтому он и в FTS5 идет через триграммы.
+        """
+        return self.use_fts and search_type in ('boolean', 'fuzzy')
+
+    def search_fts(self, query, doc_names, search_type, max_matches, context_size, limit):
+        """Поиск в FTS5: ранжирование и фрагменты строит SQLite"""
+        if search_type == 'fuzzy':
+            ranked, total = self.fts_store.search_fuzzy(query, doc_names, max_matches, context_size, limit)
+        else:
+            ranked, total = self.fts_store.search(query, doc_names, max_matches, context_size, limit)
+        return [self._result(doc_name, score, matches) for doc_name, score, matches in ranked], total
+
+    def text_jobs(self, query, doc_names, search_type, max_matches):
+        """Задания на поиск в тексте: (функция, {имя файла: аргументы}).
+
+        None - если совпадения целиком находятся по инвертированному индексу.
+        """
+        max_spans = max(max_matches, SCORE_TF_LIMIT)
+        if search_type == 'regex':
+            candidates = self.trigram_index.regex_candidate_docs(query)
+            return regex_spans, {
+                doc_name: (self._doc_path(doc_name), query, max_spans)
+                for doc_name in doc_names
+                if candidates is None or doc_name in candidates or use_mmap(self._doc_path(doc_name))
+            }
+        if search_type in ('fuzzy', 'boolean'):
+            return None
+
+        # Подстрока: триграммы сужают поиск до блоков-кандидатов
+        blocks_by_doc = self.trigram_index.candidate_blocks(query)
+        candidates = None
+        if blocks_by_doc is None:
+            # Запрос короче триграммы или длиннее блока - фильтруем хотя бы документы
+            candidates = self.trigram_index.candidate_docs(trigrams(normalize(query)))
+
+        args_by_doc = {}
+        for doc_name in doc_names:
+            if use_mmap(self._doc_path(doc_name)):
+                # Больших TXT нет в триграммном индексе - просматриваются целиком через mmap
+                blocks = None
+            elif blocks_by_doc is not None:
+                if doc_name not in blocks_by_doc:
+                    continue
+                blocks = blocks_by_doc[doc_name]
+            else:
+                if candidates is not None and doc_name not in candidates:
+                    continue
+                blocks = None
+            args_by_doc[doc_name] = (
+                self._doc_path(doc_name), query, blocks,
+                self.trigram_index.block_size, self.trigram_index.step, max_spans,
+                # Без блоков документ просматривается целиком - по нормализованному
+                # корпусу (в FTS5 корпус не ведется)
+                self.corpus_store.locate(doc_name) if blocks is None and not self.use_fts else None,
+            )
+        return substring_spans, args_by_doc
+
+    @staticmethod
+    def collect_spans(args_by_doc, spans_list):
+        """Результаты заданий text_jobs -> {имя файла: позиции} (без пустых)"""
+        return {doc_name: spans for doc_name, spans in zip(args_by_doc, spans_list) if spans}
+
+    def index_spans(self, query, doc_names, search_type):
+        """Совпадения по инвертированному индексу: ({имя файла: позиции}, слова для BM25)"""
+        if search_type == 'fuzzy':
+            terms = self.search_index.fuzzy_terms(query)
+            return self._in_docs(self.search_index.find_terms(terms), doc_names), terms
+
+        tree = parse_query(query, tokenize)
+        return self._in_docs(self.search_index.find_boolean(tree), doc_names), leaf_words(tree)
+
+    def rank(self, spans_by_doc, terms, limit):
+        """Лучшие документы [(имя файла, оценка), ...].
+
+        terms - слова запроса для BM25 по индексу; None - запрос (подстрока или
+        регулярное выражение) считается одним словом с частотой по числу совпадений.
+        """
+        if terms is None:
+            scores = self._substring_scores(spans_by_doc)
+        else:
+            scores = self.search_index.score(terms)
+        return top_k({doc_name: scores.get(doc_name, 0.0) for doc_name in spans_by_doc}, limit)
+
+    def snippet_jobs(self, best, spans_by_doc, max_matches, context_size):
+        """Аргументы build_snippets для лучших документов"""
+        return [
+            (self._doc_path(doc_name), spans_by_doc[doc_name], max_matches, context_size)
+            for doc_name, _ in best
+        ]
+
+    def results(self, best, snippets):
+        """Сборка ответа из оценок и фрагментов"""
+        return [
+            self._result(doc_name, score, matches)
+            for (doc_name, score), matches in zip(best, snippets) if matches
+        ]
+
+    @staticmethod
+    def _result(doc_name, score, matches):
+        return {'filename': doc_name, 'matches': matches, 'match_count': len(matches), 'score': score}
+
+    def _doc_path(self, doc_name):
+        return blob_store.path(self.namespace, doc_name)
+
+    @staticmethod
+    def _in_docs(spans_by_doc, doc_names):
+        """Только документы из doc_names (в их порядке)"""
+        return {doc_name: spans_by_doc[doc_name] for doc_name in doc_names if doc_name in spans_by_doc}
+
+    def _substring_scores(self, spans_by_doc):
+        """BM25 для подстроки или регулярного выражения: весь запрос считается одним словом"""
+        return self.trigram_index.score_counts({doc_name: len(spans) for doc_name, spans in spans_by_doc.items()})
+
+# Глобальный экземпляр поискового движка
+search_engine = SearchEngine()
@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from bot.core.config import Config
+from bot.utils.search_engine import search_engine
+from bot.utils.search_tasks import init_worker, run_batch, parse_document, build_snippets
+
+class SearchTimeout(Exception):
+    """Поиск не уложился в отведенное время и был прерван"""
+
+class SearchExecutor:
+    """Пул процессов для разбора документов и поиска по их тексту.
+
+    Обращения к индексам выполняются в потоках основного процесса (индексы
+    живут там), а работа с текстом документов раздается процессам пачками
+    и затем сливается. Так тяжелый поиск не блокирует цикл событий бота
+    и занимает все ядра.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or Config.SEARCH_WORKERS or os.cpu_count() or 1
+        self._pool = None
+
+    def start(self):
+        """Запуск процессов (при первом поиске или после перезапуска пула)"""
+        if self._pool is None:
+            # Не fork: к этому моменту в процессе уже работают потоки (aiosqlite,
+            # to_thread), и копия их блокировок может навсегда остановить процесс.
+            # forkserver импортирует модули поиска один раз и порождает процессы от себя
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            if context.get_start_method() == 'forkserver':
+                context.set_forkserver_preload(['__main__', 'bot.utils.search_tasks'])
+            # Каждый процесс держит свой кэш текста в памяти - общий лимит делится между ними
+            max_chars = max(1, Config.TEXT_CACHE_MAX_CHARS // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context,
+                initializer=init_worker, initargs=(max_chars,),
+            )
+        return self._pool
+
+    def shutdown(self):
+        """Остановка процессов"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _recycle(self):
+        """Замена пула с завершением процессов.
+
+        Зависшее в процессе задание (например, регулярное выражение с
+        катастрофическим перебором) нельзя отменить - только завершить
+        процесс. Задания других поисков в этом пуле тоже прерываются,
+        следующий запуск создаст новый пул.
+        """
+        pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        processes = list((pool._processes or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    async def run(self, func, *args):
+        """Выполнение функции в процессе пула"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.start(), partial(func, *args))
+
+    async def map(self, func, args_list, timeout=None):
+        """func(*args) для каждого набора аргументов, результаты в том же порядке.
+
+        Задания делятся на пачки - по несколько на процесс, чтобы мелкие
+        документы не тратили время на передачу между процессами. Если за
+        timeout секунд задания не выполнены, процессы пула перезапускаются
+        и выбрасывается SearchTimeout.
+        """
+        args_list = list(args_list)
+        if not args_list:
+            return []
+
+        batch_size = max(1, -(-len(args_list) // (self.workers * 4)))
+        batches = [args_list[i:i + batch_size] for i in range(0, len(args_list), batch_size)]
+        tasks = asyncio.gather(*(self.run(run_batch, func, batch) for batch in batches))
+        try:
+            results = await asyncio.wait_for(tasks, timeout)
+        except asyncio.TimeoutError:
+            self._recycle()
+            raise SearchTimeout(f"поиск не уложился в {timeout} с") from None
+        return [result for batch in results for result in batch]
+
+    async def parse(self, doc_path):
+        """Разбор документа в процессе пула (текст попадает в общий дисковый кэш)"""
+        return await self.run(parse_document, doc_path)
+
+    async def sync(self, doc_paths, engine=None):
+        """Синхронизация индексов при запуске: документы разбираются на всех ядрах.
+
+        doc_paths - {имя файла: путь}; одинаковое содержимое разбирается один раз.
+        """
+        engine = engine or search_engine
+        await self.map(parse_document, [(doc_path,) for doc_path in set(doc_paths.values())])
+        await asyncio.to_thread(engine.sync, doc_paths)
+
+    async def index_file(self, doc_name, doc_path, engine=None):
+        """Индексация загруженного файла: разбор в пуле, обновление индексов в потоке"""
+        engine = engine or search_engine
+        await self.parse(doc_path)
+        return await asyncio.to_thread(engine.index_file, doc_name, doc_path)
+
+    async def search(self, query, doc_names, search_type='exact', max_matches=10, context_size=100, limit=None, engine=None):
+        """Асинхронный аналог SearchEngine.search с теми же результатами.
+
+        engine - движок пространства имен чата (по умолчанию общий search_engine).
+        """
+        engine = engine or search_engine
+        limit = limit or Config.SEARCH_TOP_DOCS
+        search_type = engine.resolve_type(query, search_type)
+        if engine.uses_fts(search_type):
+            return await asyncio.to_thread(
+                engine.search_fts, query, doc_names, search_type, max_matches, context_size, limit
+            )
+
+        jobs = await asyncio.to_thread(engine.text_jobs, query, doc_names, search_type, max_matches)
+        if jobs is None:
+            spans_by_doc, terms = await asyncio.to_thread(engine.index_spans, query, doc_names, search_type)
+        else:
+            func, args_by_doc = jobs
+            # Только выражения пользователя могут выполняться неограниченно долго
+            timeout = Config.REGEX_TIMEOUT if search_type == 'regex' else None
+            spans_by_doc = engine.collect_spans(args_by_doc, await self.map(func, args_by_doc.values(), timeout))
+            terms = None
+
+        best = await asyncio.to_thread(engine.rank, spans_by_doc, terms, limit)
+        snippets = await self.map(build_snippets, engine.snippet_jobs(best, spans_by_doc, max_matches, context_size))
+        return engine.results(best, snippets), len(spans_by_doc)
+
+# Глобальный экземпляр пула поиска
+search_executor = SearchExecutor()
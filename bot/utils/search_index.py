@@ -0,0 +1,472 @@
+import os
+import pickle
+import re
+import threading
+from array import array
+from pathlib import Path
+from bot.core.config import Config
+from bot.utils.document_cache import document_cache, DocumentCache
+from bot.utils.fuzzy_index import SymSpellIndex, allowed_distance
+from bot.utils.mapped_text import MappedText, use_mmap
+from bot.utils.postings import PostingList, intersect_all, union, difference, phrase_starts, near
+from bot.utils.query_parser import positive_leaves, Term, Phrase, Near, Field, Or, Not
+from bot.utils.ranking import idf, length_norm, bm25
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text):
+    """Разбиение текста на слова: (слово в нижнем регистре, начало, конец)"""
+    for match in TOKEN_PATTERN.finditer(text):
+        yield match.group().lower(), match.start(), match.end()
+
+class BaseIndex:
+    """Общая часть индексов: документы, сохранение на диск, синхронизация.
+
+    Индексация файла меняет индекс только в памяти и помечает его dirty;
+    на диск он пишется целиком через save() - после пачки загрузок
+    (IngestQueue), синхронизации и при остановке бота.
+    """
+
+    INDEX_FILE = None
+    STATE_FIELDS = ('next_doc_id', 'doc_ids', 'docs', 'total_length')
+
+    def __init__(self, index_folder=None):
+        self.index_path = Path(index_folder or Config.INDEX_FOLDER) / self.INDEX_FILE
+        self._lock = threading.RLock()
+        self._reset()
+        self.load()
+        self.dirty = False  # есть изменения, не сохраненные на диск
+
+    def _reset(self):
+        """Пустое состояние индекса"""
+        self.next_doc_id = 0
+        self.doc_ids = {}     # имя файла -> id документа
+        self.docs = {}        # id документа -> {'name', 'signature', 'length', 'path'}
+        self.total_length = 0  # сумма длин документов (для средней длины в BM25)
+        self._norms = None     # id документа -> нормировка BM25 по длине
+        self._by_path = None   # путь к содержимому -> id документов (строится по docs)
+
+    def load(self):
+        """Загрузка индекса с диска"""
+        try:
+            if self.index_path.exists():
+                with open(self.index_path, 'rb') as f:
+                    state = pickle.load(f)
+                with self._lock:
+                    for field in self.STATE_FIELDS:
+                        setattr(self, field, state[field])
+                    self._norms = None
+                    self._by_path = None
+        except Exception as e:
+            print(f"Ошибка загрузки индекса {self.INDEX_FILE}: {e}")
+            self._reset()
+
+    def save(self):
+        """Сохранение индекса на диск"""
+        try:
+            with self._lock:
+                self.dirty = False
+                state = {field: getattr(self, field) for field in self.STATE_FIELDS}
+                self.index_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = self.index_path.with_suffix('.tmp')
+                with open(tmp_file, 'wb') as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, self.index_path)
+            return True
+        except Exception as e:
+            self.dirty = True
+            print(f"Ошибка сохранения индекса {self.INDEX_FILE}: {e}")
+            return False
+
+    def is_current(self, doc_name, signature, path=None):
+        """Проверка, что документ уже проиндексирован в этой версии"""
+        doc_id = self.doc_ids.get(doc_name)
+        if doc_id is None:
+            return False
+        doc = self.docs[doc_id]
+        return doc['signature'] == signature and (path is None or doc.get('path') == path)
+
+    def _sources(self):
+        if self._by_path is None:
+            by_path = {}
+            for doc_id, doc in self.docs.items():
+                if doc.get('path'):
+                    by_path.setdefault(doc['path'], set()).add(doc_id)
+            self._by_path = by_path
+        return self._by_path
+
+    def same_content(self, path, signature):
+        """Проиндексированный документ с тем же файлом содержимого или None.
+
+        Пути в хранилище содержат хэш, так что одинаковый путь - одинаковое
+        содержимое под другим именем; его записи в индексе можно не строить заново.
+        """
+        with self._lock:
+            for doc_id in self._sources().get(path, ()):
+                if self.docs[doc_id]['signature'] == signature:
+                    return doc_id
+            return None
+
+    def _register(self, doc_name, signature, length=0, path=None):
+        """Выдача id документу (старая версия удаляется)"""
+        self._remove(doc_name)
+        doc_id = self.next_doc_id
+        self.next_doc_id += 1
+        self.doc_ids[doc_name] = doc_id
+        self.docs[doc_id] = {'name': doc_name, 'signature': signature, 'length': length, 'path': path}
+        self.total_length += length
+        self.dirty = True
+        self._norms = None
+        if path and self._by_path is not None:
+            self._by_path.setdefault(path, set()).add(doc_id)
+        return doc_id
+
+    def _unregister(self, doc_name):
+        """Удаление документа из списка документов, возвращает его id"""
+        doc_id = self.doc_ids.pop(doc_name, None)
+        if doc_id is not None:
+            self.dirty = True
+            doc = self.docs.pop(doc_id, None)
+            if doc is not None:
+                self.total_length -= doc['length']
+                if doc.get('path') and self._by_path is not None:
+                    same = self._by_path.get(doc['path'], set())
+                    same.discard(doc_id)
+                    if not same:
+                        self._by_path.pop(doc['path'], None)
+            self._norms = None
+        return doc_id
+
+    def _norm(self, doc_id):
+        """Нормировка BM25 по длине документа.
+
+        Считается для всех документов сразу и живет до следующего изменения
+        корпуса, так что при поиске длины не пересчитываются.
+        """
+        if self._norms is None:
+            avg_length = self.total_length / len(self.docs) if self.docs else 0
+            self._norms = {
+                doc_id: length_norm(doc['length'], avg_length)
+                for doc_id, doc in self.docs.items()
+            }
+        return self._norms[doc_id]
+
+    def score_counts(self, counts):
+        """BM25 для одного "слова" по числу его вхождений: {имя файла: оценка}.
+
+        Документы вне индекса оцениваются как документы средней длины.
+        """
+        with self._lock:
+            term_idf = idf(max(len(self.docs), len(counts)), len(counts))
+            return {
+                doc_name: bm25(tf, term_idf, self._norm(self.doc_ids[doc_name]) if doc_name in self.doc_ids else length_norm(1, 1))
+                for doc_name, tf in counts.items()
+            }
+
+    def add_document(self, doc_name, text, signature=None, path=None):
+        """Добавление (или переиндексация) документа; path - файл его содержимого"""
+        raise NotImplementedError
+
+    def _copy(self, doc_name, source_id):
+        """Документ с тем же содержимым, что у source_id (записи индекса общие)"""
+        raise NotImplementedError
+
+    def copy_document(self, doc_name, source_id):
+        """Добавление документа по записям документа с тем же содержимым"""
+        with self._lock:
+            if source_id in self.docs:
+                self._copy(doc_name, source_id)
+                return True
+            return False
+
+    def _remove(self, doc_name):
+        """Удаление документа из индекса (без сохранения)"""
+        raise NotImplementedError
+
+    def remove_document(self, doc_name):
+        """Удаление документа из индекса"""
+        with self._lock:
+            return self._remove(doc_name)
+
+    def clear(self):
+        """Удаление всех документов из индекса"""
+        with self._lock:
+            self._reset()
+        self.save()
+
+    def index_mapped(self, doc_name, doc_path):
+        """Индексация большого TXT (use_mmap).
+
+        По умолчанию такие файлы не индексируются: подстроки и регулярные
+        выражения ищутся в них прямо через mmap.
+        """
+        with self._lock:
+            self._remove(doc_name)
+        return True
+
+    def index_file(self, doc_name, doc_path):
+        """Индексация файла с диска (текст берется из кэша) без сохранения на диск"""
+        try:
+            if use_mmap(doc_path):
+                return self.index_mapped(doc_name, doc_path)
+
+            signature = DocumentCache.signature(doc_path)
+            if self.is_current(doc_name, signature, doc_path):
+                return True
+
+            source_id = self.same_content(doc_path, signature)
+            if source_id is None or not self.copy_document(doc_name, source_id):
+                text = document_cache.get_text(doc_path)
+                self.add_document(doc_name, text, signature, doc_path)
+            return True
+        except Exception as e:
+            print(f"Ошибка индексации {doc_name}: {e}")
+            return False
+
+    def sync(self, doc_paths):
+        """Приведение индекса в соответствие с файлами: doc_paths - {имя файла: путь}"""
+        with self._lock:
+            for doc_name in list(self.doc_ids):
+                if doc_name not in doc_paths:
+                    self._remove(doc_name)
+
+        for doc_name, doc_path in doc_paths.items():
+            self.index_file(doc_name, doc_path)
+        if self.dirty:
+            self.save()
+
+class InvertedIndex(BaseIndex):
+    """Инвертированный индекс: слово -> документы и позиции вхождений"""
+
+    INDEX_FILE = 'inverted.pkl'
+    STATE_FIELDS = BaseIndex.STATE_FIELDS + ('postings', 'offsets', 'doc_terms')
+
+    def _reset(self):
+        super()._reset()
+        self.postings = {}    # слово -> {id документа: array порядковых номеров слов}
+        self.offsets = {}     # id документа -> array (начало, конец) каждого слова
+        self.doc_terms = {}   # id документа -> список его слов (для удаления)
+        self._fuzzy = None    # словарь опечаток строится при первом нечетком поиске
+        self._doc_lists = {}  # слово -> PostingList id документов (кэш для булева поиска)
+
+    def load(self):
+        super().load()
+        self._fuzzy = None
+        self._doc_lists = {}
+
+    def add_document(self, doc_name, text, signature=None, path=None):
+        """Добавление (или переиндексация) документа"""
+        self.add_tokens(doc_name, tokenize(text), signature, path)
+
+    def index_mapped(self, doc_name, doc_path):
+        """Большие TXT индексируются потоком слов прямо из mmap файла.
+
+        Позиции слов в них - смещения в байтах, как и у совпадений, которые
+        MappedText находит и показывает во фрагментах.
+        """
+        # Пометка в сигнатуре: смещения в байтах, а не в символах текста
+        signature = DocumentCache.signature(doc_path) + ['mmap']
+        if self.is_current(doc_name, signature, doc_path):
+            return True
+        source_id = self.same_content(doc_path, signature)
+        if source_id is None or not self.copy_document(doc_name, source_id):
+            with MappedText(doc_path) as text:
+                self.add_tokens(doc_name, text.tokens(TOKEN_PATTERN), signature, doc_path)
+        return True
+
+    def add_tokens(self, doc_name, tokens, signature=None, path=None):
+        """Добавление документа по потоку (слово, начало, конец)"""
+        doc_positions = {}
+        offsets = array('I')
+        for position, (token, start, end) in enumerate(tokens):
+            doc_positions.setdefault(token, array('I')).append(position)
+            offsets.append(start)
+            offsets.append(end)
+
+        with self._lock:
+            doc_id = self._register(doc_name, signature, len(offsets) // 2, path)
+            self.offsets[doc_id] = offsets
+            self.doc_terms[doc_id] = list(doc_positions)
+
+            new_terms = [token for token in doc_positions if token not in self.postings]
+            for token, positions in doc_positions.items():
+                self.postings.setdefault(token, {})[doc_id] = positions
+                self._doc_lists.pop(token, None)
+
+            if self._fuzzy is not None:
+                self._fuzzy.add_terms(new_terms)
+
+    def _copy(self, doc_name, source_id):
+        # Массивы позиций после создания не меняются, поэтому общие
+        source = self.docs[source_id]
+        doc_id = self._register(doc_name, source['signature'], source['length'], source['path'])
+        self.offsets[doc_id] = self.offsets[source_id]
+        self.doc_terms[doc_id] = self.doc_terms[source_id]
+        for token in self.doc_terms[doc_id]:
+            doc_postings = self.postings[token]
+            doc_postings[doc_id] = doc_postings[source_id]
+            self._doc_lists.pop(token, None)
+
+    def _remove(self, doc_name):
+        """Удаление документа из индекса (без сохранения)"""
+        doc_id = self._unregister(doc_name)
+        if doc_id is None:
+            return False
+
+        dropped_terms = []
+        for token in self.doc_terms.pop(doc_id, []):
+            self._doc_lists.pop(token, None)
+            doc_postings = self.postings.get(token)
+            if doc_postings is not None:
+                doc_postings.pop(doc_id, None)
+                if not doc_postings:
+                    del self.postings[token]
+                    dropped_terms.append(token)
+
+        if self._fuzzy is not None:
+            self._fuzzy.remove_terms(dropped_terms)
+
+        self.offsets.pop(doc_id, None)
+        return True
+
+    def _doc_list(self, token):
+        """Отсортированный список документов со словом (id растут по мере добавления)"""
+        doc_list = self._doc_lists.get(token)
+        if doc_list is None:
+            doc_list = PostingList(list(self.postings.get(token, ())))
+            self._doc_lists[token] = doc_list
+        return doc_list
+
+    def _occurrences(self, node, doc_id, cache):
+        """Вхождения слова, фразы или NEAR в документе: [(номер первого слова, последнего), ...]"""
+        key = (id(node), doc_id)
+        occurrences = cache.get(key)
+        if occurrences is None:
+            if isinstance(node, Term):
+                occurrences = [(p, p) for p in self.postings.get(node.word, {}).get(doc_id, ())]
+            elif isinstance(node, Phrase):
+                last = len(node.words) - 1
+                position_lists = [self.postings.get(word, {}).get(doc_id, ()) for word in node.words]
+                occurrences = [(start, start + last) for start in phrase_starts(position_lists)]
+            else:
+                occurrences = near(
+                    self._occurrences(node.left, doc_id, cache),
+                    self._occurrences(node.right, doc_id, cache),
+                    node.distance,
+                )
+            cache[key] = occurrences
+        return occurrences
+
+    def _positional_docs(self, node, cache):
+        """Документы с фразой или NEAR: сначала пересечение списков документов,
+        затем проверка позиций только в оставшихся (текст не читается)"""
+        if isinstance(node, Phrase):
+            candidates = intersect_all([self._doc_list(word) for word in set(node.words)])
+        else:
+            candidates = intersect_all([self._evaluate(node.left, cache), self._evaluate(node.right, cache)])
+        return PostingList([doc_id for doc_id in candidates if self._occurrences(node, doc_id, cache)])
+
+    def _spans(self, doc_id, occurrences):
+        """Вхождения в номерах слов -> (начало, конец) в символах исходного текста"""
+        offsets = self.offsets[doc_id]
+        return [(offsets[2 * first], offsets[2 * last + 1]) for first, last in occurrences]
+
+    def _evaluate(self, node, cache):
+        """Вычисление узла запроса в список документов"""
+        if isinstance(node, Term):
+            return self._doc_list(node.word)
+        if isinstance(node, (Phrase, Near)):
+            return self._positional_docs(node, cache)
+        if isinstance(node, Field):
+            return PostingList([doc_id for doc_id, doc in self.docs.items() if node.matches(doc['name'])])
+        if isinstance(node, Or):
+            result = self._evaluate(node.children[0], cache)
+            for child in node.children[1:]:
+                result = union(result, self._evaluate(child, cache))
+            return result
+        if isinstance(node, Not):
+            return difference(PostingList(list(self.docs)), self._evaluate(node.child, cache))
+
+        # And: сначала пересекаем положительные условия, потом вычитаем NOT
+        positives = [child for child in node.children if not isinstance(child, Not)]
+        negatives = [child.child for child in node.children if isinstance(child, Not)]
+        if positives:
+            result = intersect_all([self._evaluate(child, cache) for child in positives])
+        else:
+            result = PostingList(list(self.docs))
+        for child in negatives:
+            if not result:
+                break
+            result = difference(result, self._evaluate(child, cache))
+        return result
+
+    def find_boolean(self, tree):
+        """Булев поиск: AND/OR/NOT, NEAR/k, скобки, "фразы", фильтры ext: и name:.
+
+        tree - запрос, разобранный parse_query. Возвращает {имя файла:
+        [(начало, конец), ...]} - позиции слов запроса в найденных документах
+        (пустой список, если совпали только фильтры).
+        """
+        leaves = positive_leaves(tree)
+
+        with self._lock:
+            cache = {}
+            matched = self._evaluate(tree, cache)
+
+            results = {}
+            for doc_id in matched:
+                spans = []
+                for leaf in leaves:
+                    spans.extend(self._spans(doc_id, self._occurrences(leaf, doc_id, cache)))
+                results[self.docs[doc_id]['name']] = sorted(spans)
+            return results
+
+    def expand_term(self, term, max_distance=None):
+        """Слова словаря, отличающиеся от term не больше чем на max_distance правок"""
+        if max_distance is None:
+            max_distance = Config.FUZZY_MAX_DISTANCE
+
+        with self._lock:
+            if self._fuzzy is None:
+                self._fuzzy = SymSpellIndex()
+                self._fuzzy.add_terms(self.postings)
+            return [word for word, _ in self._fuzzy.lookup(term, allowed_distance(term, max_distance))]
+
+    def find_terms(self, terms):
+        """Позиции любого из слов: {имя файла: [(начало, конец), ...]} по возрастанию"""
+        with self._lock:
+            results = {}
+            for term in terms:
+                for doc_id, positions in self.postings.get(term, {}).items():
+                    offsets = self.offsets[doc_id]
+                    results.setdefault(self.docs[doc_id]['name'], []).extend(
+                        (offsets[2 * p], offsets[2 * p + 1]) for p in positions
+                    )
+
+        for spans in results.values():
+            spans.sort()
+        return results
+
+    def fuzzy_terms(self, query, max_distance=None):
+        """Слова запроса вместе с похожими словами словаря"""
+        terms = set()
+        for token, _, _ in tokenize(query):
+            terms.update(self.expand_term(token, max_distance))
+        return terms
+
+    def score(self, terms):
+        """Оценка BM25 документов, где есть хотя бы одно из слов: {имя файла: оценка}"""
+        with self._lock:
+            doc_count = len(self.docs)
+            scores = {}
+            for term in set(terms):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                term_idf = idf(doc_count, len(postings))
+                for doc_id, positions in postings.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + bm25(len(positions), term_idf, self._norm(doc_id))
+            return {self.docs[doc_id]['name']: value for doc_id, value in scores.items()}
+
+# Глобальный экземпляр индекса
+search_index = InvertedIndex()
\ No newline at end of file
@@ -1,33 +1,53 @@
+import asyncio
+import datetime
 import json
-import os
+import time
+from collections import OrderedDict
 from pathlib import Path
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from bot.core.config import Config
+from bot.utils.database import async_engine
+from bot.utils.write_behind import WriteBehind
+from models.user import UserSettings
 
-class SearchSettings:
-    """Класс для управления настройками поиска"""
+class SearchSettings(WriteBehind):
+    """Класс для управления настройками поиска.
+
+    search_settings.json - общие настройки по умолчанию. Личные настройки
+    пользователя хранятся в таблице user_settings (только отличия от общих),
+    читаются через LRU-кэш и пишутся в БД пакетами в фоне.
+    """
+    
+    NAME = 'Settings'
     
-    def __init__(self):
+    def __init__(self, flush_ms=None, cache_size=None, cache_ttl=None):
+        super().__init__(flush_ms or Config.SETTINGS_FLUSH_MS)
         self.settings_file = Path("search_settings.json")
         self.default_settings = {
             'context_size': 100,
             'max_matches_per_file': 10,
-            'search_type': 'exact',  # exact, fuzzy, boolean
+            'search_type': 'exact',  # exact, fuzzy, boolean, regex
             'auto_translate': False,
             'show_preview': True
         }
         self.settings = self.load_settings()
+        self.cache_size = cache_size or Config.SETTINGS_CACHE_SIZE
+        self.cache_ttl = cache_ttl or Config.SETTINGS_CACHE_TTL
+        self._cache = OrderedDict()  # user_id -> (личные настройки, время устаревания)
     
     def load_settings(self):
-        """Загрузка настроек из файла"""
+        """Загрузка общих настроек из файла"""
         try:
             if self.settings_file.exists():
                 with open(self.settings_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    return {**self.default_settings, **json.load(f)}
             return self.default_settings.copy()
         except Exception:
             return self.default_settings.copy()
     
     def save_settings(self):
-        """Сохранение настроек в файл"""
+        """Сохранение общих настроек в файл"""
         try:
             with open(self.settings_file, 'w', encoding='utf-8') as f:
                 json.dump(self.settings, f, ensure_ascii=False, indent=2)
@@ -36,21 +56,78 @@ class SearchSettings:
             print(f"Ошибка сохранения настроек: {e}")
             return False
     
-    def get_setting(self, key, user_id=None):
-        """Получение значения настройки"""
-        if user_id:
-            # В будущем можно сделать персональные настройки
-            return self.settings.get(key, self.default_settings.get(key))
+    async def _user_settings(self, user_id):
+        """Личные настройки пользователя: из буфера записи, кэша или БД"""
+        key = str(user_id)
+        overrides = self._pending(key)
+        if overrides is not None:
+            return overrides
+
+        entry = self._cache.get(key)
+        if entry is not None and entry[1] >= time.monotonic():
+            self._cache.move_to_end(key)
+            return entry[0]
+
+        async with async_engine.connect() as conn:
+            stored = await conn.scalar(select(UserSettings.settings).where(UserSettings.user_id == key))
+        # Пока шло чтение, пользователь мог изменить настройку
+        overrides = self._pending(key)
+        if overrides is None:
+            overrides = json.loads(stored) if stored else {}
+            self._remember(key, overrides)
+        return overrides
+    
+    def _remember(self, key, overrides):
+        self._cache[key] = (overrides, time.monotonic() + self.cache_ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+    
+    async def get_setting(self, key, user_id=None):
+        """Получение значения настройки (личной, если пользователь ее менял)"""
+        if user_id is not None:
+            overrides = await self._user_settings(user_id)
+            if key in overrides:
+                return overrides[key]
         return self.settings.get(key, self.default_settings.get(key))
     
-    def set_setting(self, key, value, user_id=None):
-        """Установка значения настройки"""
-        self.settings[key] = value
-        return self.save_settings()
+    async def set_setting(self, key, value, user_id=None):
+        """Установка значения настройки.
+
+        С user_id меняется только личная настройка пользователя (в БД она
+        попадет со следующей пакетной записью), без него - общая в файле.
+        """
+        if user_id is None:
+            self.settings[key] = value
+            return await asyncio.to_thread(self.save_settings)
+
+        overrides = dict(await self._user_settings(user_id))
+        overrides[key] = value
+        user_key = str(user_id)
+        self._dirty[user_key] = overrides
+        self._remember(user_key, overrides)
+        self._changed()
+        return True
+    
+    async def get_all_settings(self, user_id=None):
+        """Получение всех настроек (с учетом личных)"""
+        settings = self.settings.copy()
+        if user_id is not None:
+            settings.update(await self._user_settings(user_id))
+        return settings
     
-    def get_all_settings(self):
-        """Получение всех настроек"""
-        return self.settings.copy()
+    async def _write(self, dirty):
+        now = datetime.datetime.utcnow()
+        statement = insert(UserSettings.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={'settings': statement.excluded.settings, 'updated_at': statement.excluded.updated_at},
+        )
+        async with async_engine.begin() as conn:
+            await conn.execute(statement, [
+                {'user_id': user_id, 'settings': json.dumps(overrides, ensure_ascii=False), 'updated_at': now}
+                for user_id, overrides in dirty.items()
+            ])
 
 # Глобальный экземпляр настроек
-search_settings = SearchSettings()
\ No newline at end of file
+search_settings = SearchSettings()
@@ -0,0 +1,71 @@
+from bot.utils.corpus_store import open_blob, normalize_query, scan
+from bot.utils.document_cache import document_cache
+from bot.utils.document_parser import DocumentParser
+from bot.utils.mapped_text import MappedText, use_mmap
+from bot.utils.trigram_index import find_in_blocks, find_spans, find_regex, compile_regex, normalize
+
+# Функции этого модуля выполняются в процессах пула поиска. Они получают
+# только пути к файлам и параметры, а текст берут из document_cache: его
+# дисковая часть общая для всех процессов, поэтому документ разбирается один раз.
+# Большие TXT (use_mmap) в кэш не попадают: поиск и фрагменты идут по mmap файла,
+# а позиции совпадений в них (и слов в инвертированном индексе) - смещения в байтах.
+
+def init_worker(max_chars):
+    """Настройка процесса пула: его доля лимита текста в памяти"""
+    document_cache.max_chars = max_chars
+
+def run_batch(func, batch):
+    """Выполнение одной функции для пачки аргументов (меньше обменов с процессом)"""
+    return [func(*args) for args in batch]
+
+def parse_document(doc_path):
+    """Извлечение текста документа в дисковый кэш, возвращает длину текста"""
+    if use_mmap(doc_path):
+        return 0
+    return len(document_cache.open_text(doc_path))
+
+def substring_spans(doc_path, query, blocks, block_size, step, max_matches, corpus=None):
+    """Вхождения подстроки в документе: в блоках-кандидатах или во всем тексте (blocks=None).
+
+    corpus - место документа в нормализованном корпусе (CorpusStore.locate):
+    тогда весь текст просматривается прямо в файле корпуса.
+    """
+    if use_mmap(doc_path):
+        with MappedText(doc_path) as text:
+            return text.find(query, max_matches)
+    if blocks is None and corpus is not None:
+        blob_path, start, end = corpus
+        if start == end:
+            return []
+        return scan(open_blob(blob_path), normalize_query(query), start, end, max_matches)
+    if blocks is None:
+        return find_spans(document_cache.get_text(doc_path), query, max_matches)
+    # Читаются только блоки-кандидаты, а не весь документ
+    return find_in_blocks(document_cache.open_text(doc_path), query, blocks, block_size, step, max_matches)
+
+def regex_spans(doc_path, pattern, max_matches):
+    """Совпадения регулярного выражения в документе"""
+    if use_mmap(doc_path):
+        with MappedText(doc_path) as text:
+            return text.find_regex(compile_regex(pattern), max_matches, normalize)
+    return find_regex(document_cache.get_text(doc_path), pattern, max_matches)
+
+def build_snippets(doc_path, spans, max_matches, context_size):
+    """Фрагменты с подсветкой и местом в документе ("стр. 12").
+
+    Текст читается только вокруг совпадений. Без позиций (совпали только
+    фильтры) - начало документа.
+    """
+    if use_mmap(doc_path):
+        with MappedText(doc_path) as text:
+            return text.snippets(spans, max_matches, context_size)
+
+    text = document_cache.open_text(doc_path)
+    if not spans:
+        return [text[:2 * context_size].strip() + "..."] if len(text) else []
+
+    snippets = []
+    for (start, _), snippet in zip(spans, DocumentParser.format_matches(text, spans, max_matches=max_matches, context_size=context_size)):
+        label = text.locate(start)
+        snippets.append(f"[{label}] {snippet}" if label else snippet)
+    return snippets
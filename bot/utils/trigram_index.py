@@ -0,0 +1,216 @@
+import re
+from array import array
+from bot.core.config import Config
+from bot.utils.search_index import BaseIndex
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# ё -> е не меняет длину строки, поэтому позиции остаются как в исходном тексте
+NORMALIZE_TABLE = str.maketrans({'ё': 'е', 'Ё': 'е'})
+
+def normalize(text):
+    """Нормализация текста для поиска (casefold, ё -> е) без изменения позиций символов.
+
+    Общая для триграмм, блоков, регулярных выражений и корпуса (corpus_store).
+    """
+    folded = text.casefold()
+    if len(folded) != len(text):
+        # Символы, которые раскрываются в несколько (ß -> ss)
+        folded = ''.join(ch.casefold() if len(ch.casefold()) == 1 else ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+    return folded.translate(NORMALIZE_TABLE)
+
+def trigrams(text):
+    """Множество триграмм нормализованной строки"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def find_spans(text, query, max_matches=None):
+    """Все вхождения подстроки без учета регистра: [(начало, конец), ...]"""
+    text = normalize(text)
+    query = normalize(query)
+    spans = []
+    pos = text.find(query)
+    while pos != -1 and (max_matches is None or len(spans) < max_matches):
+        spans.append((pos, pos + len(query)))
+        pos = text.find(query, pos + 1)
+    return spans
+
+def find_in_blocks(text, query, blocks, block_size, step, max_matches=None):
+    """Позиции подстроки только внутри указанных блоков (блоки начинаются через step символов)"""
+    query = normalize(query)
+    spans = []
+    for block_no in blocks:
+        if max_matches is not None and len(spans) >= max_matches:
+            break
+        block_start = block_no * step
+        block = normalize(text[block_start:block_start + block_size])
+        pos = block.find(query)
+        while pos != -1 and (max_matches is None or len(spans) < max_matches):
+            start = block_start + pos
+            # Вхождение в зоне перекрытия засчитываем только одному блоку
+            if start // step == block_no:
+                spans.append((start, start + len(query)))
+            pos = block.find(query, pos + 1)
+    return spans
+
+def compile_regex(pattern):
+    """Компиляция пользовательского выражения для поиска по нормализованному тексту"""
+    return re.compile(pattern.translate(NORMALIZE_TABLE), re.IGNORECASE | re.MULTILINE)
+
+def find_regex(text, pattern, max_matches=None):
+    """Непустые совпадения регулярного выражения без учета регистра: [(начало, конец), ...]"""
+    regex = compile_regex(pattern)
+    spans = []
+    for match in regex.finditer(normalize(text)):
+        if match.end() > match.start():
+            spans.append(match.span())
+            if max_matches is not None and len(spans) >= max_matches:
+                break
+    return spans
+
+def required_literals(pattern):
+    """Строки, которые обязательно входят в любое совпадение регулярного выражения"""
+    literals = []
+
+    def walk(items):
+        run = []
+
+        def flush():
+            if len(run) >= 3:
+                literals.append(''.join(run))
+            run.clear()
+
+        for op, arg in items:
+            if op is sre_constants.LITERAL:
+                run.append(normalize(chr(arg)))
+            elif op is sre_constants.AT:
+                # ^, $, \b не занимают символов
+                continue
+            elif op is sre_constants.SUBPATTERN:
+                flush()
+                walk(arg[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                flush()
+                min_count, _, item = arg
+                if min_count >= 1:
+                    walk(item)
+            else:
+                # Классы символов, альтернативы, любые символы
+                flush()
+        flush()
+
+    walk(sre_parse.parse(pattern))
+    return literals
+
+class TrigramIndex(BaseIndex):
+    """Триграммный индекс по блокам нормализованного текста.
+
+    Документ режется на блоки BLOCK_SIZE символов с перекрытием BLOCK_OVERLAP,
+    поэтому любое вхождение подстроки не длиннее перекрытия целиком лежит
+    в блоке с номером start // step.
+    """
+
+    INDEX_FILE = 'trigram.pkl'
+    STATE_FIELDS = BaseIndex.STATE_FIELDS + ('postings', 'doc_trigrams')
+
+    def __init__(self, index_folder=None, block_size=None, block_overlap=None):
+        self.block_size = block_size or Config.TRIGRAM_BLOCK_SIZE
+        self.block_overlap = block_overlap or Config.TRIGRAM_BLOCK_OVERLAP
+        self.step = self.block_size - self.block_overlap
+        super().__init__(index_folder)
+
+    def _reset(self):
+        super()._reset()
+        self.postings = {}       # триграмма -> {id документа: array номеров блоков}
+        self.doc_trigrams = {}   # id документа -> список его триграмм (для удаления)
+
+    def add_document(self, doc_name, text, signature=None, path=None):
+        """Добавление (или переиндексация) документа"""
+        text = normalize(text)
+        doc_postings = {}
+        for block_no, start in enumerate(range(0, max(len(text), 1), self.step)):
+            for trigram in trigrams(text[start:start + self.block_size]):
+                doc_postings.setdefault(trigram, array('I')).append(block_no)
+
+        with self._lock:
+            doc_id = self._register(doc_name, signature, len(text), path)
+            self.doc_trigrams[doc_id] = list(doc_postings)
+            for trigram, blocks in doc_postings.items():
+                self.postings.setdefault(trigram, {})[doc_id] = blocks
+
+    def _copy(self, doc_name, source_id):
+        source = self.docs[source_id]
+        doc_id = self._register(doc_name, source['signature'], source['length'], source['path'])
+        self.doc_trigrams[doc_id] = self.doc_trigrams[source_id]
+        for trigram in self.doc_trigrams[doc_id]:
+            doc_postings = self.postings[trigram]
+            doc_postings[doc_id] = doc_postings[source_id]
+
+    def _remove(self, doc_name):
+        """Удаление документа из индекса (без сохранения)"""
+        doc_id = self._unregister(doc_name)
+        if doc_id is None:
+            return False
+
+        for trigram in self.doc_trigrams.pop(doc_id, []):
+            doc_postings = self.postings.get(trigram)
+            if doc_postings is not None:
+                doc_postings.pop(doc_id, None)
+                if not doc_postings:
+                    del self.postings[trigram]
+        return True
+
+    def candidate_docs(self, grams):
+        """Документы, содержащие все триграммы (None - фильтр невозможен)"""
+        if not grams:
+            return None
+
+        with self._lock:
+            grams_postings = sorted((self.postings.get(g, {}) for g in grams), key=len)
+            if not grams_postings[0]:
+                return set()
+
+            doc_ids = set(grams_postings[0])
+            for postings in grams_postings[1:]:
+                doc_ids.intersection_update(postings)
+                if not doc_ids:
+                    break
+            return {self.docs[doc_id]['name'] for doc_id in doc_ids}
+
+    def candidate_blocks(self, query):
+        """Блоки, где может находиться подстрока: {имя файла: [номера блоков]}.
+
+        None - если запрос короче триграммы или длиннее перекрытия блоков,
+        тогда по блокам отфильтровать нельзя.
+        """
+        query = normalize(query)
+        grams = trigrams(query)
+        if not grams or len(query) > self.block_overlap:
+            return None
+
+        with self._lock:
+            grams_postings = sorted((self.postings.get(g, {}) for g in grams), key=len)
+            results = {}
+            for doc_id, blocks in grams_postings[0].items():
+                candidates = set(blocks)
+                for postings in grams_postings[1:]:
+                    candidates.intersection_update(postings.get(doc_id, ()))
+                    if not candidates:
+                        break
+                if candidates:
+                    results[self.docs[doc_id]['name']] = sorted(candidates)
+            return results
+
+    def regex_candidate_docs(self, pattern):
+        """Документы, которые могут содержать совпадение с регулярным выражением"""
+        grams = set()
+        for literal in required_literals(pattern):
+            grams |= trigrams(literal)
+        return self.candidate_docs(grams)
+
+# Глобальный экземпляр триграммного индекса
+trigram_index = TrigramIndex()
\ No newline at end of file
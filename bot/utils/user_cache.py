@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from bot.core.config import Config
+
+@dataclass
+class UserRecord:
+    """Профиль пользователя без привязки к сессии SQLAlchemy.
+
+    __slots__ вместо __dict__: сотни тысяч записей в кэше занимают в разы
+    меньше памяти, чем ORM-объекты.
+    """
+
+    __slots__ = ('id', 'user_id', 'username', 'full_name', 'created_at', 'last_activity',
+                 'documents_uploaded', 'searches_performed', 'is_active')
+
+    id: int
+    user_id: str
+    username: Optional[str]
+    full_name: Optional[str]
+    created_at: datetime
+    last_activity: datetime
+    documents_uploaded: int
+    searches_performed: int
+    is_active: bool
+
+    @classmethod
+    def from_model(cls, user):
+        """Запись из ORM-объекта User"""
+        return cls(
+            id=user.id,
+            user_id=user.user_id,
+            username=user.username,
+            full_name=user.full_name,
+            created_at=user.created_at,
+            last_activity=user.last_activity,
+            documents_uploaded=user.documents_uploaded or 0,
+            searches_performed=user.searches_performed or 0,
+            is_active=user.is_active,
+        )
+
+class UserCache:
+    """LRU-кэш профилей пользователей с временем жизни записей.
+
+    Держит не больше max_size записей; запись старше ttl секунд перечитывается
+    из БД (на случай изменений из другого процесса). Изменения, которые делает
+    сам бот, записываются и в БД, и в кэш.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or Config.USER_CACHE_SIZE
+        self.ttl = ttl or Config.USER_CACHE_TTL
+        self._records = OrderedDict()  # user_id -> (UserRecord, время устаревания)
+        self._lock = threading.Lock()
+        self.generation = 0  # растет с каждой записью счетчиков в БД
+        self._updating = 0   # записей счетчиков в работе
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Запись пользователя или None, если ее нет или она устарела"""
+        key = str(user_id)
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._records[key]
+                self.misses += 1
+                return None
+            self._records.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, record, generation=None):
+        """Добавление или замена записи.
+
+        generation - значение self.generation до чтения записи из БД: если за
+        время чтения счетчики записывались, запись могла устареть (или уже
+        включать изменения, которые еще будут применены к кэшу) и не кэшируется.
+        """
+        with self._lock:
+            if generation is not None and (self._updating or generation != self.generation):
+                return
+            self._records[record.user_id] = (record, time.monotonic() + self.ttl)
+            self._records.move_to_end(record.user_id)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def begin_update(self):
+        """Начало записи счетчиков в БД"""
+        with self._lock:
+            self._updating += 1
+            self.generation += 1
+
+    def end_update(self):
+        """Конец записи счетчиков в БД"""
+        with self._lock:
+            self._updating -= 1
+            self.generation += 1
+
+    def add_counters(self, user_id, documents=0, searches=0, last_activity=None):
+        """Применение записанных в БД изменений к записи в кэше (если она есть)"""
+        with self._lock:
+            entry = self._records.get(str(user_id))
+            if entry is None:
+                return
+            record = entry[0]
+            record.documents_uploaded += documents
+            record.searches_performed += searches
+            if last_activity is not None:
+                record.last_activity = last_activity
+
+    def status(self):
+        """Размер кэша и доля попаданий"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._records),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+# Глобальный кэш профилей пользователей
+user_cache = UserCache()
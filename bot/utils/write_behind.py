@@ -0,0 +1,106 @@
+import asyncio
+from bot.utils.logger import logger
+
+class WriteBehind:
+    """Отложенная пакетная запись в БД.
+
+    Изменения копятся в self._dirty (ключ -> значение) и пишутся одной
+    транзакцией раз в flush_ms миллисекунд или сразу, как накопится
+    max_events изменений. Наследник реализует _write(dirty) - запись пачки
+    одной транзакцией - и при необходимости _restore(dirty), если не
+    записанное нужно не просто вернуть, а слить с более свежими изменениями.
+
+    Объекты создаются при импорте, до запуска цикла событий, поэтому
+    фоновая задача запускается при первом изменении (или явно через start).
+    """
+
+    NAME = 'Write-behind'
+
+    def __init__(self, flush_ms, max_events=None):
+        self.flush_ms = flush_ms
+        self.max_events = max_events
+        self._dirty = {}     # ключ -> изменение, еще не записанное в БД
+        self._flushing = {}  # изменения, которые пишутся прямо сейчас
+        self._events = 0
+        self._wakeup = None
+        self._task = None
+        self._lock = None
+        self._stopping = False
+        self.flushes = 0
+        self.written = 0
+
+    def start(self):
+        """Запуск фоновой записи (внутри работающего цикла событий)"""
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    def _changed(self):
+        """Учет одного изменения в self._dirty"""
+        self._events += 1
+        if self._task is None:
+            if not self._stopping:
+                self.start()
+        elif self.max_events and self._events >= self.max_events:
+            self._wakeup.set()
+
+    def _pending(self, key):
+        """Еще не записанное изменение ключа (в том числе из идущей записи) или None"""
+        value = self._dirty.get(key)
+        return value if value is not None else self._flushing.get(key)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _write(self, dirty):
+        """Запись пачки изменений одной транзакцией"""
+        raise NotImplementedError
+
+    def _restore(self, dirty):
+        # Более свежие изменения, сделанные во время записи, не затираем
+        for key, value in dirty.items():
+            self._dirty.setdefault(key, value)
+
+    async def flush(self):
+        """Запись накопленных изменений одной транзакцией"""
+        if not self._dirty:
+            return
+        async with self._lock or asyncio.Lock():
+            if not self._dirty:
+                return
+            # Новые изменения во время записи копятся уже в новом словаре
+            dirty, self._dirty, self._events = self._dirty, {}, 0
+            self._flushing = dirty
+            try:
+                await self._write(dirty)
+            except Exception as e:
+                logger.error(f"{self.NAME} flush error ({len(dirty)} keys): {e}")
+                self._restore(dirty)
+                self._events += len(dirty)
+                return
+            finally:
+                self._flushing = {}
+            self.flushes += 1
+            self.written += len(dirty)
+
+    async def close(self):
+        """Остановка фоновой записи и запись всего, что накопилось"""
+        self._stopping = True
+        task, self._task = self._task, None
+        if task is not None:
+            # Не отменяем задачу посреди транзакции - просим ее выйти после записи
+            self._wakeup.set()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    def status(self):
+        """Размер очереди записи и число записей"""
+        return {'pending': len(self._dirty), 'flushes': self.flushes, 'written': self.written}
@@ -0,0 +1,144 @@
+"""Локальный стенд для проверки режима вебхука без Telegram.
+
+Поднимает фальшивый Bot API (запоминает отправленные ботом сообщения),
+запускает маршрутизатор вебхука с процессами-обработчиками и шлет ему
+апдейты /id от нескольких чатов. Каждый апдейт приходит от своего
+пользователя, поэтому по ответам бота видно, в каком порядке апдейты
+чата были обработаны.
+
+    python fake_telegram.py --workers 4 --chats 50 --updates 20 --restart
+
+Запускается во временной папке: база, документы и логи реальных данных
+не затрагиваются.
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+
+API_PORT = 8089
+
+class FakeTelegram:
+    """Фальшивый Bot API: отвечает на любые методы и запоминает sendMessage"""
+
+    def __init__(self):
+        self.sent = {}  # id чата -> [текст сообщения, ...]
+        self.calls = 0
+
+    async def handle(self, request):
+        from aiohttp import web
+        method = request.match_info['method'].lower()
+        params = dict(await request.post())
+        self.calls += 1
+        if method == 'getme':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        elif method in ('sendmessage', 'editmessagetext'):
+            chat_id = int(params['chat_id'])
+            if method == 'sendmessage':
+                self.sent.setdefault(chat_id, []).append(params.get('text', ''))
+            result = {
+                'message_id': self.calls, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+                'text': params.get('text', ''),
+            }
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+def make_update(update_id, chat_id, user_id):
+    chat = {'id': chat_id, 'type': 'private'} if chat_id > 0 else {'id': chat_id, 'type': 'supergroup', 'title': f'Group {chat_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'chat': chat,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+            'text': '/id', 'entities': [{'type': 'bot_command', 'offset': 0, 'length': 3}],
+        },
+    }
+
+async def run(args):
+    import aiohttp
+    from aiohttp import web
+    from bot.core.config import Config
+    from bot.core.webhook import UpdateRouter
+
+    Config.WEBHOOK_URL = f"http://127.0.0.1:{args.port}/webhook"
+    Config.WEBHOOK_HOST = '127.0.0.1'
+    Config.WEBHOOK_PORT = args.port
+    Config.WEBHOOK_SECRET = 'fake-secret'
+
+    telegram = FakeTelegram()
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', telegram.handle)
+    api_runner = web.AppRunner(app)
+    await api_runner.setup()
+    await web.TCPSite(api_runner, '127.0.0.1', API_PORT).start()
+
+    router = UpdateRouter(args.workers)
+    await router.start()
+
+    # Половина чатов - личные, половина - группы
+    chats = [(i + 1) * (1 if i % 2 else -1) for i in range(args.chats)]
+    headers = {'X-Telegram-Bot-Api-Secret-Token': Config.WEBHOOK_SECRET}
+    update_ids = iter(range(1, args.chats * args.updates + 1))
+    started = time.monotonic()
+
+    async def send_chat(session, chat_id):
+        # Как и Telegram, апдейты одного чата отправляются по порядку
+        for seq in range(args.updates):
+            update = make_update(next(update_ids), chat_id, abs(chat_id) * 1000 + seq)
+            async with session.post(Config.WEBHOOK_URL, json=update, headers=headers) as response:
+                assert response.status == 200, response.status
+
+    async with aiohttp.ClientSession() as session:
+        senders = asyncio.gather(*(send_chat(session, chat_id) for chat_id in chats))
+        if args.restart:
+            # Перезапуск процессов посреди потока апдейтов
+            await asyncio.sleep(0.5)
+            await router.restart()
+        await senders
+
+    expected = args.chats * args.updates
+    deadline = time.monotonic() + args.timeout
+    while sum(len(texts) for texts in telegram.sent.values()) < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    elapsed = time.monotonic() - started
+
+    received = sum(len(texts) for texts in telegram.sent.values())
+    out_of_order = 0
+    for chat_id in chats:
+        seqs = [int(m.group(1)) % 1000 for m in (re.search(r'(\d+)', text) for text in telegram.sent.get(chat_id, [])) if m]
+        if seqs != sorted(seqs):
+            out_of_order += 1
+
+    print(f"Процессов: {router.count}, апдейтов: {expected}, ответов: {received}, за {elapsed:.1f} с")
+    print(f"Чатов с нарушенным порядком: {out_of_order}, повторных передач: {router.retries}, отброшено: {router.dropped}")
+
+    await router.stop()
+    await api_runner.cleanup()
+    return received == expected and out_of_order == 0 and router.dropped == 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--updates', type=int, default=10, help='апдейтов на чат')
+    parser.add_argument('--port', type=int, default=8088, help='порт вебхука')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--restart', action='store_true', help='перезапустить процессы во время теста')
+    args = parser.parse_args()
+
+    # До импорта бота: процессы-обработчики наследуют окружение и рабочую папку
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ['BOT_API_SERVER'] = f"http://127.0.0.1:{API_PORT}"
+    os.chdir(tempfile.mkdtemp(prefix='fake_telegram_'))
+
+    ok = asyncio.run(run(args))
+    print("✅ OK" if ok else "❌ FAIL")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
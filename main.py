@@ -1,24 +1,21 @@
 import asyncio
+import sys
 from bot.core.loader import bot, dp
 from bot.core.config import Config
+from bot.core.lifecycle import startup, shutdown
 from bot.utils.logger import logger
-from bot.utils.database import create_tables
-from bot.middlewares.errors import setup_error_handling
-from bot.utils.api_client import api_client
 
-# Импортируем ВСЕ обработчики
-from bot.handlers import private, common, groups, group_admin, channel
-
-async def main():
+async def main(mode=None):
     """Главная функция запуска бота"""
-    logger.info("Запуск улучшенного бота с администрированием групп и каналов...")
+    mode = mode or Config.BOT_MODE
+    if mode == 'webhook':
+        # Прием апдейтов через вебхук несколькими процессами
+        from bot.core.webhook import run_webhook
+        await run_webhook()
+        return
     
-    # Создаем таблицы БД
-    create_tables()
-    logger.info("База данных инициализирована")
-    
-    # Настройка обработки ошибок
-    setup_error_handling(dp)
+    logger.info("Запуск улучшенного бота с администрированием групп и каналов...")
+    await startup()
     
     # Удаляем вебхук и запускаем поллинг
     await bot.delete_webhook(drop_pending_updates=True)
@@ -27,12 +24,12 @@ async def main():
     try:
         await dp.start_polling(bot)
     finally:
-        # Закрываем соединения с API
-        await api_client.close()
+        await shutdown()
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # python main.py webhook - прием апдейтов через вебхук вместо поллинга
+        asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
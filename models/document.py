@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, UniqueConstraint
+from models.user import Base
+
+class Blob(Base):
+    """Содержимое файла в хранилище, адресуемое SHA-256"""
+    __tablename__ = "blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    extension = Column(String)  # по расширению выбирается парсер
+    size = Column(Integer, default=0)
+    refcount = Column(Integer, default=0)  # сколько записей каталога ссылается на файл
+    unique_id = Column(String, nullable=True, index=True)  # file_unique_id в Telegram
+
+class CatalogEntry(Base):
+    """Имя документа в пространстве имен -> содержимое"""
+    __tablename__ = "catalog"
+    __table_args__ = (UniqueConstraint('namespace', 'name'),)
+    
+    id = Column(Integer, primary_key=True)
+    namespace = Column(String, index=True)  # '' - общие документы, иначе id чата
+    name = Column(String)
+    sha256 = Column(String(64), index=True)
+
+class CatalogVersion(Base):
+    """Версия каталога пространства имен: растет с каждым его изменением"""
+    __tablename__ = "catalog_versions"
+    
+    namespace = Column(String, primary_key=True)
+    version = Column(Integer, default=0)
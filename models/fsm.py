@@ -0,0 +1,12 @@
+from sqlalchemy import Column, DateTime, String, Text
+from models.user import Base
+import datetime
+
+class FSMRecord(Base):
+    """Состояние диалога (FSM aiogram) одного пользователя в чате"""
+    __tablename__ = "fsm_states"
+    
+    key = Column(String, primary_key=True)  # ключ aiogram: бот, чат, пользователь
+    state = Column(String, nullable=True)
+    data = Column(Text, default='{}')  # данные состояния в JSON
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 
@@ -15,4 +15,13 @@ class User(Base):
     last_activity = Column(DateTime, default=datetime.datetime.utcnow)
     documents_uploaded = Column(Integer, default=0)
     searches_performed = Column(Integer, default=0)
-    is_active = Column(Boolean, default=True)
\ No newline at end of file
+    is_active = Column(Boolean, default=True)
+
+
+class UserSettings(Base):
+    """Личные настройки поиска пользователя (только отличия от общих)"""
+    __tablename__ = "user_settings"
+    
+    user_id = Column(String, primary_key=True)
+    settings = Column(Text, default='{}')  # JSON {настройка: значение}
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
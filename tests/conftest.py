@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Тесты запускаются из корня репозитория: python -m pytest tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# bot.db, логи и кэши бота создаются относительно рабочей папки (пути к базе
+# фиксируются при импорте) - переходим во временную до импорта модулей бота
+os.chdir(tempfile.mkdtemp(prefix='bot_tests_'))
@@ -0,0 +1,154 @@
+import asyncio
+import aiohttp
+import pytest
+from aiohttp import web
+from bot.utils.api_client import APIClient
+
+class StubAPI:
+    """Локальный сервер вместо внешнего API: считает запросы и соединения клиентов"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = 0
+        self.peers = set()  # (адрес, порт) клиентских соединений
+        self.url = None
+        self._runner = None
+
+    async def handle(self, request):
+        self.requests += 1
+        self.peers.add(request.transport.get_extra_info('peername'))
+        await asyncio.sleep(self.delay)
+        if 'status' in request.query:
+            return web.Response(status=int(request.query['status']))
+        return web.json_response({'q': request.query.get('q'), 'n': self.requests})
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get('/data', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/data"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+def run(scenario, delay=0.0, **client_options):
+    """Выполнение сценария scenario(сервер, клиент) с чистым клиентом"""
+    async def main():
+        async with StubAPI(delay) as server:
+            client = APIClient(**client_options)
+            try:
+                return await scenario(server, client)
+            finally:
+                await client.close()
+    return asyncio.run(main())
+
+def test_repeated_request_served_from_cache():
+    async def scenario(server, client):
+        first = await client.fetch_json(server.url, {'q': 'moscow'})
+        second = await client.fetch_json(server.url, {'q': 'moscow'})
+        other = await client.fetch_json(server.url, {'q': 'kazan'})
+        return server.requests, first, second, other, client.status()
+
+    requests, first, second, other, status = run(scenario)
+    assert requests == 2
+    assert first == second == {'q': 'moscow', 'n': 1}
+    assert other == {'q': 'kazan', 'n': 2}
+    assert status['cache_hits'] == 1
+    assert status['requests'] == 2
+    assert status['cached'] == 2
+
+def test_parameter_order_does_not_split_cache():
+    async def scenario(server, client):
+        await client.fetch_json(server.url, {'q': 'a', 'lang': 'ru'})
+        await client.fetch_json(server.url, {'lang': 'ru', 'q': 'a'})
+        return server.requests
+
+    assert run(scenario) == 1
+
+def test_expired_and_uncached_responses_hit_server():
+    async def scenario(server, client):
+        await client.fetch_json(server.url, {'q': 'fact'}, ttl=0)
+        await client.fetch_json(server.url, {'q': 'fact'}, ttl=0)
+        await client.fetch_json(server.url, {'q': 'short'}, ttl=0.05)
+        await asyncio.sleep(0.1)
+        await client.fetch_json(server.url, {'q': 'short'}, ttl=0.05)
+        return server.requests, client.hits
+
+    assert run(scenario) == (4, 0)
+
+def test_cache_size_is_bounded():
+    async def scenario(server, client):
+        for city in ('a', 'b', 'c'):
+            await client.fetch_json(server.url, {'q': city})
+        # 'a' вытеснен как самый старый
+        await client.fetch_json(server.url, {'q': 'a'})
+        return server.requests, client.status()['cached']
+
+    assert run(scenario, cache_size=2) == (4, 2)
+
+def test_concurrent_requests_are_coalesced():
+    async def scenario(server, client):
+        results = await asyncio.gather(*(client.fetch_json(server.url, {'q': 'moscow'}) for _ in range(50)))
+        return server.requests, results, client.status()
+
+    requests, results, status = run(scenario, delay=0.2)
+    assert requests == 1
+    assert all(result == {'q': 'moscow', 'n': 1} for result in results)
+    assert status['coalesced'] == 49
+
+def test_coalesced_error_reaches_every_waiter_and_is_not_cached():
+    async def scenario(server, client):
+        results = await asyncio.gather(
+            *(client.fetch_json(server.url, {'status': '500'}) for _ in range(10)),
+            return_exceptions=True,
+        )
+        assert server.requests == 1
+        with pytest.raises(aiohttp.ClientResponseError):
+            await client.fetch_json(server.url, {'status': '500'})
+        return server.requests, results
+
+    requests, results = run(scenario, delay=0.1)
+    assert requests == 2
+    assert all(isinstance(result, aiohttp.ClientResponseError) and result.status == 500 for result in results)
+
+def test_cancelled_waiter_does_not_cancel_shared_request():
+    async def scenario(server, client):
+        first = asyncio.ensure_future(client.fetch_json(server.url, {'q': 'x'}))
+        second = asyncio.ensure_future(client.fetch_json(server.url, {'q': 'x'}))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return server.requests, await second
+
+    assert run(scenario, delay=0.2) == (1, {'q': 'x', 'n': 1})
+
+def test_connections_are_reused_from_pool():
+    async def scenario(server, client):
+        session = await client.get_session()
+        for i in range(10):
+            await client.fetch_json(server.url, {'q': str(i)}, ttl=0)
+        return server.requests, len(server.peers), session is await client.get_session()
+
+    assert run(scenario) == (10, 1, True)
+
+def test_pool_limits_connections_per_host():
+    async def scenario(server, client):
+        await asyncio.gather(*(client.fetch_json(server.url, {'q': str(i)}) for i in range(12)))
+        return server.requests, len(server.peers)
+
+    requests, connections = run(scenario, delay=0.1, limit_per_host=3)
+    assert requests == 12
+    assert connections == 3
+
+def test_close_releases_session_and_next_request_opens_new_one():
+    async def scenario(server, client):
+        await client.fetch_json(server.url, {'q': 'a'}, ttl=0)
+        await client.close()
+        assert client.session is None
+        await client.fetch_json(server.url, {'q': 'a'}, ttl=0)
+        return server.requests, len(server.peers)
+
+    assert run(scenario) == (2, 2)
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import pytest
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import delete, select
+from bot.core.config import Config
+from bot.utils.database import async_engine, create_tables, close_db
+from bot.utils.fsm_storage import SQLiteStorage, create_storage
+from models.fsm import FSMRecord
+
+KEY = StorageKey(bot_id=1, chat_id=-100, user_id=42)
+OTHER_KEY = StorageKey(bot_id=1, chat_id=-100, user_id=43)
+
+class Form(StatesGroup):
+    name = State()
+
+def run(scenario):
+    """Сценарий с пустой таблицей состояний (bot.db - во временной папке, см. conftest)"""
+    async def main():
+        await create_tables()
+        async with async_engine.begin() as conn:
+            await conn.execute(delete(FSMRecord.__table__))
+        try:
+            return await scenario()
+        finally:
+            await close_db()
+    return asyncio.run(main())
+
+async def stored_rows():
+    async with async_engine.connect() as conn:
+        rows = await conn.execute(select(FSMRecord.key, FSMRecord.state, FSMRecord.data))
+        return {key: (state, json.loads(data)) for key, state, data in rows}
+
+def test_state_and_data_round_trip():
+    async def scenario():
+        storage = SQLiteStorage()
+        await storage.set_state(KEY, Form.name)
+        await storage.set_data(KEY, {'step': 1, 'text': 'привет'})
+        state, data = await storage.get_state(KEY), await storage.get_data(KEY)
+        # Изменение полученных данных не меняет хранилище
+        data['step'] = 2
+        other = await storage.get_state(OTHER_KEY), await storage.get_data(OTHER_KEY)
+        result = state, await storage.get_data(KEY), other
+        await storage.close()
+        return result
+
+    state, data, other = run(scenario)
+    assert state == Form.name.state
+    assert data == {'step': 1, 'text': 'привет'}
+    assert other == (None, {})
+
+def test_invalid_data_is_rejected_at_set_time():
+    async def scenario():
+        storage = SQLiteStorage()
+        with pytest.raises(DataNotDictLikeError):
+            await storage.set_data(KEY, ['not', 'a', 'dict'])
+        with pytest.raises(TypeError):
+            await storage.set_data(KEY, {'value': object()})
+        await storage.close()
+        return await stored_rows()
+
+    assert run(scenario) == {}
+
+def test_state_survives_restart():
+    async def scenario():
+        storage = SQLiteStorage()
+        await storage.set_state(KEY, 'Form:name')
+        await storage.set_data(KEY, {'answer': 42})
+        await storage.close()
+        await close_db()
+
+        # Новый процесс: пустой кэш, состояние читается из БД
+        restarted = SQLiteStorage()
+        result = await restarted.get_state(KEY), await restarted.get_data(KEY)
+        await restarted.close()
+        return result
+
+    assert run(scenario) == ('Form:name', {'answer': 42})
+
+def test_close_flushes_pending_changes():
+    async def scenario():
+        storage = SQLiteStorage(flush_ms=60_000)
+        await storage.set_state(KEY, 'Form:name')
+        before = await stored_rows()
+        pending = storage.status()['pending']
+        await storage.close()
+        return before, pending, await stored_rows(), storage.status()
+
+    before, pending, after, status = run(scenario)
+    assert before == {}
+    assert pending == 1
+    assert list(after.values()) == [('Form:name', {})]
+    assert status['pending'] == 0
+    assert status['flushes'] == 1
+
+def test_changes_are_written_in_batches():
+    async def scenario():
+        storage = SQLiteStorage(flush_ms=50)
+        keys = [StorageKey(bot_id=1, chat_id=i, user_id=i) for i in range(200)]
+        for key in keys:
+            await storage.set_state(key, 'Form:name')
+        await asyncio.sleep(0.2)
+        status = storage.status()
+        await storage.close()
+        return status, len(await stored_rows())
+
+    status, rows = run(scenario)
+    assert rows == 200
+    assert status['written'] == 200
+    assert status['flushes'] < 200
+
+def test_cleared_state_removes_row():
+    async def scenario():
+        storage = SQLiteStorage()
+        await storage.set_state(KEY, 'Form:name')
+        await storage.set_data(KEY, {'a': 1})
+        await storage.flush()
+        written = await stored_rows()
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        await storage.close()
+        return written, await stored_rows()
+
+    written, after = run(scenario)
+    assert len(written) == 1
+    assert after == {}
+
+def test_expired_cache_entry_is_reread():
+    async def scenario():
+        first = SQLiteStorage(cache_ttl=0.05)
+        second = SQLiteStorage()
+        assert await first.get_state(KEY) is None
+        # Другой процесс меняет состояние в общей БД
+        await second.set_state(KEY, 'Form:name')
+        await second.close()
+        cached = await first.get_state(KEY)
+        await asyncio.sleep(0.1)
+        result = cached, await first.get_state(KEY)
+        await first.close()
+        return result
+
+    assert run(scenario) == (None, 'Form:name')
+
+def test_backend_is_chosen_by_config(monkeypatch):
+    monkeypatch.setattr(Config, 'FSM_STORAGE', 'sqlite')
+    assert isinstance(create_storage(), SQLiteStorage)
+    monkeypatch.setattr(Config, 'FSM_STORAGE', 'memory')
+    assert isinstance(create_storage(), MemoryStorage)
+    assert isinstance(create_storage('sqlite'), SQLiteStorage)
+    with pytest.raises(ValueError):
+        create_storage('unknown')
+
+def test_redis_backend_round_trip(monkeypatch):
+    import fakeredis
+    from aiogram.fsm.storage import redis as redis_storage
+    # Redis-сервер в памяти вместо localhost:6379; общий для двух подключений
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_storage, 'Redis', lambda connection_pool: fakeredis.FakeAsyncRedis(server=server))
+
+    async def scenario():
+        storage = create_storage('redis')
+        assert isinstance(storage, redis_storage.RedisStorage)
+        await storage.set_state(KEY, Form.name)
+        await storage.set_data(KEY, {'step': 1, 'text': 'привет'})
+        await storage.close()
+
+        # Новое подключение видит сохраненное состояние
+        reopened = create_storage('redis')
+        saved = await reopened.get_state(KEY), await reopened.get_data(KEY), await reopened.get_state(OTHER_KEY)
+        keys = sorted(key.decode() for key in await reopened.redis.keys('*'))
+
+        await reopened.set_state(KEY, None)
+        await reopened.set_data(KEY, {})
+        cleared = await reopened.get_state(KEY), await reopened.get_data(KEY), await reopened.redis.keys('*')
+        await reopened.close()
+        return saved, keys, cleared
+
+    saved, keys, cleared = asyncio.run(scenario())
+    assert saved == (Form.name.state, {'step': 1, 'text': 'привет'}, None)
+    # Ключи с id бота и destiny, как настроено в create_storage
+    assert keys == ['fsm:1:-100:42:default:data', 'fsm:1:-100:42:default:state']
+    assert cleared == (None, {}, [])
@@ -0,0 +1,15 @@
+from bot.utils.fuzzy_index import SymSpellIndex, edit_distance
+from bot.utils.search_index import InvertedIndex
+
+def test_lookup_finds_one_edit_typo():
+    fuzzy = SymSpellIndex(max_distance=2, prefix_length=7)
+    fuzzy.add_terms(['ключевых', 'ключи', 'новых'])
+    assert edit_distance('клюевых', 'ключевых', 2) == 1
+    assert fuzzy.lookup('клюевых') == [('ключевых', 1)]
+    assert fuzzy.lookup('клюевых', max_distance=0) == []
+
+def test_expand_term_uses_index_dictionary(tmp_path):
+    index = InvertedIndex(tmp_path)
+    index.add_document('a.txt', 'Список ключевых показателей')
+    assert index.expand_term('клюевых') == ['ключевых']
+    assert set(index.find_terms(index.fuzzy_terms('клюевых'))) == {'a.txt'}
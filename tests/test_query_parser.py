@@ -0,0 +1,61 @@
+import pytest
+from bot.utils.postings import PostingList, difference, intersect, near, phrase_starts
+from bot.utils.query_parser import QuerySyntaxError, parse_query
+from bot.utils.search_index import InvertedIndex, tokenize
+
+def parse(query):
+    return parse_query(query, tokenize)
+
+@pytest.mark.parametrize('query, message', [
+    ('', 'пустой запрос'),
+    ('(отчет', 'не хватает закрывающей скобки'),
+    ('отчет )', 'лишняя закрывающая скобка'),
+    ('and', 'неожиданный оператор «and»'),
+    ('отчет and', 'запрос обрывается после оператора'),
+    ('отчет NEAR', 'запрос обрывается после оператора'),
+    ('отчет NEAR (план or смета)', 'NEAR соединяет только слова и фразы'),
+    ('""', 'пустая фраза в кавычках'),
+])
+def test_malformed_query(query, message):
+    with pytest.raises(QuerySyntaxError, match=message):
+        parse(query)
+
+def test_not_only_query(tmp_path):
+    """Запрос из одних NOT: все документы, кроме исключенных"""
+    assert repr(parse('not черновик')) == "Not(Term('черновик'))"
+    assert repr(parse('NOT ext:docx')) == "Not(Field('ext', 'docx'))"
+
+    index = InvertedIndex(tmp_path)
+    index.add_document('отчет.pdf', 'итоговый отчет')
+    index.add_document('черновик.docx', 'черновик отчета')
+    index.add_document('план.docx', 'план работ')
+
+    assert set(index.find_boolean(parse('not черновик'))) == {'отчет.pdf', 'план.docx'}
+    assert set(index.find_boolean(parse('NOT ext:docx'))) == {'отчет.pdf'}
+    assert set(index.find_boolean(parse('not черновик not план'))) == {'отчет.pdf'}
+
+def test_phrase_starts_with_lead_not_first():
+    """Ведущим берется самый короткий список, даже если он не первый"""
+    position_lists = [[1, 5, 9], [2, 10], [3, 7, 11]]
+    assert phrase_starts(position_lists) == [1, 9]
+    assert phrase_starts([[0, 4, 8], [1, 5, 9], [6]]) == [4]
+    assert phrase_starts([[1, 5], [], [3]]) == []
+
+def test_near_both_orders_and_exact_distance():
+    # Между словами 2 слова: расстояние 2 подходит, 1 - уже нет
+    assert near([(0, 0)], [(3, 3)], 2) == [(0, 3)]
+    assert near([(0, 0)], [(3, 3)], 1) == []
+    # Правое условие стоит раньше левого
+    assert near([(3, 3)], [(0, 0)], 2) == [(0, 3)]
+    assert near([(3, 3)], [(0, 0)], 1) == []
+    # Фраза справа: расстояние считается до ее первого слова
+    assert near([(10, 10)], [(4, 6)], 3) == [(4, 10)]
+
+def test_difference_and_intersect_with_empty_lists():
+    empty = PostingList([])
+    ids = PostingList([1, 3, 5])
+    assert list(difference(ids, empty)) == [1, 3, 5]
+    assert list(difference(empty, ids)) == []
+    assert list(intersect(ids, empty)) == []
+    assert list(intersect(empty, ids)) == []
+    assert list(difference(ids, PostingList([1, 3, 5]))) == []
@@ -0,0 +1,31 @@
+import math
+import pytest
+from bot.utils.ranking import top_k
+from bot.utils.search_index import InvertedIndex
+
+def test_bm25_scores_hand_computed(tmp_path):
+    """k1 = 1.2, b = 0.75; документы длиной 3, 3 и 1 слово"""
+    index = InvertedIndex(tmp_path)
+    index.add_document('a.txt', 'кот кот пес')
+    index.add_document('b.txt', 'кот пес пес')
+    index.add_document('c.txt', 'рыба')
+
+    # "кот" в 2 документах из 3; средняя длина 7/3
+    term_idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+    norm = 1.2 * (1 - 0.75 + 0.75 * 3 / (7 / 3))
+    scores = index.score(['кот'])
+    assert scores == {
+        'a.txt': pytest.approx(term_idf * 2 * 2.2 / (2 + norm)),
+        'b.txt': pytest.approx(term_idf * 1 * 2.2 / (1 + norm)),
+    }
+    assert [name for name, _ in top_k(scores, 2)] == ['a.txt', 'b.txt']
+
+    # Редкое слово весит больше частого
+    scores = index.score(['кот', 'рыба'])
+    assert [name for name, _ in top_k(scores, 1)] == ['c.txt']
+
+def test_top_k_keeps_order_of_ties():
+    scores = {'b.txt': 1.0, 'a.txt': 2.0, 'c.txt': 1.0, 'd.txt': 1.0}
+    assert top_k(scores, 3) == [('a.txt', 2.0), ('b.txt', 1.0), ('c.txt', 1.0)]
+    assert top_k(scores, 10) == [('a.txt', 2.0), ('b.txt', 1.0), ('c.txt', 1.0), ('d.txt', 1.0)]
+    assert top_k({}, 3) == []
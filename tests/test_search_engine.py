@@ -0,0 +1,64 @@
+import pytest
+from bot.utils.blob_store import blob_store
+from bot.utils.database import engine
+from bot.utils.search_engine import SearchEngine
+from models.user import Base
+
+NAMESPACE = 'test-search'
+DOCUMENTS = {
+    'отчет.txt': 'Итоговый отчет: список ключевых показателей за год.',
+    'план.txt': 'План работ на следующий квартал.',
+    'черновик.txt': 'Черновик отчета, ключевые показатели не сверены.',
+}
+
+@pytest.fixture(scope='module')
+def engines(tmp_path_factory):
+    """Один и тот же каталог документов в обоих бэкендах"""
+    Base.metadata.create_all(engine)
+    folder = tmp_path_factory.mktemp('documents')
+    for name, content in DOCUMENTS.items():
+        (folder / name).write_text(content, encoding='utf-8')
+    blob_store.clear(NAMESPACE)
+    blob_store.import_folder(NAMESPACE, str(folder))
+
+    engines = {}
+    for backend in ('index', 'fts5'):
+        search_engine = SearchEngine(backend, NAMESPACE, str(tmp_path_factory.mktemp(backend)))
+        search_engine.sync(blob_store.paths(NAMESPACE))
+        engines[backend] = search_engine
+    yield engines
+    blob_store.clear(NAMESPACE)
+
+def found(search_engine, query, search_type):
+    results, total = search_engine.search(query, blob_store.names(NAMESPACE), search_type)
+    return sorted(result['filename'] for result in results), total
+
+@pytest.mark.parametrize('query, expected', [
+    ('name:отчет', ['отчет.txt']),
+    ('NOT name:черновик', ['отчет.txt', 'план.txt']),
+    ('ext:txt NOT name:план', ['отчет.txt', 'черновик.txt']),
+    ('ext:pdf', []),
+    ('показателей NOT name:черновик', ['отчет.txt']),
+])
+def test_field_queries_on_both_backends(engines, query, expected):
+    """Запрос только из фильтров отбирает документы по имени в обоих бэкендах"""
+    assert found(engines['index'], query, 'boolean') == (expected, len(expected))
+    assert found(engines['fts5'], query, 'boolean') == (expected, len(expected))
+
+def test_field_query_shows_document_start(engines):
+    names = blob_store.names(NAMESPACE)
+    for search_engine in engines.values():
+        results, _ = search_engine.search('name:план', names, 'boolean')
+        assert [result['matches'] for result in results] == [[DOCUMENTS['план.txt'] + '...']]
+
+@pytest.mark.parametrize('query, expected', [
+    ('ключев', ['отчет.txt', 'черновик.txt']),
+    ('КЛЮЧЕВЫХ', ['отчет.txt']),
+    ('квартал', ['план.txt']),
+    ('ый', ['отчет.txt']),
+    ('показатели не сверены', ['черновик.txt']),
+])
+def test_exact_search_is_substring_on_both_backends(engines, query, expected):
+    """Обычный поиск находит часть слова и в FTS5, где MATCH ищет целые слова"""
+    assert found(engines['index'], query, 'exact') == (expected, len(expected))
+    assert found(engines['fts5'], query, 'exact') == (expected, len(expected))
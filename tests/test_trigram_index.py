@@ -0,0 +1,43 @@
+import pytest
+from bot.utils.trigram_index import TrigramIndex, find_in_blocks, find_spans, required_literals
+
+# Блоки по 10 символов с перекрытием 4: блок n начинается с символа 6 * n
+TEXT = 'абвгдежзиклмнопрстуф'
+
+@pytest.fixture
+def index(tmp_path):
+    index = TrigramIndex(tmp_path, block_size=10, block_overlap=4)
+    index.add_document('a.txt', TEXT)
+    return index
+
+def test_alternation_gives_no_literals():
+    """Ни одна из ветвей альтернативы не обязательна"""
+    literals = required_literals('отчет|сводка')
+    assert not any(word in literal for literal in literals for word in ('отчет', 'сводка'))
+    assert required_literals('(?:один|два)три') == ['три']
+
+def test_optional_repeats_are_skipped():
+    assert required_literals('abc(def)?ghi') == ['abc', 'ghi']
+    assert required_literals('abc(def){0,3}ghi') == ['abc', 'ghi']
+    assert required_literals('ab(cde)*fgh') == ['fgh']
+
+def test_required_repeat_keeps_literal():
+    assert required_literals('(abc)+') == ['abc']
+    assert required_literals('Ключ\\w+ых') == ['ключ']
+
+def test_query_longer_than_overlap(index):
+    """Вхождение длиннее перекрытия может не поместиться ни в один блок"""
+    assert index.candidate_blocks('абвгд') is None
+    assert index.candidate_blocks('аб') is None
+
+def test_match_across_block_boundary(index):
+    # 'ежзи' (5..9) переходит через начало блока 1, но целиком лежит в блоке 0
+    assert index.candidate_blocks('ежзи') == {'a.txt': [0]}
+    assert find_in_blocks(TEXT, 'ежзи', [0], 10, 6) == [(5, 9)]
+    # 'иклм' (8..12) выходит за конец блока 0 и находится только в блоке 1
+    assert index.candidate_blocks('иклм') == {'a.txt': [1]}
+    assert find_in_blocks(TEXT, 'иклм', [1], 10, 6) == [(8, 12)]
+    # 'жзик' (6..10) есть в обоих блоках, но засчитывается один раз
+    blocks = index.candidate_blocks('ЖЗИК')['a.txt']
+    assert blocks == [0, 1]
+    assert find_in_blocks(TEXT, 'ЖЗИК', blocks, 10, 6) == find_spans(TEXT, 'жзик') == [(6, 10)]